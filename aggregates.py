@@ -0,0 +1,95 @@
+'''
+Running booking counts and revenue totals.
+
+BookingAggregates keeps the number of bookings and their revenue overall,
+per day, per month, per family and per dog or family name. The BookingStore
+updates it whenever a booking is loaded, created, updated or deleted, so the
+view screens can show their totals without adding up every booking again.
+
+Amounts are kept in whole pence (see booking.py), so totals over years of
+bookings add up exactly rather than drifting like floating point pounds.
+'''
+
+
+class BookingAggregates:
+    '''
+    Booking counts and revenue in pence, overall and grouped by day, month,
+    family and name. Every total is a [count, pence] pair. Days are keyed by
+    date and months by (year, month).
+    '''
+
+    def __init__(self):
+        self.overall = [0, 0]
+        self.by_day = {}
+        self.by_month = {}
+        self.by_family = {}
+        self.by_name = {}
+
+    def add(self, booking):
+        '''
+        Adds a booking to the totals.
+        '''
+        self._apply(booking, 1)
+
+    def remove(self, booking):
+        '''
+        Takes a booking away from the totals.
+        '''
+        self._apply(booking, -1)
+
+    def for_day(self, date):
+        '''
+        Returns the (count, pence) totals for a booking date.
+        '''
+        return tuple(self.by_day.get(date, (0, 0)))
+
+    def for_month(self, year, month):
+        '''
+        Returns the (count, pence) totals for a month.
+        '''
+        return tuple(self.by_month.get((year, month), (0, 0)))
+
+    def for_family(self, family_name):
+        '''
+        Returns the (count, pence) totals for a family name, ignoring case.
+        '''
+        return tuple(self.by_family.get(family_name.lower(), (0, 0)))
+
+    def for_name(self, name):
+        '''
+        Returns the (count, pence) totals for a dog's name or family name,
+        ignoring case.
+        '''
+        return tuple(self.by_name.get(name.lower(), (0, 0)))
+
+    def total(self):
+        '''
+        Returns the (count, pence) totals for every booking.
+        '''
+        return tuple(self.overall)
+
+    def _apply(self, booking, sign):
+        pence = booking.pence * sign
+        date = booking.date
+        family_name = booking.family_name.lower()
+        names = {booking.dogs_name.lower(), family_name} - {''}
+
+        self._add_to(self.overall, sign, pence)
+        self._add_to_group(self.by_day, date, sign, pence)
+        self._add_to_group(self.by_month, (date.year, date.month), sign,
+                           pence)
+        if family_name:
+            self._add_to_group(self.by_family, family_name, sign, pence)
+        for name in names:
+            self._add_to_group(self.by_name, name, sign, pence)
+
+    @staticmethod
+    def _add_to(totals, count, pence):
+        totals[0] += count
+        totals[1] += pence
+
+    def _add_to_group(self, group, key, count, pence):
+        totals = group.setdefault(key, [0, 0])
+        self._add_to(totals, count, pence)
+        if totals[0] <= 0:
+            del group[key]
@@ -0,0 +1,698 @@
+'''
+Storage backends for the bookings data.
+
+Every backend stores booking rows (lists of cell values whose first cell is
+the booking number) and offers the same small set of operations, which the
+BookingStore cache is built on:
+
+load()                  - returns (header, rows) for every booking
+load_page(offset, limit) - returns up to limit rows, starting at offset
+count()                 - returns the number of bookings
+append(row)             - adds a booking
+append_many(rows)       - adds several bookings in one request
+update_rows(updates, expected)
+                        - replaces the rows of existing bookings
+delete(booking_no, expected)
+                        - marks a booking as deleted
+compact()               - removes the rows of deleted bookings
+version()               - a value that changes when the data changes
+changes_since(revision) - returns the rows stamped after a revision, the
+                          booking numbers of every booking, and the
+                          highest revision, for a delta sync
+reset_connections()     - drops open connections, such as after a fork()
+
+Deleting a booking marks its row in the Status column and stamps a new
+revision, in one small write, rather than removing the row. Rows never move
+while sessions are running, so the row positions every session remembers
+stay valid, and other sessions see the delete with their next delta sync.
+load() returns the deleted rows too, for the BookingStore to set aside, but
+load_page() and count() leave them out. compact() removes them, and should
+be run when no other sessions are open, such as overnight.
+
+Updates and deletes are compare-and-swap writes. The optional expected
+argument maps booking numbers to the revisions the change was made from,
+and a booking whose revision in the backend is not one of them was changed
+by another session after it was read, so it is left alone and a
+ConflictError is raised once the other bookings have been written. A
+booking with an expected revision that has been deleted, or compacted
+away, is a conflict too, listed in the error's deleted bookings. Without
+an expected revision, updates skip deleted bookings and delete() returns
+False, as before. The
+SQLite backend checks the revision in the UPDATE itself. The worksheet has
+no conditional writes, so SheetsBackend reads the booking number, revision
+and status of the rows it is about to write, in one request, and checks
+them first. This also catches a row that no longer holds the booking, such
+as after a compaction, which is found again. The check and the write hold a
+lock for each booking written, striped over ROW_LOCKS, so writes to
+different bookings never wait for each other. The locks are held against
+the other threads in the process and, through a lock file, the other
+processes on the same computer, such as every web terminal's session.
+Sessions on another computer sharing the worksheet are not locked out: two
+of them writing the same booking at the same moment can both pass the
+check, and the later write wins. Only SQLite, which checks the revision in
+the UPDATE itself, rules that out.
+
+SheetsBackend keeps the bookings in the Google worksheet, as the app always
+has. SQLiteBackend keeps them in a local SQLite database, which lets the
+kennel run offline and without Google credentials. migrate() copies the
+bookings from one backend to the other.
+'''
+import os
+import zlib
+import sqlite3
+import threading
+import contextlib
+
+from booking import (
+    parse_revision, next_revision, is_deleted, revision_expected,
+    ConflictError, REVISION_CELL, STATUS_CELL, DELETED)
+from booking_store import HEADERS
+from sheets_governor import SheetsGovernor
+
+try:
+    import fcntl
+except ImportError:
+    # fcntl is not available on Windows, where bookings are only locked
+    # against sessions within the same process.
+    fcntl = None
+
+# The local database file used by the SQLite backend
+SQLITE_PATH = 'kennel_mate.db'
+
+# The file whose bytes lock bookings against the other processes on this
+# computer, unless the KENNEL_ROW_LOCK_FILE environment variable names another
+ROW_LOCK_FILE = '.kennel_mate_rows.lock'
+
+# The Drive API address of a file's metadata, for the spreadsheet's version
+DRIVE_FILES_URL = 'https://www.googleapis.com/drive/v3/files/{}'
+
+
+class RowLocks:
+    '''
+    Locks bookings while they are checked and written, so two writes of the
+    same booking cannot both pass the revision check. The bookings are
+    spread over a fixed number of locks, so there is no single lock every
+    write waits for.
+
+    Each lock is a thread lock, for the sessions within a process, and a
+    lock on one byte of the lock file, for the other sessions' processes
+    on this computer, such as every web terminal's. The file is opened
+    once per process and kept open, as closing any copy of it would drop
+    every lock the process holds on it.
+
+    Args:
+    stripes (int): The number of locks.
+    path (str): The lock file, defaults to KENNEL_ROW_LOCK_FILE, read when
+    the file is first opened.
+    '''
+
+    def __init__(self, stripes=64, path=None):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self.path = path
+        self._file = None
+        self._opening = threading.Lock()
+
+    @contextlib.contextmanager
+    def holding(self, booking_nos):
+        '''
+        Holds the locks of some bookings inside the with statement. The locks
+        are always taken in the same order, so writes cannot deadlock.
+
+        Args:
+        booking_nos (iterable): The booking numbers, such as ["B1001"].
+        '''
+        # crc32 rather than hash(), which differs between processes
+        stripes = sorted({zlib.crc32(booking_no.encode()) % len(self._locks)
+                          for booking_no in booking_nos})
+        held = []
+        try:
+            for stripe in stripes:
+                self._locks[stripe].acquire()
+                held.append(stripe)
+                self._lock_byte(stripe, fcntl.LOCK_EX if fcntl else None)
+            yield
+        finally:
+            for stripe in reversed(held):
+                self._lock_byte(stripe, fcntl.LOCK_UN if fcntl else None)
+                self._locks[stripe].release()
+
+    def _lock_byte(self, stripe, operation):
+        if fcntl is None:
+            return
+        with self._opening:
+            if self._file is None:
+                self._file = open(self.path or os.environ.get(
+                    'KENNEL_ROW_LOCK_FILE', ROW_LOCK_FILE), 'a+b')
+        fcntl.lockf(self._file, operation, 1, stripe)
+
+
+# The row locks shared by every SheetsBackend in the process, and through
+# the lock file with every other process on this computer
+ROW_LOCKS = RowLocks()
+
+
+def column_letter(col):
+    '''
+    Converts a 1-based column number to its worksheet letter, such as 5 to
+    "E" or 27 to "AA".
+
+    Args:
+    col (int): The 1-based column number.
+
+    Returns:
+    str: The column letter(s).
+    '''
+    letters = ''
+    while col:
+        col, remainder = divmod(col - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+class SheetsBackend:
+    '''
+    Stores bookings in a gspread worksheet with a header in the first row.
+
+    The backend remembers which worksheet row holds each booking it has
+    loaded or written, so updates and deletes go straight to the right row.
+    Bookings it has not seen are located with a find() on column A.
+
+    Every request goes through a SheetsGovernor, which keeps within the
+    Sheets quota and retries requests that fail for a transient reason.
+
+    Args:
+    worksheet: The gspread worksheet holding the bookings.
+    governor (SheetsGovernor): The request governor, by default a new one.
+    '''
+
+    def __init__(self, worksheet, governor=None):
+        self.worksheet = worksheet
+        self.governor = governor if governor is not None else \
+            SheetsGovernor()
+        self._row_of = {}
+        self._next_row = 2
+        # The worksheet rows of the bookings not deleted, for paging, and
+        # the version they were read at
+        self._live = None
+        self._live_version = None
+
+    def load(self):
+        all_values = self._read('get_all_values')
+        header = all_values[0] if all_values else list(HEADERS)
+        if len(header) < len(HEADERS):
+            # Worksheets created before a column was added get its heading
+            header = header + HEADERS[len(header):]
+            self._write('update', 'A1', [header])
+        rows = all_values[1:]
+        self._row_of = {row[0]: i + 2 for i, row in enumerate(rows) if row}
+        self._next_row = len(rows) + 2
+        return header, rows
+
+    def load_page(self, offset, limit):
+        # The offset counts bookings, as count() does, not worksheet rows,
+        # so the rows of deleted bookings waiting to be compacted are found
+        # first and skipped
+        live = self._live_rows()[offset:offset + limit]
+        if not live:
+            return []
+        rows = self._read('get_values', f'A{live[0]}:'
+                          f'{column_letter(len(HEADERS))}{live[-1]}')
+        return [row for row in rows
+                if row and row[0] and not is_deleted(row)]
+
+    def count(self):
+        return len(self._live_rows())
+
+    def _live_rows(self):
+        '''
+        Returns the worksheet row numbers of the bookings that have not been
+        deleted. They are read from the booking number and status columns,
+        in one request, and kept until the spreadsheet's version changes or
+        this backend writes, so paging through unchanged bookings only
+        reads each page's rows and the version.
+        '''
+        version = self.version()
+        if self._live is not None and version == self._live_version:
+            return self._live
+        status_column = column_letter(STATUS_CELL + 1)
+        numbers, statuses = self._read(
+            'batch_get', ('A2:A', f'{status_column}2:{status_column}'))
+        live = []
+        for i, number in enumerate(numbers):
+            status = statuses[i] if i < len(statuses) else []
+            if number and number[0] and not (status and status[0] == DELETED):
+                live.append(i + 2)
+        self._live, self._live_version = live, version
+        return live
+
+    def append(self, row):
+        self._write('append_row', row, idempotent=False)
+        self._row_of[row[0]] = self._next_row
+        self._next_row += 1
+
+    def append_many(self, rows):
+        self._write('append_rows', rows, idempotent=False)
+        for row in rows:
+            self._row_of[row[0]] = self._next_row
+            self._next_row += 1
+
+    def update_rows(self, updates, expected=None):
+        updates = dict(updates)
+        data = []
+        conflicts = []
+        deleted_elsewhere = []
+        with ROW_LOCKS.holding(updates):
+            current = self._current_rows(updates)
+            for booking_no, row in updates.items():
+                if booking_no not in current or current[booking_no][2]:
+                    if expected and booking_no in expected:
+                        deleted_elsewhere.append(booking_no)
+                    continue
+                sheet_row, revision, _ = current[booking_no]
+                if not revision_expected(expected, booking_no, revision):
+                    conflicts.append(booking_no)
+                    continue
+                data.append({'range': self._row_range(sheet_row, len(row)),
+                             'values': [row]})
+            if len(data) == 1:
+                self._write('update', data[0]['range'], data[0]['values'])
+            elif data:
+                self._write('batch_update', data)
+        if conflicts or deleted_elsewhere:
+            raise ConflictError(conflicts + deleted_elsewhere, len(data),
+                                deleted_elsewhere)
+        return len(data)
+
+    def delete(self, booking_no, expected=None):
+        with ROW_LOCKS.holding([booking_no]):
+            current = self._current_rows([booking_no])
+            if booking_no not in current or current[booking_no][2]:
+                if expected and booking_no in expected:
+                    raise ConflictError([booking_no], deleted=[booking_no])
+                return False
+            sheet_row, revision, _ = current[booking_no]
+            if not revision_expected(expected, booking_no, revision):
+                raise ConflictError([booking_no])
+            # The revision and status cells are next to each other, so are
+            # written with one update
+            first = column_letter(REVISION_CELL + 1)
+            last = column_letter(STATUS_CELL + 1)
+            self._write('update', f'{first}{sheet_row}:{last}{sheet_row}',
+                        [[str(next_revision()), DELETED]])
+        return True
+
+    def compact(self):
+        '''
+        Removes the rows of deleted bookings from the worksheet, in one
+        request. Rows below them move up, so this should only be run when
+        no other sessions are open.
+
+        Returns:
+        int: The number of rows removed.
+        '''
+        statuses = self._read('col_values', STATUS_CELL + 1)
+        deleted = [i + 1 for i, status in enumerate(statuses)
+                   if status == DELETED]
+        if not deleted:
+            return 0
+        # Runs of deleted rows are removed together, from the bottom up so
+        # the rows still to be removed do not move
+        runs = []
+        for sheet_row in deleted:
+            if runs and runs[-1][1] == sheet_row - 1:
+                runs[-1][1] = sheet_row
+            else:
+                runs.append([sheet_row, sheet_row])
+        requests = [{'deleteDimension': {'range': {
+            'sheetId': self.worksheet.id, 'dimension': 'ROWS',
+            'startIndex': first - 1, 'endIndex': last}}}
+            for first, last in reversed(runs)]
+        self.governor.call(self.worksheet.spreadsheet.batch_update,
+                           {'requests': requests}, idempotent=False)
+        # Rows are found again with find() as they are needed
+        self._row_of = {}
+        self._live = None
+        self._next_row -= len(deleted)
+        return len(deleted)
+
+    def replace_all(self, header, rows):
+        '''
+        Replaces the whole worksheet with the given header and rows.
+        '''
+        self._write('clear')
+        self._write('update', 'A1', [list(header)] + [list(r) for r in rows])
+        self._row_of = {row[0]: i + 2 for i, row in enumerate(rows) if row}
+        self._next_row = len(rows) + 2
+
+    def version(self):
+        # The spreadsheet's lastUpdateTime is only read when it is opened,
+        # so the file's version is fetched from Drive on every check. Drive
+        # raises it with every change to the file, including other sessions'.
+        spreadsheet = self.worksheet.spreadsheet
+
+        def fetch_version():
+            response = spreadsheet.client.request(
+                'get', DRIVE_FILES_URL.format(spreadsheet.id),
+                params={'fields': 'version', 'supportsAllDrives': True})
+            return response.json()['version']
+        return self.governor.call(fetch_version, key='version')
+
+    def changes_since(self, revision):
+        # Only the booking number and revision columns are read in full,
+        # then only the rows stamped after the revision
+        revision_column = column_letter(HEADERS.index('Revision') + 1)
+        numbers, revisions = self._read(
+            'batch_get', ('A2:A', f'{revision_column}2:{revision_column}'))
+        numbers = [row[0] if row else '' for row in numbers]
+        stamps = [parse_revision(row[0]) if row else 0 for row in revisions]
+        self._row_of = {number: i + 2 for i, number in enumerate(numbers)
+                        if number}
+        self._next_row = len(numbers) + 2
+
+        # Consecutive changed rows are fetched as one range
+        ranges = []
+        last_column = column_letter(len(HEADERS))
+        first = last = None
+        for i, stamp in enumerate(stamps):
+            if stamp <= revision or not numbers[i]:
+                continue
+            sheet_row = i + 2
+            if last is not None and sheet_row == last + 1:
+                last = sheet_row
+                continue
+            if first is not None:
+                ranges.append(f'A{first}:{last_column}{last}')
+            first = last = sheet_row
+        if first is not None:
+            ranges.append(f'A{first}:{last_column}{last}')
+        rows = []
+        if ranges:
+            for value_range in self._read('batch_get', tuple(ranges)):
+                rows.extend(value_range)
+        return rows, set(self._row_of), max(stamps, default=0)
+
+    def reset_connections(self):
+        # Closing the session's connection pools keeps the authorized
+        # credentials and access token; new connections open on demand.
+        session = getattr(self.worksheet.client, 'session', None)
+        if session is not None:
+            session.close()
+
+    def _sheet_row(self, booking_no):
+        sheet_row = self._row_of.get(booking_no)
+        if sheet_row is None:
+            cell = self._read('find', booking_no, in_column=1)
+            if cell is None:
+                return None
+            sheet_row = self._row_of[booking_no] = cell.row
+        return sheet_row
+
+    def _current_rows(self, booking_nos):
+        '''
+        Reads the booking number, revision and status cells of the rows
+        holding some bookings, in one request, so a write can check each row
+        still holds the booking it was loaded with and which revision it
+        has. If a row holds another booking, such as after the worksheet
+        has been compacted, the rows are found again from column A.
+
+        Args:
+        booking_nos (iterable): The booking numbers, such as ["B1001"].
+
+        Returns:
+        dict: Maps each booking number found to its worksheet row, its
+        revision and whether it has been deleted.
+        '''
+        revision_column = column_letter(REVISION_CELL + 1)
+        status_column = column_letter(STATUS_CELL + 1)
+        for attempt in range(2):
+            rows = {}
+            for booking_no in booking_nos:
+                sheet_row = self._sheet_row(booking_no)
+                if sheet_row is not None:
+                    rows[booking_no] = sheet_row
+            ranges = []
+            for sheet_row in rows.values():
+                ranges += [f'A{sheet_row}',
+                           f'{revision_column}{sheet_row}:'
+                           f'{status_column}{sheet_row}']
+            values = self._read('batch_get', tuple(ranges)) if ranges else []
+            current = {}
+            moved = False
+            for i, (booking_no, sheet_row) in enumerate(rows.items()):
+                number, stamp = values[2 * i], values[2 * i + 1]
+                if not number or not number[0] or \
+                        number[0][0] != booking_no:
+                    moved = True
+                    continue
+                cells = stamp[0] if stamp else []
+                current[booking_no] = (
+                    sheet_row, parse_revision(cells[0] if cells else ''),
+                    len(cells) > 1 and cells[1] == DELETED)
+            if not moved or attempt:
+                return current
+            numbers = self._read('col_values', 1)
+            self._row_of = {number: i + 1 for i, number in enumerate(numbers)
+                            if number and i}
+            self._next_row = len(numbers) + 1
+        return current
+
+    def _read(self, method, *args, **kwargs):
+        '''
+        Makes a read request through the governor. Identical reads made at
+        the same time share one request.
+        '''
+        key = (method, args, tuple(sorted(kwargs.items())))
+        return self.governor.call(getattr(self.worksheet, method), *args,
+                                  key=key, **kwargs)
+
+    def _write(self, method, *args, idempotent=True, **kwargs):
+        '''
+        Makes a write request through the governor. The live rows are read
+        again after any write, rather than waiting for the version to change.
+        '''
+        self._live = None
+        return self.governor.call(getattr(self.worksheet, method), *args,
+                                  idempotent=idempotent, **kwargs)
+
+    @staticmethod
+    def _row_range(sheet_row, width):
+        return f'A{sheet_row}:{column_letter(width)}{sheet_row}'
+
+
+class SQLiteBackend:
+    '''
+    Stores bookings in a local SQLite database, indexed on booking number,
+    date, dog's name and family name.
+
+    Args:
+    path (str): The database file, or ":memory:" for a throwaway database.
+    '''
+
+    COLUMNS = ['booking_no', 'booking_date', 'dogs_name', 'family_name',
+               'amount', 'nights', 'revision', 'status']
+
+    # The columns update_rows() writes, which leave the status alone so an
+    # update never brings a deleted booking back
+    UPDATED_COLUMNS = COLUMNS[1:STATUS_CELL]
+
+    # Columns added since the table was first created, with their
+    # definitions, which older databases are migrated to have
+    ADDED_COLUMNS = {
+        'nights': "TEXT NOT NULL DEFAULT '1'",
+        'revision': "TEXT NOT NULL DEFAULT ''",
+        'status': "TEXT NOT NULL DEFAULT ''",
+    }
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self._create_schema()
+
+    def _create_schema(self):
+        with self.connection:
+            self.connection.executescript('''
+                CREATE TABLE IF NOT EXISTS bookings (
+                    position INTEGER PRIMARY KEY AUTOINCREMENT,
+                    booking_no TEXT NOT NULL UNIQUE,
+                    booking_date TEXT NOT NULL DEFAULT '',
+                    dogs_name TEXT NOT NULL DEFAULT '',
+                    family_name TEXT NOT NULL DEFAULT '',
+                    amount TEXT NOT NULL DEFAULT '',
+                    nights TEXT NOT NULL DEFAULT '1',
+                    revision TEXT NOT NULL DEFAULT '',
+                    status TEXT NOT NULL DEFAULT ''
+                );
+                CREATE INDEX IF NOT EXISTS bookings_date
+                    ON bookings (booking_date);
+                CREATE INDEX IF NOT EXISTS bookings_dogs_name
+                    ON bookings (dogs_name COLLATE NOCASE);
+                CREATE INDEX IF NOT EXISTS bookings_family_name
+                    ON bookings (family_name COLLATE NOCASE);
+            ''')
+            # Databases created before a column was added do not have it
+            existing = [column[1] for column in self.connection.execute(
+                'PRAGMA table_info(bookings)')]
+            for column, definition in self.ADDED_COLUMNS.items():
+                if column not in existing:
+                    self.connection.execute(
+                        f'ALTER TABLE bookings ADD COLUMN {column} '
+                        f'{definition}')
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS bookings_revision '
+                'ON bookings (CAST(revision AS INTEGER))')
+
+    def load(self):
+        cursor = self.connection.execute(
+            f'SELECT {", ".join(self.COLUMNS)} FROM bookings '
+            'ORDER BY position')
+        return list(HEADERS), [list(row) for row in cursor]
+
+    def load_page(self, offset, limit):
+        cursor = self.connection.execute(
+            f'SELECT {", ".join(self.COLUMNS)} FROM bookings '
+            'WHERE status != ? ORDER BY position LIMIT ? OFFSET ?',
+            (DELETED, limit, offset))
+        return [list(row) for row in cursor]
+
+    def count(self):
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM bookings WHERE status != ?',
+            (DELETED,)).fetchone()[0]
+
+    def append(self, row):
+        with self.connection:
+            self.connection.execute(self._insert_sql(), self._values(row))
+
+    def append_many(self, rows):
+        with self.connection:
+            self.connection.executemany(
+                self._insert_sql(), [self._values(row) for row in rows])
+
+    def update_rows(self, updates, expected=None):
+        assignments = ', '.join(f'{column} = ?'
+                                for column in self.UPDATED_COLUMNS)
+        written = 0
+        conflicts = []
+        deleted_elsewhere = []
+        with self.connection:
+            for booking_no, row in updates:
+                check, revisions = self._revision_check(expected, booking_no)
+                cursor = self.connection.execute(
+                    f'UPDATE bookings SET {assignments} '
+                    f'WHERE booking_no = ? AND status != ?{check}',
+                    self._values(row)[1:len(self.UPDATED_COLUMNS) + 1] +
+                    [booking_no, DELETED] + revisions)
+                if cursor.rowcount:
+                    written += 1
+                elif check and self._live(booking_no):
+                    conflicts.append(booking_no)
+                elif check:
+                    deleted_elsewhere.append(booking_no)
+        if conflicts or deleted_elsewhere:
+            raise ConflictError(conflicts + deleted_elsewhere, written,
+                                deleted_elsewhere)
+        return written
+
+    def delete(self, booking_no, expected=None):
+        check, revisions = self._revision_check(expected, booking_no)
+        with self.connection:
+            cursor = self.connection.execute(
+                'UPDATE bookings SET revision = ?, status = ? '
+                f'WHERE booking_no = ? AND status != ?{check}',
+                [str(next_revision()), DELETED, booking_no, DELETED] +
+                revisions)
+        if not cursor.rowcount and check:
+            if self._live(booking_no):
+                raise ConflictError([booking_no])
+            raise ConflictError([booking_no], deleted=[booking_no])
+        return cursor.rowcount > 0
+
+    def compact(self):
+        '''
+        Removes the deleted bookings from the database.
+
+        Returns:
+        int: The number of bookings removed.
+        '''
+        with self.connection:
+            cursor = self.connection.execute(
+                'DELETE FROM bookings WHERE status = ?', (DELETED,))
+        return cursor.rowcount
+
+    def replace_all(self, header, rows):
+        '''
+        Replaces every booking in the database with the given rows.
+        '''
+        with self.connection:
+            self.connection.execute('DELETE FROM bookings')
+            self.connection.executemany(
+                self._insert_sql(),
+                [self._values(row) for row in rows if row and row[0]])
+
+    def version(self):
+        # data_version changes whenever another connection commits
+        return self.connection.execute('PRAGMA data_version').fetchone()[0]
+
+    def changes_since(self, revision):
+        cursor = self.connection.execute(
+            f'SELECT {", ".join(self.COLUMNS)} FROM bookings '
+            'WHERE CAST(revision AS INTEGER) > ? ORDER BY position',
+            (revision,))
+        rows = [list(row) for row in cursor]
+        present = {row[0] for row in self.connection.execute(
+            'SELECT booking_no FROM bookings')}
+        highest = self.connection.execute(
+            'SELECT MAX(CAST(revision AS INTEGER)) FROM bookings').fetchone()
+        return rows, present, highest[0] or 0
+
+    def reset_connections(self):
+        # A SQLite connection must not be used by more than one process, so
+        # a forked process opens its own. The inherited connection is closed
+        # when it is garbage collected, which only closes this process's
+        # copies of its files: locks are not inherited over fork(), so the
+        # parent's are kept.
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+
+    @staticmethod
+    def _revision_check(expected, booking_no):
+        '''
+        Returns the WHERE clause condition, and its parameters, that only
+        lets a change be made if the booking has one of the revisions the
+        change expects.
+        '''
+        if not expected or booking_no not in expected:
+            return '', []
+        revisions = [int(revision) for revision in expected[booking_no]]
+        placeholders = ', '.join('?' * len(revisions))
+        return f' AND CAST(revision AS INTEGER) IN ({placeholders})', \
+            revisions
+
+    def _live(self, booking_no):
+        return self.connection.execute(
+            'SELECT 1 FROM bookings WHERE booking_no = ? AND status != ?',
+            (booking_no, DELETED)).fetchone() is not None
+
+    def _insert_sql(self):
+        return (f'INSERT INTO bookings ({", ".join(self.COLUMNS)}) '
+                f'VALUES ({", ".join("?" * len(self.COLUMNS))})')
+
+    def _values(self, row):
+        values = [str(value) for value in row[:len(self.COLUMNS)]]
+        return values + [''] * (len(self.COLUMNS) - len(values))
+
+
+def migrate(source, target):
+    '''
+    Copies every booking from one backend to another, replacing whatever the
+    target held before.
+
+    Args:
+    source: The backend to copy bookings from.
+    target: The backend to copy bookings to.
+
+    Returns:
+    int: The number of bookings copied.
+    '''
+    header, rows = source.load()
+    target.replace_all(header, rows)
+    return len(rows)
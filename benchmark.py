@@ -0,0 +1,295 @@
+'''
+Benchmarks for Kennel-Mate.
+
+Fills a FakeWorksheet with generated bookings and times the app's public
+operations against it, from loading the bookings and allocating a booking
+number to every view and creating, updating and deleting a booking, then
+writes the timings as JSON so improvements and regressions can be tracked
+from one version to the next.
+
+Run it with, for example:
+python3 benchmark.py --sizes 1000 10000 100000 --latency 0.05 -o out.json
+
+The journal, snapshot and booking number files are kept in a temporary
+directory, so a benchmark never touches a real session's files. The app's
+modules read the environment variables naming those files when the files
+are opened, and run.py, which reads the rest of its settings as it is
+imported, is only imported once they have been set.
+'''
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+import platform
+import tempfile
+import contextlib
+import statistics
+
+from booking import Booking, next_revision, format_date
+from booking_numbers import FIRST_BOOKING_NUMBER
+from booking_store import HEADERS
+from console import ScriptedConsole, use_console
+from fake_worksheet import FakeWorksheet
+from occupancy import KENNEL_CAPACITY
+
+SIZES = [1000, 10000, 100000]
+REPEAT = 5
+
+DOGS_NAMES = ['Bella', 'Max', 'Luna', 'Charlie', 'Daisy', 'Milo', 'Coco',
+              'Teddy', 'Poppy', 'Alfie', 'Rosie', 'Bear', 'Molly', 'Buster',
+              'Ruby', 'Archie', 'Lola', 'Rex', 'Bonnie', 'Oscar', 'Willow',
+              'Hugo', 'Maisie', 'Ziggy', 'Pepper', 'Otis', 'Nala', 'Biscuit',
+              'Tilly', 'Winston']
+FAMILY_NAMES = ['Smith', 'Jones', 'Taylor', 'Brown', 'Williams', 'Wilson',
+                'Johnson', 'Davies', 'Robinson', 'Wright', 'Thompson',
+                'Evans', 'Walker', 'White', 'Roberts', 'Green', 'Hall',
+                'Wood', 'Jackson', 'Clarke', 'Patel', 'Khan', 'Lewis',
+                'James', 'Phillips', 'Mason', 'Mitchell', 'Rose', 'Davis',
+                'Murphy']
+
+# Most stays are a night or two, with a long tail of holidays
+NIGHTS = [1] * 6 + [2] * 4 + [3] * 3 + list(range(4, 15))
+NIGHTLY_RATES = [2000, 2500, 3000]
+
+# How full the generated kennel is, on average
+OCCUPANCY = 0.7
+
+# The booking number view only accepts 4-digit booking numbers
+LAST_VIEWABLE_NUMBER = 9999
+
+
+def generate_bookings(count, seed=0, capacity=KENNEL_CAPACITY):
+    '''
+    Generates realistic booking rows: dogs with common names, mostly short
+    stays at one of a few nightly rates, busier in the summer holidays and
+    at Christmas, spread over as many days as a kennel of the given
+    capacity would need to hold them about 70% full, up to a year ahead.
+
+    Args:
+    count (int): How many bookings to generate, such as 1000 to 1000000.
+    seed (int): Seeds the random choices, so runs can be compared.
+    capacity (int): The number of kennels.
+
+    Returns:
+    list: Worksheet rows, in booking number order.
+    '''
+    rng = random.Random(seed)
+    span = max(365, int(count * statistics.mean(NIGHTS) /
+                        (capacity * OCCUPANCY)))
+    last = datetime.date.today() + datetime.timedelta(days=365)
+    first = last - datetime.timedelta(days=span)
+    rows = []
+    for i in range(count):
+        while True:
+            date = first + datetime.timedelta(days=rng.randrange(span))
+            # Summer holidays and Christmas are twice as busy
+            if date.month in (7, 8, 12) or rng.random() < 0.5:
+                break
+        nights = rng.choice(NIGHTS)
+        booking = Booking(FIRST_BOOKING_NUMBER + i, date,
+                          rng.choice(DOGS_NAMES), rng.choice(FAMILY_NAMES),
+                          nights * rng.choice(NIGHTLY_RATES), nights)
+        rows.append(booking.to_row())
+    return rows
+
+
+def use_local_files(directory):
+    '''
+    Points the app's journal, snapshot, booking number and lock files at a
+    directory, and turns off its pauses. Must be called before run.py is
+    imported.
+
+    Args:
+    directory (str): The directory, such as a temporary one.
+    '''
+    os.environ['KENNEL_JOURNAL'] = os.path.join(directory, 'journal')
+    os.environ['KENNEL_SNAPSHOT'] = os.path.join(directory, 'snapshot')
+    os.environ['KENNEL_SEQUENCE_FILE'] = os.path.join(directory, 'seq')
+    os.environ['KENNEL_ROW_LOCK_FILE'] = os.path.join(directory, 'rows.lock')
+    os.environ['KENNEL_PACE'] = 'fast'
+
+
+@contextlib.contextmanager
+def quiet(answers=()):
+    '''
+    Captures everything the app's screens print, instead of showing it, and
+    answers their prompts in turn.
+
+    Args:
+    answers (list): The lines to type at the prompts.
+    '''
+    with use_console(ScriptedConsole(answers)):
+        yield
+
+
+def measure(name, operation, worksheet, repeat):
+    '''
+    Times an operation.
+
+    Args:
+    name (str): The operation's name in the results.
+    operation (callable): Called with the run number, from 0.
+    worksheet (FakeWorksheet): The worksheet, to count the requests made.
+    repeat (int): How many times to run the operation.
+
+    Returns:
+    dict: The operation's timings in milliseconds and the average number
+    of worksheet requests it made.
+    '''
+    timings = []
+    requests = worksheet.request_count()
+    for run_number in range(repeat):
+        started = time.perf_counter()
+        operation(run_number)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'operation': name,
+        'runs': repeat,
+        'mean_ms': round(statistics.mean(timings), 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'requests': (worksheet.request_count() - requests) / repeat,
+    }
+
+
+def benchmark_size(size, latency, repeat, seed):
+    '''
+    Runs every benchmark against a worksheet holding a number of bookings.
+
+    Returns:
+    list: The results of measure() for each operation.
+    '''
+    # Imported here, once the environment points the app's local files at
+    # the benchmark's temporary directory
+    import run
+    from backends import SheetsBackend
+    from sheets_governor import SheetsGovernor
+
+    rows = generate_bookings(size, seed)
+    worksheet = FakeWorksheet([HEADERS] + rows, latency)
+    # Requests are not rate limited, so the timings show the app's own cost
+    governor = SheetsGovernor(requests_per_minute=6e9, burst=10 ** 9)
+    store = run.make_store(lambda: SheetsBackend(worksheet, governor))
+    run.use_store(store)
+    # The bookings each run looks at
+    rng = random.Random(seed)
+    viewable = rows[:LAST_VIEWABLE_NUMBER - FIRST_BOOKING_NUMBER + 1]
+    samples = [Booking.from_row(rng.choice(viewable))
+               for run_number in range(repeat)]
+
+    results = []
+
+    def timed(name, operation, runs=repeat, answers=()):
+        with quiet(answers):
+            results.append(measure(name, operation, worksheet, runs))
+
+    timed('load', lambda n: store.refresh())
+    timed('increment_booking_number',
+          lambda n: run.increment_booking_number())
+    timed('view_all_bookings', lambda n: run.view_all_bookings(),
+          answers=['Q'] * repeat)
+    timed('view_booking_no', lambda n: run.view_booking_no(None),
+          answers=[str(booking.number) for booking in samples])
+    timed('view_booking_date',
+          lambda n: run.view_booking_date(format_date(samples[n].date)))
+
+    def view_month(run_number):
+        date = samples[run_number].date.replace(day=1)
+        end = (date + datetime.timedelta(days=31)).replace(day=1)
+        run.view_date_range(date, end - datetime.timedelta(days=1))
+    timed('view_date_range', view_month)
+    timed('view_dog_bookings',
+          lambda n: run.view_dog_bookings(samples[n].dogs_name))
+
+    values = [booking.display_row() for booking in store.bookings()]
+    timed('revenue_total', lambda n: run.revenue_total(values))
+    timed('search_names', lambda n: store.search_names(
+        samples[n].dogs_name[:3].lower()))
+    timed('next_free_date', lambda n: store.occupancy().next_free_date(
+        samples[n].date, 7))
+
+    created = []
+
+    def create(run_number):
+        booking_no = run.increment_booking_number()
+        booking = Booking.from_row([booking_no, format_date(
+            datetime.date.today()), 'Bench', 'Mark', '25.00', '1'])
+        store.append(booking)
+        created.append(booking.number)
+    timed('create_booking', create)
+    timed('update_booking', lambda n: store.update_fields(
+        created[n], {'dogs_name': f'Bench {n}'}))
+    timed('delete_booking', lambda n: store.delete(created[n]))
+
+    def sync(run_number):
+        booking = Booking.from_row(samples[run_number].to_row())
+        booking.dogs_name = f'Synced {run_number}'
+        booking.revision = next_revision()
+        worksheet.update(f'A{booking.number - FIRST_BOOKING_NUMBER + 2}',
+                         [booking.to_row()])
+        store.sync()
+    timed('sync', sync)
+    store.backend.wait(5)
+    return results
+
+
+def main(argv=None):
+    '''
+    Parses the command line and runs the benchmarks.
+
+    Args:
+    argv (list): The command line arguments, defaults to sys.argv[1:].
+    '''
+    parser = argparse.ArgumentParser(
+        prog='benchmark.py', description='Kennel-Mate benchmarks')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES,
+                        help='numbers of bookings to benchmark with, such as '
+                             '1000 to 1000000')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds every worksheet request takes')
+    parser.add_argument('--repeat', type=int, default=REPEAT,
+                        help='how many times each operation is run')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seeds the generated bookings')
+    parser.add_argument('--output', '-o',
+                        help='the JSON file to write, defaults to the screen')
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        use_local_files(directory)
+        for size in args.sizes:
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+            print(f'Benchmarking {size} bookings...', file=sys.stderr)
+            for result in benchmark_size(size, args.latency, args.repeat,
+                                         args.seed):
+                result['size'] = size
+                results.append(result)
+                print(f"  {result['operation']:<26}"
+                      f"{result['median_ms']:>12.3f}ms "
+                      f"{result['requests']:>6.1f} requests",
+                      file=sys.stderr)
+
+    report = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'latency': args.latency,
+        'repeat': args.repeat,
+        'seed': args.seed,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
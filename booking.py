@@ -0,0 +1,349 @@
+'''
+The Booking record.
+
+Bookings are stored in the worksheet as rows of strings. They are parsed
+into Booking records once, when they are loaded, so the rest of the app
+works with a real date, an int booking number and the amount in whole pence
+rather than re-parsing strings every time a booking is searched, filtered
+or added up.
+
+Every time a booking is written it is stamped with a new revision, the time
+of the change in milliseconds, so other sessions can pull just the bookings
+changed since they last synced. The revision is also the booking's version:
+an update or delete names the revision it was made from, and the backend
+only makes the change if the booking still has that revision, raising a
+ConflictError if another session has changed it in the meantime.
+
+Deleting a booking marks its row as deleted in the Status column, rather
+than removing the row, so the rows below it do not move and the row
+positions other sessions hold stay valid. The marked rows are removed when
+the bookings are compacted.
+'''
+import datetime
+import re
+import time
+import threading
+
+BOOKING_NUMBER_PATTERN = re.compile(r'^B(\d+)$')
+AMOUNT_PATTERN = re.compile(r'^(\d+)(?:\.(\d{1,2}))?$')
+DATE_FORMAT = '%d-%m-%Y'
+DATE_PATTERN = re.compile(r'^\d{2}-\d{2}-\d{4}$')
+
+# The positions of the revision stamp and the status in a worksheet row,
+# after the cells shown to the user
+REVISION_CELL = 6
+STATUS_CELL = 7
+
+# The status of a deleted booking, waiting to be compacted away
+DELETED = 'Deleted'
+
+# The last revision handed out by next_revision()
+_last_revision = 0
+_revision_lock = threading.Lock()
+
+
+def parse_booking_number(booking_no):
+    '''
+    Converts a booking number such as "B1001" to an int.
+
+    Args:
+    booking_no (str or int): The booking number, with or without its "B"
+    prefix.
+
+    Returns:
+    int: The booking number, such as 1001.
+
+    Raises:
+    ValueError: If the value is not a booking number.
+    '''
+    if isinstance(booking_no, int):
+        return booking_no
+    match = BOOKING_NUMBER_PATTERN.match(booking_no)
+    if not match:
+        raise ValueError(f"'{booking_no}' is not a booking number")
+    return int(match.group(1))
+
+
+def parse_date(booking_date):
+    '''
+    Converts a booking date string to a date object.
+
+    Args:
+    booking_date (str): The date in the format "DD-MM-YYYY".
+
+    Returns:
+    datetime.date: The date.
+
+    Raises:
+    ValueError: If the string is not a valid date in the format "DD-MM-YYYY".
+    '''
+    return datetime.datetime.strptime(booking_date, DATE_FORMAT).date()
+
+
+def validate_booking_date(booking_date):
+    '''
+    Checks that a booking date is a real date in the format "DD-MM-YYYY".
+
+    Args:
+    booking_date (str): The date to check.
+
+    Returns:
+    str: The booking date.
+
+    Raises:
+    ValueError: If the input is not a valid date in the format "DD-MM-YYYY".
+    '''
+    if not DATE_PATTERN.match(booking_date):
+        raise ValueError(f"'{booking_date}' is not in the format DD-MM-YYYY")
+    day, month, year = map(int, booking_date.split("-"))
+    # Raises ValueError for dates that do not exist, such as 31-02-2023
+    datetime.date(year, month, day)
+    return booking_date
+
+
+def validate_amount(amount):
+    '''
+    Checks that an amount charged is a whole number or a number with 2
+    decimal places.
+
+    Args:
+    amount (str): The amount to check, such as "12" or "12.50".
+
+    Returns:
+    str: The amount formatted with 2 decimal places, such as "12.00".
+
+    Raises:
+    ValueError: If the amount is not a whole number or a number with 2
+    decimal places.
+    '''
+    float_amount = float(amount)
+    if not float_amount.is_integer() and \
+            round(float_amount, 2) != float_amount:
+        raise ValueError(f"'{amount}' is not a whole number or a number "
+                         "with 2 decimal places")
+    return "{:.2f}".format(float_amount)
+
+
+def parse_nights(nights):
+    '''
+    Converts a number of nights to an int. A blank number of nights, as in
+    bookings made before stays could be longer than one night, means 1.
+
+    Args:
+    nights (str): The number of nights, such as "3".
+
+    Returns:
+    int: The number of nights.
+
+    Raises:
+    ValueError: If the value is not a whole number of at least 1.
+    '''
+    nights = str(nights).strip()
+    if not nights:
+        return 1
+    if not nights.isdigit() or int(nights) < 1:
+        raise ValueError(f"'{nights}' is not a number of nights")
+    return int(nights)
+
+
+def parse_revision(revision):
+    '''
+    Converts a revision stamp to an int. Bookings written before revisions
+    were stamped have a blank revision, which is 0.
+
+    Args:
+    revision (str or int): The revision, such as "1685600000000".
+
+    Returns:
+    int: The revision.
+    '''
+    revision = str(revision).strip()
+    return int(revision) if revision.isdigit() else 0
+
+
+def is_deleted(row):
+    '''
+    Returns True if a worksheet row holds a booking that has been deleted.
+    '''
+    return len(row) > STATUS_CELL and row[STATUS_CELL] == DELETED
+
+
+def revision_expected(expected, booking_no, revision):
+    '''
+    Checks a booking's revision in the backend against the revisions a
+    change was made from.
+
+    Args:
+    expected (dict): Maps booking numbers to lists of the revisions each
+    change may find, or None if the change does not check revisions.
+    booking_no (str): The booking number, such as "B1001".
+    revision (int): The booking's revision in the backend.
+
+    Returns:
+    bool: True if the change can be made.
+    '''
+    if not expected or booking_no not in expected:
+        return True
+    return revision in expected[booking_no]
+
+
+class ConflictError(Exception):
+    '''
+    Raised when bookings could not be updated or deleted because another
+    session changed or deleted them after they were read. Any other
+    bookings in the same request were still changed.
+
+    Args:
+    booking_nos (list): The bookings changed or deleted elsewhere, such as
+    ["B1005"].
+    written (int): The number of other bookings that were changed.
+    deleted (list): Those of the bookings that had been deleted.
+    '''
+
+    def __init__(self, booking_nos, written=0, deleted=()):
+        super().__init__(f"{', '.join(booking_nos)} changed by another "
+                         "session")
+        self.booking_nos = list(booking_nos)
+        self.written = written
+        self.deleted = list(deleted)
+
+
+def next_revision():
+    '''
+    Returns a revision stamp for a booking being written: the current time
+    in milliseconds, or one more than the last stamp handed out if the clock
+    has not moved on, so stamps from one session always increase.
+
+    Returns:
+    int: The revision.
+    '''
+    global _last_revision
+    with _revision_lock:
+        _last_revision = max(int(time.time() * 1000), _last_revision + 1)
+        return _last_revision
+
+
+def format_date(date):
+    '''
+    Formats a date as stored in the worksheet, "DD-MM-YYYY".
+    '''
+    return date.strftime(DATE_FORMAT)
+
+
+def amount_to_pence(amount):
+    '''
+    Converts an amount charged, such as "12.50", "£12.5" or "12", to whole
+    pence without going through a float.
+
+    Args:
+    amount (str): The amount charged.
+
+    Returns:
+    int: The amount in pence, or 0 if the amount is not a valid number.
+    '''
+    match = AMOUNT_PATTERN.match(amount.strip().lstrip('£').replace(',', ''))
+    if not match:
+        return 0
+    pounds, pence = match.groups()
+    return int(pounds) * 100 + int((pence or '0').ljust(2, '0'))
+
+
+def format_pence(pence):
+    '''
+    Formats whole pence as pounds with 2 decimal places.
+
+    Args:
+    pence (int): The amount in pence.
+
+    Returns:
+    str: The amount in pounds, such as "12.50".
+    '''
+    return f'{pence // 100}.{pence % 100:02d}'
+
+
+class Booking:
+    '''
+    A single booking.
+
+    Args:
+    number (int): The booking number, such as 1001 for "B1001".
+    date (datetime.date): The booking date.
+    dogs_name (str): The dog's name.
+    family_name (str): The dog's family name.
+    pence (int): The amount charged, in pence.
+    nights (int): The number of nights the dog stays, from the booking date.
+    revision (int): The revision the booking was last written at, or 0 if it
+    has not been stamped.
+    '''
+    __slots__ = ('number', 'date', 'dogs_name', 'family_name', 'pence',
+                 'nights', 'revision')
+
+    def __init__(self, number, date, dogs_name, family_name, pence,
+                 nights=1, revision=0):
+        self.number = number
+        self.date = date
+        self.dogs_name = dogs_name
+        self.family_name = family_name
+        self.pence = pence
+        self.nights = nights
+        self.revision = revision
+
+    @classmethod
+    def from_row(cls, row):
+        '''
+        Parses a worksheet row into a Booking.
+
+        Args:
+        row (list): The booking number, date, dog's name, family name,
+        amount charged, number of nights and revision, as strings.
+
+        Returns:
+        Booking: The parsed booking.
+
+        Raises:
+        ValueError: If the booking number, date or number of nights cannot
+        be parsed.
+        '''
+        cells = list(row) + [''] * (7 - len(row))
+        return cls(parse_booking_number(cells[0]), parse_date(cells[1]),
+                   cells[2], cells[3], amount_to_pence(cells[4]),
+                   parse_nights(cells[5]), parse_revision(cells[6]))
+
+    @property
+    def booking_no(self):
+        '''
+        The booking number as shown to the user, such as "B1001".
+        '''
+        return f'B{self.number}'
+
+    @property
+    def end_date(self):
+        '''
+        The date the dog leaves, the day after the last night of the stay.
+        '''
+        return self.date + datetime.timedelta(days=self.nights)
+
+    def display_row(self):
+        '''
+        Returns the booking as a row of strings for showing to the user.
+
+        Returns:
+        list: The booking number, date, dog's name, family name, amount
+        charged and number of nights.
+        '''
+        return [self.booking_no, format_date(self.date), self.dogs_name,
+                self.family_name, format_pence(self.pence), str(self.nights)]
+
+    def to_row(self):
+        '''
+        Returns the booking as a worksheet row of strings.
+
+        Returns:
+        list: The display_row() cells followed by the revision, which is
+        blank if the booking has not been stamped. The Status cell is left
+        out, so writing the row never changes whether it is deleted.
+        '''
+        return self.display_row() + [str(self.revision or '')]
+
+    def __repr__(self):
+        return f'Booking({", ".join(self.to_row())})'
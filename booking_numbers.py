@@ -0,0 +1,109 @@
+'''
+Sequential booking number allocation.
+
+Booking numbers are handed out from a high-water mark kept in a small local
+state file, so allocating a number no longer needs to read the booking
+number column of the worksheet. The state file is locked while a number is
+being allocated, which stops two front-desk sessions running on the same
+machine from handing out the same number. Blocks of numbers can be reserved
+in one go for bulk imports.
+'''
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # fcntl is not available on Windows, where only sessions within the same
+    # process are protected from allocating the same number.
+    fcntl = None
+
+FIRST_BOOKING_NUMBER = 1001
+
+# Location of the high-water mark file, which can be overridden with the
+# KENNEL_SEQUENCE_FILE environment variable. The variable is read when an
+# allocator is made, not when this module is imported, so a benchmark can
+# point it elsewhere after importing the app.
+SEQUENCE_FILE = '.kennel_mate_seq'
+
+
+def format_booking_number(number):
+    '''
+    Formats a booking number as stored in the worksheet.
+
+    Args:
+    number (int): The booking number, such as 1001.
+
+    Returns:
+    str: The booking number with its "B" prefix, such as "B1001".
+    '''
+    return f'B{number}'
+
+
+class BookingNumberAllocator:
+    '''
+    Hands out sequential booking numbers from a persistent high-water mark.
+
+    Args:
+    highest_in_use (callable): Returns the highest booking number currently
+    in the bookings data as an int, so numbers created before the state file
+    existed, or by another machine, are never handed out again.
+    path (str): Path of the high-water mark state file, defaults to
+    KENNEL_SEQUENCE_FILE.
+    '''
+
+    def __init__(self, highest_in_use, path=None):
+        self.highest_in_use = highest_in_use
+        self.path = path or os.environ.get('KENNEL_SEQUENCE_FILE',
+                                           SEQUENCE_FILE)
+        self._lock = threading.Lock()
+
+    def next_number(self):
+        '''
+        Allocates the next booking number.
+
+        Returns:
+        str: The booking number, such as "B1001".
+        '''
+        return self.reserve(1)[0]
+
+    def reserve(self, count):
+        '''
+        Allocates a block of consecutive booking numbers, such as for a bulk
+        import. The whole block is recorded in the state file before it is
+        returned, so no other session can allocate any of its numbers.
+
+        Args:
+        count (int): How many booking numbers to allocate.
+
+        Returns:
+        list: The allocated booking numbers, such as ["B1001", "B1002"].
+
+        Raises:
+        ValueError: If count is less than 1.
+        '''
+        if count < 1:
+            raise ValueError('At least one booking number must be reserved')
+
+        with self._lock:
+            with open(self.path, 'a+', encoding='utf-8') as state:
+                if fcntl is not None:
+                    fcntl.flock(state, fcntl.LOCK_EX)
+                try:
+                    state.seek(0)
+                    saved = state.read().strip()
+                    high_water = max(int(saved) if saved.isdigit() else 0,
+                                     self.highest_in_use(),
+                                     FIRST_BOOKING_NUMBER - 1)
+                    first = high_water + 1
+                    state.seek(0)
+                    state.truncate()
+                    state.write(str(high_water + count))
+                    state.flush()
+                    os.fsync(state.fileno())
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(state, fcntl.LOCK_UN)
+
+        return [format_booking_number(number)
+                for number in range(first, first + count)]
@@ -0,0 +1,765 @@
+'''
+Local in-memory cache of the bookings data.
+
+The BookingStore loads every booking from its storage backend (see
+backends.py) once per session and then serves every view from memory.
+Creates, updates and deletes are written through to the backend and applied
+to the cache at the same time, so the cache never needs to be downloaded
+again after our own changes. The cache is only reloaded when it is older than
+the configured TTL and the backend's version check reports that somebody else
+has changed the data.
+
+Rows are parsed into Booking records (see booking.py) once, as they are
+loaded, so searches, filters and totals work on dates and whole pence
+rather than parsing strings again every time.
+
+The store also keeps dictionary indexes over the cached bookings, so looking
+up a booking by number, date or dog/family name does not scan every booking,
+a sorted list of booking dates, so a range of dates is found with a binary
+search, a prefix and fuzzy name index (see name_search.py), running
+booking counts and revenue totals (see aggregates.py), and the number of
+kennels occupied each night (see occupancy.py).
+
+Every booking written is stamped with a new revision (see booking.py). Once
+the cache has been loaded, a stale cache is brought up to date with sync(),
+which asks the backend for only the bookings stamped since the highest
+revision in the cache, and which bookings still exist, rather than loading
+every booking again.
+
+Deleted bookings stay in the backend, marked in their Status cell, until
+the backend is compacted. They are set aside as the rows are parsed, so
+they never reach the cache.
+'''
+import os
+import time
+import bisect
+import threading
+
+from aggregates import BookingAggregates
+from booking import (
+    Booking, parse_booking_number, parse_date, next_revision, is_deleted,
+    ConflictError)
+from name_search import NameIndex, SEARCH_LIMIT
+from occupancy import Occupancy, KENNEL_CAPACITY
+
+HEADERS = ['Booking No.', 'Date', 'Dogs Name', 'Family Name', 'Amount Paid',
+           'Nights', 'Revision', 'Status']
+
+# The columns shown to the user, matching Booking.display_row()
+DISPLAY_HEADERS = HEADERS[:6]
+
+# The Booking fields that update_fields() and queue_update() can change
+UPDATABLE_FIELDS = ('date', 'dogs_name', 'family_name', 'pence', 'nights')
+
+# Number of seconds the cache is trusted before the version check is run.
+# Can be overridden with the KENNEL_CACHE_TTL environment variable.
+CACHE_TTL = float(os.environ.get('KENNEL_CACHE_TTL', '300'))
+
+# sync() also pulls bookings stamped this many milliseconds before the
+# highest revision in the cache, so changes stamped by a computer whose
+# clock is a little behind are not missed
+SYNC_OVERLAP = 5 * 60 * 1000
+
+
+class BookingStore:
+    '''
+    Write-through cache in front of a storage backend.
+
+    Args:
+    backend: The storage backend holding the bookings, such as a
+    SheetsBackend or SQLiteBackend.
+    ttl (float): Number of seconds before the cache is considered stale.
+    Once the TTL has expired the cache is only reloaded if the backend's
+    version() has changed.
+    capacity (int): The number of kennels.
+    '''
+
+    def __init__(self, backend, ttl=CACHE_TTL, capacity=KENNEL_CAPACITY):
+        self.backend = backend
+        self.ttl = ttl
+        self.capacity = capacity
+        self._header = list(HEADERS)
+        self._bookings = None
+        self._loaded_at = 0.0
+        self._version = None
+        # worksheet rows that could not be read as bookings, such as rows
+        # with a missing booking number or date
+        self.unreadable_rows = []
+        # booking number -> cached Booking
+        self._by_number = {}
+        # id() of each cached Booking -> a key that increases down the
+        # worksheet, so self._bookings stays sorted by it and a booking's
+        # position can be found by bisection
+        self._order = {}
+        self._next_order = 0
+        # date -> bookings for that date
+        self._by_date = {}
+        # every date in self._by_date, in order
+        self._dates = []
+        # lower-cased dog or family name -> bookings with that name
+        self._by_name = {}
+        # prefix and fuzzy search over every name in self._by_name
+        self._name_index = NameIndex()
+        # booking numbers with changes waiting for flush()
+        self._pending = set()
+        # highest booking number seen, never lowered by deletes
+        self._max_number = 0
+        # running counts and revenue totals of the cached bookings
+        self._aggregates = BookingAggregates()
+        # kennels occupied each night by the cached bookings
+        self._occupancy = Occupancy(capacity)
+        # highest revision of the cached bookings, for sync()
+        self._revision = 0
+        # Held while the cached bookings or their indexes change, as the
+        # journal's writer thread renumbers bookings while the UI uses them.
+        # It is never held during a backend request, which may wait for the
+        # writer thread.
+        self._lock = threading.RLock()
+
+    # LOADING
+
+    def refresh(self):
+        '''
+        Loads every booking from the backend and replaces the cached
+        bookings. Any queued updates are written first so they are not lost.
+        '''
+        if self._pending:
+            self.flush()
+        header, rows = self.backend.load()
+        version = self._check_version()
+        bookings, unreadable_rows, deleted = self._parse_rows(rows)
+        with self._lock:
+            self._header = header
+            self._bookings, self.unreadable_rows = bookings, unreadable_rows
+            self._loaded_at = time.monotonic()
+            self._version = version
+            self._revision = max((booking.revision
+                                  for booking in self._bookings + deleted),
+                                 default=0)
+            self._rebuild_indexes()
+            # Numbers of deleted bookings are never handed out again either
+            self._max_number = max([self._max_number] +
+                                   [booking.number for booking in deleted])
+
+    def sync(self):
+        '''
+        Brings the loaded cache up to date by pulling only the bookings that
+        have changed since the highest revision in the cache, if the backend
+        supports it. Any queued updates are written first.
+
+        Returns:
+        bool: True if the cache was synced, or False if it has not been
+        loaded or the backend could not sync, so a full refresh() is needed.
+        '''
+        changes_since = getattr(self.backend, 'changes_since', None)
+        if self._bookings is None or changes_since is None:
+            return False
+        if self._pending:
+            self.flush()
+        version = self._check_version()
+        try:
+            changes = changes_since(self._revision - SYNC_OVERLAP)
+        except Exception:
+            return False
+        if changes is None:
+            return False
+        rows, present, revision = changes
+        with self._lock:
+            if self._bookings is None:
+                return False
+            for row in rows:
+                if row and row[0] in present:
+                    self._apply_synced_row(row)
+            self._drop_deleted(present)
+            self._revision = max(self._revision, revision)
+            self._loaded_at = time.monotonic()
+            self._version = version
+        return True
+
+    def invalidate(self):
+        '''
+        Drops the cached bookings, so the next read reloads the backend.
+        '''
+        with self._lock:
+            self._bookings = None
+
+    def expire(self):
+        '''
+        Ends the TTL early, so the next read checks the backend's version and
+        brings the cache up to date if the bookings have changed, such as in
+        a session forked from a server that loaded the cache some time ago.
+        '''
+        with self._lock:
+            self._loaded_at = time.monotonic() - self.ttl
+
+    def is_stale(self):
+        '''
+        Returns True if the cache needs to be (re)loaded.
+
+        The cache is fresh until the TTL expires. After that the version
+        check is consulted, and if the data has not changed the TTL is
+        simply restarted without downloading any rows.
+
+        Returns:
+        bool: True if the bookings should be loaded again.
+        '''
+        if self._bookings is None:
+            return True
+        if time.monotonic() - self._loaded_at < self.ttl:
+            return False
+        version = self._check_version()
+        if version is not None and version == self._version:
+            self._loaded_at = time.monotonic()
+            return False
+        return True
+
+    def ensure_fresh(self):
+        '''
+        Loads the bookings if the cache is empty or stale.
+        '''
+        if self.is_stale() and not self.sync():
+            self.refresh()
+
+    def reset_connections(self):
+        '''
+        Drops the backend's open network or database connections while
+        keeping the cached bookings, such as in a newly forked process.
+        '''
+        self.backend.reset_connections()
+
+    def _check_version(self):
+        try:
+            return self.backend.version()
+        except Exception:
+            # A failed version check must never break a view, it just means
+            # the cache will be reloaded when the TTL next expires.
+            return None
+
+    def _apply_synced_row(self, row):
+        try:
+            booking = Booking.from_row(row)
+        except ValueError:
+            return
+        cached = self._by_number.get(booking.number)
+        if is_deleted(row):
+            self._max_number = max(self._max_number, booking.number)
+            if cached is not None:
+                self._remove_cached(cached)
+            return
+        if cached is None:
+            self._add_cached(booking)
+            return
+        if cached.to_row() == booking.to_row():
+            # Pulled again because of the SYNC_OVERLAP
+            return
+        self._unindex_booking(cached)
+        self._bookings[self._list_position(cached)] = booking
+        self._order[id(booking)] = self._order.pop(id(cached))
+        self._index_booking(booking)
+
+    def _drop_deleted(self, present):
+        '''
+        Drops cached bookings that are no longer in the backend.
+        '''
+        deleted = [booking for booking in self._bookings
+                   if booking.booking_no not in present]
+        if not deleted:
+            return
+        for booking in deleted:
+            self._unindex_booking(booking)
+            self._pending.discard(booking.number)
+            del self._order[id(booking)]
+        deleted = set(id(booking) for booking in deleted)
+        self._bookings = [booking for booking in self._bookings
+                          if id(booking) not in deleted]
+
+    @staticmethod
+    def _parse_rows(rows):
+        '''
+        Parses worksheet rows into Bookings, setting aside blank rows and
+        rows that cannot be read.
+
+        Returns:
+        tuple: The Bookings, the rows that could not be read, and the
+        deleted Bookings waiting to be compacted.
+        '''
+        bookings = []
+        unreadable = []
+        deleted = []
+        for row in rows:
+            if not row or not row[0]:
+                continue
+            try:
+                booking = Booking.from_row(row)
+            except ValueError:
+                unreadable.append(row)
+                continue
+            if is_deleted(row):
+                deleted.append(booking)
+            else:
+                bookings.append(booking)
+        return bookings, unreadable, deleted
+
+    # READS
+
+    def bookings(self):
+        '''
+        Returns every cached booking, in worksheet order.
+
+        Returns:
+        list: A list of Bookings.
+        '''
+        self.ensure_fresh()
+        return self._bookings
+
+    def page(self, offset, limit):
+        '''
+        Returns one page of bookings, in worksheet order. The page is taken
+        from the cache while it is fresh, otherwise only the page's rows are
+        read from the backend rather than reloading every booking.
+
+        Args:
+        offset (int): The number of bookings before the page.
+        limit (int): The most bookings to return.
+
+        Returns:
+        list: The Bookings on the page.
+        '''
+        if self.is_stale():
+            return self._parse_rows(self.backend.load_page(offset, limit))[0]
+        return self._bookings[offset:offset + limit]
+
+    def count(self):
+        '''
+        Returns the number of bookings, from the cache while it is fresh and
+        otherwise from the backend.
+
+        Returns:
+        int: The number of bookings.
+        '''
+        if self.is_stale():
+            return self.backend.count()
+        return len(self._bookings)
+
+    def aggregates(self):
+        '''
+        Returns the running booking counts and revenue totals.
+
+        Returns:
+        BookingAggregates: The totals overall and per day, month, family and
+        name.
+        '''
+        self.ensure_fresh()
+        return self._aggregates
+
+    def occupancy(self):
+        '''
+        Returns the number of kennels occupied each night.
+
+        Returns:
+        Occupancy: The per-night occupancy counters.
+        '''
+        self.ensure_fresh()
+        return self._occupancy
+
+    def max_booking_number(self):
+        '''
+        Returns the highest booking number that has been held in the cache.
+        Deleting that booking does not lower it, so numbers are not reused.
+
+        Returns:
+        int: The highest booking number, or 0 if there are no bookings.
+        '''
+        self.ensure_fresh()
+        return self._max_number
+
+    def find(self, booking_no):
+        '''
+        Returns the cached booking for a booking number.
+
+        Args:
+        booking_no (int or str): The booking number, such as 1001 or "B1001".
+
+        Returns:
+        Booking: The booking, or None if the booking does not exist.
+        '''
+        return self._cached(booking_no)
+
+    def by_date(self, booking_date):
+        '''
+        Returns the cached bookings for a date.
+
+        Args:
+        booking_date (datetime.date or str): The date, or a string in the
+        format "DD-MM-YYYY".
+
+        Returns:
+        list: The matching Bookings, in worksheet order.
+        '''
+        self.ensure_fresh()
+        if isinstance(booking_date, str):
+            try:
+                booking_date = parse_date(booking_date)
+            except ValueError:
+                return []
+        return self._in_sheet_order(self._by_date.get(booking_date, []))
+
+    def dates_between(self, first=None, last=None):
+        '''
+        Returns the dates that have bookings between two dates, found with a
+        binary search of the sorted date index.
+
+        Args:
+        first (datetime.date): The first date, inclusive, or None to start
+        from the earliest booking.
+        last (datetime.date): The last date, inclusive, or None to run to
+        the latest booking.
+
+        Returns:
+        list: The booked dates, in date order.
+        '''
+        self.ensure_fresh()
+        start = 0 if first is None else bisect.bisect_left(self._dates, first)
+        end = len(self._dates) if last is None else \
+            bisect.bisect_right(self._dates, last)
+        return self._dates[start:end]
+
+    def by_date_range(self, first=None, last=None):
+        '''
+        Returns the cached bookings between two dates.
+
+        Args:
+        first (datetime.date): The first date, inclusive, or None to start
+        from the earliest booking.
+        last (datetime.date): The last date, inclusive, or None to run to
+        the latest booking.
+
+        Returns:
+        list: The matching Bookings in date order, and in worksheet order
+        within each date.
+        '''
+        bookings = []
+        for date in self.dates_between(first, last):
+            bookings.extend(self._in_sheet_order(self._by_date[date]))
+        return bookings
+
+    def by_name(self, name):
+        '''
+        Returns the cached bookings whose dog's name or family name matches,
+        ignoring case.
+
+        Args:
+        name (str): The dog's name or family name.
+
+        Returns:
+        list: The matching Bookings, in worksheet order.
+        '''
+        self.ensure_fresh()
+        return self._in_sheet_order(self._by_name.get(name.lower(), []))
+
+    def search_names(self, query, limit=SEARCH_LIMIT):
+        '''
+        Finds the dog and family names that best match a partial or
+        misspelled search, ignoring case.
+
+        Args:
+        query (str): The search, such as "Bel".
+        limit (int): The most names to return.
+
+        Returns:
+        list: (name, number of bookings) pairs, best match first. Names are
+        lower-cased.
+        '''
+        self.ensure_fresh()
+        return [(name, len(self._by_name[name]))
+                for name in self._name_index.search(query.lower(), limit)]
+
+    def _cached(self, booking_no):
+        self.ensure_fresh()
+        try:
+            return self._by_number.get(parse_booking_number(booking_no))
+        except ValueError:
+            return None
+
+    def _in_sheet_order(self, bookings):
+        return sorted(bookings, key=self._order_of)
+
+    def _order_of(self, booking):
+        return self._order[id(booking)]
+
+    def _list_position(self, booking):
+        '''
+        Returns a cached booking's position in self._bookings.
+        '''
+        return bisect.bisect_left(self._bookings, self._order_of(booking),
+                                  key=self._order_of)
+
+    # INDEXES
+
+    def _rebuild_indexes(self):
+        self._by_number = {}
+        self._order = {id(booking): order
+                       for order, booking in enumerate(self._bookings)}
+        self._next_order = len(self._bookings)
+        self._by_date = {}
+        self._dates = []
+        self._by_name = {}
+        self._name_index = NameIndex()
+        self._max_number = 0
+        self._aggregates = BookingAggregates()
+        self._occupancy = Occupancy(self.capacity)
+        for booking in self._bookings:
+            self._index_booking(booking)
+
+    def _index_booking(self, booking):
+        self._by_number[booking.number] = booking
+        self._max_number = max(self._max_number, booking.number)
+        if booking.date not in self._by_date:
+            bisect.insort(self._dates, booking.date)
+        for key, index in self._index_keys(booking):
+            index.setdefault(key, []).append(booking)
+            if index is self._by_name:
+                self._name_index.add(key)
+        self._aggregates.add(booking)
+        self._occupancy.add(booking)
+
+    def _unindex_booking(self, booking):
+        self._by_number.pop(booking.number, None)
+        for key, index in self._index_keys(booking):
+            matches = index.get(key, [])
+            for i, match in enumerate(matches):
+                if match is booking:
+                    del matches[i]
+                    break
+            if not matches:
+                index.pop(key, None)
+                if index is self._by_name:
+                    self._name_index.remove(key)
+        if booking.date not in self._by_date:
+            i = bisect.bisect_left(self._dates, booking.date)
+            if i < len(self._dates) and self._dates[i] == booking.date:
+                del self._dates[i]
+        self._aggregates.remove(booking)
+        self._occupancy.remove(booking)
+
+    def _index_keys(self, booking):
+        '''
+        Returns (key, index) pairs for every secondary index entry of a
+        booking. A dog that shares its family name is only indexed once
+        under it.
+        '''
+        keys = [(booking.date, self._by_date)]
+        names = {booking.dogs_name.lower(), booking.family_name.lower()}
+        keys.extend((name, self._by_name) for name in names if name)
+        return keys
+
+    # WRITES
+
+    def append(self, booking):
+        '''
+        Appends a booking to the backend and to the cache.
+
+        Args:
+        booking (Booking): The booking to append.
+        '''
+        self.ensure_fresh()
+        booking.revision = next_revision()
+        self.backend.append(booking.to_row())
+        with self._lock:
+            self._add_cached(booking)
+
+    def append_many(self, bookings):
+        '''
+        Appends several bookings to the backend in one request, and to the
+        cache.
+
+        Args:
+        bookings (list): The Bookings to append.
+        '''
+        self.ensure_fresh()
+        if not bookings:
+            return
+        for booking in bookings:
+            booking.revision = next_revision()
+        self.backend.append_many([booking.to_row() for booking in bookings])
+        with self._lock:
+            for booking in bookings:
+                self._add_cached(booking)
+
+    def update_fields(self, booking_no, changes):
+        '''
+        Updates several fields of a booking with a single write to the
+        backend, and applies the changes to the cache.
+
+        Args:
+        booking_no (int or str): The booking number, such as 1001 or "B1001".
+        changes (dict): Maps UPDATABLE_FIELDS names to their new values,
+        such as {'date': datetime.date(2023, 5, 1), 'pence': 1250}.
+
+        Returns:
+        bool: True if the booking was found and updated.
+
+        Raises:
+        ValueError: If a change is not to one of the UPDATABLE_FIELDS.
+        ConflictError: If another session has changed the booking since it
+        was cached. The cache is dropped, so the booking can be read again.
+        '''
+        booking = self._cached(booking_no)
+        if booking is None:
+            return False
+        if changes:
+            with self._lock:
+                expected = {booking.booking_no: [booking.revision]}
+                self._apply_changes(booking, changes)
+                booking.revision = next_revision()
+                updates = [(booking.booking_no, booking.to_row())]
+            self._write_checked(self.backend.update_rows, updates, expected)
+        return True
+
+    def queue_update(self, booking_no, changes):
+        '''
+        Applies changes to a booking in the cache and queues them, so that
+        the changes to several bookings can be written to the backend
+        together by flush().
+
+        Args:
+        booking_no (int or str): The booking number, such as 1001 or "B1001".
+        changes (dict): Maps UPDATABLE_FIELDS names to their new values.
+
+        Returns:
+        bool: True if the booking was found and queued.
+
+        Raises:
+        ValueError: If a change is not to one of the UPDATABLE_FIELDS.
+        '''
+        booking = self._cached(booking_no)
+        if booking is None:
+            return False
+        with self._lock:
+            self._apply_changes(booking, changes)
+            self._pending.add(booking.number)
+        return True
+
+    def flush(self):
+        '''
+        Writes every queued booking update to the backend in one batch, a
+        single batch_update request for the worksheet.
+
+        Returns:
+        int: The number of bookings written.
+
+        Raises:
+        ConflictError: If another session has changed some of the bookings
+        since they were cached. The other bookings are still written, and
+        the cache is dropped, so the bookings can be read again.
+        '''
+        with self._lock:
+            if not self._pending:
+                return 0
+            bookings = [self._by_number[number] for number in self._pending
+                        if number in self._by_number]
+            expected = {booking.booking_no: [booking.revision]
+                        for booking in bookings}
+            for booking in bookings:
+                booking.revision = next_revision()
+            updates = [(booking.booking_no, booking.to_row())
+                       for booking in bookings]
+            self._pending.clear()
+        if updates:
+            self._write_checked(self.backend.update_rows, updates, expected)
+        return len(updates)
+
+    def _apply_changes(self, booking, changes):
+        unknown = set(changes) - set(UPDATABLE_FIELDS)
+        if unknown:
+            raise ValueError(f"Cannot update {', '.join(sorted(unknown))}")
+        self._unindex_booking(booking)
+        for field, value in changes.items():
+            setattr(booking, field, value)
+        self._index_booking(booking)
+
+    def delete(self, booking_no):
+        '''
+        Deletes a booking from the backend and the cache.
+
+        Args:
+        booking_no (int or str): The booking number, such as 1001 or "B1001".
+
+        Returns:
+        bool: True if the booking was found and deleted.
+
+        Raises:
+        ConflictError: If another session has changed the booking since it
+        was cached. The cache is dropped, so the booking can be read again.
+        '''
+        booking = self._cached(booking_no)
+        if booking is None:
+            return False
+        self._write_checked(self.backend.delete, booking.booking_no,
+                            {booking.booking_no: [booking.revision]})
+        with self._lock:
+            # The booking may have been synced again, or away, while it was
+            # being deleted
+            cached = self._by_number.get(booking.number) \
+                if self._bookings is not None else None
+            if cached is not None:
+                self._remove_cached(cached)
+        return True
+
+    def _write_checked(self, write, changes, expected):
+        '''
+        Makes an update or delete that is only written to bookings still at
+        the revisions they were cached at.
+        '''
+        try:
+            write(changes, expected)
+        except ConflictError:
+            # The cache is out of date, so the next read reloads it
+            self.invalidate()
+            raise
+
+    def _add_cached(self, booking):
+        self._bookings.append(booking)
+        self._order[id(booking)] = self._next_order
+        self._next_order += 1
+        self._index_booking(booking)
+
+    def _remove_cached(self, booking):
+        # The indexes hold bookings rather than positions, so the bookings
+        # below this one moving up does not change any of them
+        position = self._list_position(booking)
+        self._unindex_booking(booking)
+        self._pending.discard(booking.number)
+        del self._bookings[position]
+        del self._order[id(booking)]
+
+    def renumber(self, booking_no, new_booking_no):
+        '''
+        Gives a cached booking a new booking number, such as when a booking
+        made offline turns out to have a number that another computer used
+        while this one was offline.
+
+        Args:
+        booking_no (int or str): The booking's number, such as "B1005".
+        new_booking_no (int or str): Its new number, such as "B1012".
+
+        Returns:
+        bool: True if the booking was found and renumbered.
+        '''
+        # The cache is not refreshed first, as this is called by the
+        # journal's writer thread while the changes are being written
+        with self._lock:
+            if self._bookings is None:
+                return False
+            booking = self._by_number.get(parse_booking_number(booking_no))
+            if booking is None:
+                return False
+            del self._by_number[booking.number]
+            pending = booking.number in self._pending
+            self._pending.discard(booking.number)
+            booking.number = parse_booking_number(new_booking_no)
+            self._by_number[booking.number] = booking
+            self._max_number = max(self._max_number, booking.number)
+            if pending:
+                self._pending.add(booking.number)
+        return True
@@ -0,0 +1,170 @@
+'''
+Bulk import and export of bookings as CSV files.
+
+import_bookings() reads a CSV file one record at a time, checks each booking
+with the same rules as the Create Booking screen, and writes the bookings in
+chunks, each given a reserved block of booking numbers and appended with a
+single request. Each chunk is written to the backend before the next is
+read, so neither the journal's queue of changes nor the file's records are
+held in memory, however large the file. export_bookings() writes the
+bookings in the format import_bookings() reads.
+
+Both are run from the command line by run.py:
+python3 run.py import bookings.csv
+python3 run.py export --from 01-06-2023 --to 30-06-2023 -o june.csv
+'''
+import csv
+
+from booking import (
+    Booking, parse_date, parse_nights, validate_booking_date, validate_amount)
+from booking_store import HEADERS, DISPLAY_HEADERS
+from write_behind import WriteBehindBackend
+
+# The CSV columns needed to import a booking. A "Booking No." column is
+# ignored, as imported bookings are given new booking numbers, and a missing
+# "Nights" column means every stay is one night.
+IMPORT_COLUMNS = HEADERS[1:5]
+
+# The number of bookings written to the backend in each request
+IMPORT_CHUNK_SIZE = 500
+
+# The most seconds an import waits for each chunk to be written
+CHUNK_WRITE_WAIT = 30
+
+# The encoding CSV files are imported in. utf-8-sig also reads the byte
+# order mark Excel puts at the start of a CSV file saved as UTF-8.
+IMPORT_ENCODING = 'utf-8-sig'
+
+
+def parse_import_record(record):
+    '''
+    Validates one imported booking with the same rules as the Create Booking
+    screen.
+
+    Args:
+    record (dict): A CSV record keyed by the IMPORT_COLUMNS headers.
+
+    Returns:
+    list: The booking date, dog's name, family name, amount charged and
+    number of nights.
+
+    Raises:
+    ValueError: If any of the fields is invalid.
+    '''
+    # Short CSV lines leave the missing fields as None
+    fields = {col: (record.get(col) or '').strip() for col in IMPORT_COLUMNS}
+
+    booking_date = validate_booking_date(fields['Date'])
+    dogs_name = fields['Dogs Name'].title()
+    if not dogs_name:
+        raise ValueError("Dog's name cannot be empty")
+    family_name = fields['Family Name'].title()
+    if not family_name:
+        raise ValueError("Family name cannot be empty")
+    amount = validate_amount(fields['Amount Paid'])
+    nights = parse_nights(record.get('Nights') or '')
+    return [booking_date, dogs_name, family_name, amount, nights]
+
+
+def import_bookings(csv_file, store, allocator,
+                    chunk_size=IMPORT_CHUNK_SIZE):
+    '''
+    Imports bookings from a CSV file with a header row. Invalid records are
+    skipped and reported.
+
+    Args:
+    csv_file: An open CSV file.
+    store (BookingStore): The booking cache to add the bookings to.
+    allocator (BookingNumberAllocator): Hands out the booking numbers.
+    chunk_size (int): The number of bookings written per request.
+
+    Returns:
+    tuple: The number of bookings imported, and a list of (line number,
+    error message) pairs for the records that were skipped.
+
+    Raises:
+    ValueError: If the CSV file does not have the IMPORT_COLUMNS headers.
+    '''
+    reader = csv.DictReader(csv_file)
+    missing = [col for col in IMPORT_COLUMNS
+               if col not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"The CSV file has no {', '.join(missing)} "
+                         "column")
+
+    imported = 0
+    errors = []
+    chunk = []
+    for record in reader:
+        try:
+            chunk.append(parse_import_record(record))
+        except ValueError as e:
+            errors.append((reader.line_num, str(e)))
+            continue
+        if len(chunk) == chunk_size:
+            imported += write_import_chunk(chunk, store, allocator)
+            chunk = []
+    if chunk:
+        imported += write_import_chunk(chunk, store, allocator)
+    return imported, errors
+
+
+def write_import_chunk(chunk, store, allocator):
+    '''
+    Gives a chunk of imported bookings a reserved block of booking numbers
+    and appends them with a single request, waiting for the request to be
+    written unless the backend cannot be reached. Changes that cannot be
+    written yet stay in the journal, to be saved later.
+
+    Args:
+    chunk (list): The validated bookings, without booking numbers.
+    store (BookingStore): The booking cache to add the bookings to.
+    allocator (BookingNumberAllocator): Hands out the booking numbers.
+
+    Returns:
+    int: The number of bookings written.
+    '''
+    booking_nums = allocator.reserve(len(chunk))
+    store.append_many([Booking.from_row([booking_num] + booking)
+                       for booking_num, booking in zip(booking_nums, chunk)])
+    backend = store.backend
+    if isinstance(backend, WriteBehindBackend) and not backend.offline \
+            and backend.last_error is None:
+        backend.wait(CHUNK_WRITE_WAIT)
+    return len(chunk)
+
+
+def export_bookings(csv_file, store, date_from=None, date_to=None):
+    '''
+    Writes bookings to a CSV file, in the format read by import_bookings.
+    Every booking is written in worksheet order, or when a date range is
+    given the bookings in the range are written in date order.
+
+    Args:
+    csv_file: An open CSV file to write to.
+    store (BookingStore): The booking cache to export.
+    date_from (str): Optional first booking date to export, "DD-MM-YYYY".
+    date_to (str): Optional last booking date to export, "DD-MM-YYYY".
+
+    Returns:
+    int: The number of bookings written.
+
+    Raises:
+    ValueError: If the first date is after the last.
+    '''
+    first = parse_date(date_from) if date_from else None
+    last = parse_date(date_to) if date_to else None
+    if first and last and first > last:
+        raise ValueError(f'The first date, {date_from}, is after the last, '
+                         f'{date_to}')
+    writer = csv.writer(csv_file)
+    writer.writerow(DISPLAY_HEADERS)
+    exported = 0
+    if first or last:
+        bookings = store.by_date_range(first, last)
+    else:
+        bookings = store.bookings()
+    for booking in bookings:
+        writer.writerow(booking.display_row())
+        exported += 1
+    return exported
@@ -0,0 +1,155 @@
+'''
+The console the admin system reads from and writes to.
+
+Every prompt, message and screen clear in run.py goes through the console
+of the current thread. Normally that is the terminal, but a script can give
+a thread a ScriptedConsole instead, which answers the prompts from a list of
+keystroke lines and captures everything printed, so sessions can be
+replayed without a terminal, faster than anyone could type, and many at
+once.
+
+Set KENNEL_RECORD to a file name to record every line typed at the
+terminal, so a real session can be replayed later. "{pid}" in the name is
+replaced with the process id, so the session server's sessions each record
+to their own file.
+'''
+import io
+import os
+import time
+import builtins
+import threading
+import contextlib
+
+RECORD_FILE = os.environ.get('KENNEL_RECORD', '')
+
+
+class EndOfScript(EOFError):
+    '''
+    Raised when a scripted session asks for more input than its script has.
+    '''
+
+
+class TerminalConsole:
+    '''
+    Reads from and writes to the terminal.
+
+    Args:
+    record (str): A file every line typed is appended to, or None.
+    '''
+
+    def __init__(self, record=None):
+        self.record = record
+
+    def input(self, prompt=''):
+        line = builtins.input(prompt)
+        if self.record:
+            path = self.record.replace('{pid}', str(os.getpid()))
+            with open(path, 'a', encoding='utf-8') as record:
+                record.write(f'{line}\n')
+        return line
+
+    def print(self, *args, **kwargs):
+        builtins.print(*args, **kwargs)
+
+    def clear_screen(self):
+        os.system('cls' if os.name == 'nt' else "printf '\033c'")
+
+
+class ScriptedConsole:
+    '''
+    Answers prompts from a script of keystroke lines and captures the
+    output, as a terminal would show it.
+
+    Args:
+    keystrokes (list): The lines to type, in order, such as "1" to choose a
+    menu option or "" to press ENTER.
+    '''
+
+    def __init__(self, keystrokes):
+        self.keystrokes = list(keystrokes)
+        self.typed = 0
+        self.output = io.StringIO()
+        # Seconds from each line being typed until the app asked for the
+        # next one, which is how long the user waited for each response
+        self.response_times = []
+        self._answered_at = None
+
+    def input(self, prompt=''):
+        if self._answered_at is not None:
+            self.response_times.append(
+                time.perf_counter() - self._answered_at)
+        self.output.write(str(prompt))
+        if self.typed >= len(self.keystrokes):
+            raise EndOfScript(f'The script ended after {self.typed} lines')
+        line = self.keystrokes[self.typed]
+        self.typed += 1
+        # The terminal echoes what was typed
+        self.output.write(f'{line}\n')
+        self._answered_at = time.perf_counter()
+        return line
+
+    def print(self, *args, **kwargs):
+        if kwargs.get('file') is not None:
+            builtins.print(*args, **kwargs)
+        else:
+            kwargs['file'] = self.output
+            builtins.print(*args, **kwargs)
+
+    def clear_screen(self):
+        self.output.write('\033c')
+
+    def transcript(self):
+        '''
+        Returns everything the session printed, with the lines typed.
+        '''
+        return self.output.getvalue()
+
+
+def read_script(path):
+    '''
+    Reads a recorded session.
+
+    Args:
+    path (str): A file with one typed line per line, such as one recorded
+    with KENNEL_RECORD.
+
+    Returns:
+    list: The keystroke lines.
+    '''
+    with open(path, encoding='utf-8') as script:
+        return script.read().splitlines()
+
+
+terminal = TerminalConsole(RECORD_FILE or None)
+_current = threading.local()
+
+
+def current():
+    '''
+    Returns the console of the current thread, which is the terminal unless
+    use_console() has given the thread another.
+    '''
+    return getattr(_current, 'console', terminal)
+
+
+@contextlib.contextmanager
+def use_console(console):
+    '''
+    Makes a console the current thread's console inside the with statement.
+
+    Args:
+    console: A TerminalConsole or ScriptedConsole.
+    '''
+    previous = getattr(_current, 'console', None)
+    _current.console = console
+    try:
+        yield console
+    finally:
+        _current.console = previous if previous is not None else terminal
+
+
+def clear_screen():
+    '''
+    Clears the current console's screen.
+    '''
+    current().clear_screen()
@@ -1,38 +1,154 @@
 const Pty = require('node-pty');
 const fs = require('fs');
+const net = require('net');
+const child_process = require('child_process');
+
+// When KENNEL_SESSION_SOCKET is set, terminals attach to pre-warmed sessions
+// from session_server.py instead of starting a new python3 run.py each time.
+const SESSION_SOCKET = process.env.KENNEL_SESSION_SOCKET;
+
+// A session server that exits is restarted after RESTART_DELAY, doubling
+// after each exit up to MAX_RESTART_DELAY. After MAX_RESTARTS exits in a row
+// it is left stopped, and terminals start their own python3 run.py. A server
+// that ran for STABLE_RUN before exiting had started properly, so the count
+// starts again.
+const RESTART_DELAY = 1000;
+const MAX_RESTART_DELAY = 60000;
+const MAX_RESTARTS = 10;
+const STABLE_RUN = 60000;
+let restarts = 0;
 
 exports.install = function () {
 
     ROUTE('/');
     WEBSOCKET('/', socket, ['raw']);
 
+    if (SESSION_SOCKET) {
+        startSessionServer();
+    }
+
 };
 
-function socket() {
+function startSessionServer() {
 
-    this.encodedecode = false;
-    this.autodestroy();
+    const started = Date.now();
+    const server = child_process.spawn('python3', ['session_server.py'], {
+        cwd: process.env.PWD,
+        env: process.env,
+        stdio: 'inherit'
+    });
 
-    this.on('open', function (client) {
+    server.on('exit', function (code, signal) {
+        if (Date.now() - started >= STABLE_RUN) {
+            restarts = 0;
+        }
+        if (restarts >= MAX_RESTARTS) {
+            console.log("Session server exited " + restarts + " times in a " +
+                        "row, not restarting it");
+            return;
+        }
+        const delay = Math.min(RESTART_DELAY * Math.pow(2, restarts),
+                               MAX_RESTART_DELAY);
+        restarts += 1;
+        console.log("Session server exited, restarting in " + delay + "ms");
+        setTimeout(startSessionServer, delay);
+    });
+}
+
+function spawnTerminal(client) {
+
+    // Spawn terminal
+    client.tty = Pty.spawn('python3', ['run.py'], {
+        name: 'xterm-color',
+        cols: 80,
+        rows: 24,
+        cwd: process.env.PWD,
+        env: process.env
+    });
+
+    client.tty.on('exit', function (code, signal) {
+        client.tty = null;
+        client.close();
+        console.log("Process killed");
+    });
+
+    client.tty.on('data', function (data) {
+        client.send(data);
+    });
+}
+
+function attachSession(client) {
+
+    const session = net.connect(SESSION_SOCKET);
+    let connected = false;
+    // Keystrokes typed before the session has connected
+    let buffered = [];
+
+    // Decodes multi-byte characters, such as £, split across reads
+    session.setEncoding('utf8');
 
-        // Spawn terminal
-        client.tty = Pty.spawn('python3', ['run.py'], {
-            name: 'xterm-color',
-            cols: 80,
-            rows: 24,
-            cwd: process.env.PWD,
-            env: process.env
+    // Set at once, so a client that closes before the session has
+    // connected still destroys the socket
+    const tty = {
+        write: function (data) {
+            if (connected) {
+                session.write(data);
+            } else {
+                buffered.push(data);
+            }
+        },
+        kill: function () {
+            session.destroy();
+        }
+    };
+    client.tty = tty;
+
+    session.on('connect', function () {
+        connected = true;
+        buffered.forEach(function (data) {
+            session.write(data);
         });
+        buffered = [];
+    });
 
-        client.tty.on('exit', function (code, signal) {
+    session.on('data', function (data) {
+        client.send(data);
+    });
+
+    session.on('error', function (err) {
+        // Nothing to do if the client has already closed
+        if (!connected && client.tty === tty) {
+            // The session server is not running, so fall back to a new process
+            console.log("Session server unavailable: " + err.message);
+            spawnTerminal(client);
+            buffered.forEach(function (data) {
+                client.tty.write(data);
+            });
+            buffered = [];
+        }
+    });
+
+    session.on('close', function () {
+        if (connected && client.tty === tty) {
             client.tty = null;
             client.close();
-            console.log("Process killed");
-        });
+            console.log("Session closed");
+        }
+    });
+}
 
-        client.tty.on('data', function (data) {
-            client.send(data);
-        });
+function socket() {
+
+    this.encodedecode = false;
+    this.autodestroy();
+
+    this.on('open', function (client) {
+
+        if (SESSION_SOCKET) {
+            attachSession(client);
+        } else {
+            spawnTerminal(client);
+        }
 
     });
 
@@ -57,4 +173,4 @@ if (process.env.CREDS != null) {
             socket.emit("console_output", "Error saving credentials: " + err);
         }
     });
-}
\ No newline at end of file
+}
@@ -0,0 +1,252 @@
+'''
+A local stand-in for a gspread worksheet.
+
+FakeWorksheet keeps the bookings worksheet in memory and answers the same
+requests the SheetsBackend makes of a real gspread Worksheet, so the app can
+be benchmarked, or tried out, without Google credentials or network access.
+Every request first waits for a configurable latency, modelling the round
+trip to Google, and is counted, so a benchmark can report how many requests
+each operation needed.
+'''
+import re
+import time
+from collections import Counter
+
+from booking_store import HEADERS
+
+CELL_PATTERN = re.compile(r'^([A-Z]*)(\d*)$')
+
+
+def parse_cell(cell):
+    '''
+    Converts an A1 cell reference to 1-based row and column numbers.
+
+    Args:
+    cell (str): The reference, such as "B3", "C" for a whole column or "4"
+    for a whole row.
+
+    Returns:
+    tuple: The row and column, either of which is None if the reference
+    leaves it open.
+
+    Raises:
+    ValueError: If the reference is not in A1 notation.
+    '''
+    match = CELL_PATTERN.match(cell.split('!')[-1])
+    if not match or not cell:
+        raise ValueError(f"'{cell}' is not an A1 cell reference")
+    letters, digits = match.groups()
+    col = 0
+    for letter in letters:
+        col = col * 26 + ord(letter) - 64
+    return (int(digits) if digits else None), (col or None)
+
+
+class FakeCell:
+    '''
+    A found cell, like a gspread Cell.
+    '''
+
+    def __init__(self, row, col, value):
+        self.row = row
+        self.col = col
+        self.value = value
+
+
+class FakeResponse:
+    '''
+    A response to a FakeClient request, like a requests Response.
+    '''
+
+    def __init__(self, body):
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+class FakeClient:
+    '''
+    The client a FakeWorksheet was opened with, answering the Drive metadata
+    requests the SheetsBackend makes for the spreadsheet's version.
+    '''
+
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+
+    def request(self, method, endpoint, params=None, **kwargs):
+        self.worksheet._request('client.request')
+        fields = (params or {}).get('fields', '')
+        version = str(self.worksheet.spreadsheet.version)
+        return FakeResponse({field: version for field in fields.split(',')
+                             if field == 'version'})
+
+
+class FakeSpreadsheet:
+    '''
+    The spreadsheet holding a FakeWorksheet, for its Drive metadata and
+    spreadsheet-level batch updates.
+
+    Like gspread's, lastUpdateTime is the time the spreadsheet was opened
+    at and never changes, while the Drive version fetched through the
+    client goes up with every change.
+    '''
+
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+        self.id = 'fake-spreadsheet'
+        self.client = worksheet.client
+        self.lastUpdateTime = '0'
+        self.version = 1
+
+    def batch_update(self, body):
+        self.worksheet._request('spreadsheet.batch_update')
+        for request in body.get('requests', []):
+            rows = request['deleteDimension']['range']
+            del self.worksheet.rows[rows['startIndex']:rows['endIndex']]
+        self.worksheet._changed()
+
+
+class FakeWorksheet:
+    '''
+    An in-memory worksheet.
+
+    Args:
+    rows (list): The worksheet's rows, including the header row. Defaults to
+    just the HEADERS.
+    latency (float): Seconds every request waits before it is answered.
+    '''
+
+    def __init__(self, rows=None, latency=0.0):
+        self.rows = [list(row) for row in rows] if rows else [list(HEADERS)]
+        self.latency = latency
+        self.id = 0
+        self.title = 'bookings-data'
+        self.client = FakeClient(self)
+        self.spreadsheet = FakeSpreadsheet(self)
+        # requests made, by method name
+        self.requests = Counter()
+
+    # READS
+
+    def get_all_values(self):
+        self._request('get_all_values')
+        return [list(row) for row in self.rows]
+
+    def get_values(self, range_name):
+        self._request('get_values')
+        return self._range(range_name)
+
+    def batch_get(self, ranges):
+        self._request('batch_get')
+        return [self._range(range_name) for range_name in ranges]
+
+    def col_values(self, col):
+        self._request('col_values')
+        values = [row[col - 1] if len(row) >= col else '' for row in self.rows]
+        # The worksheet does not return empty cells at the end
+        while values and values[-1] == '':
+            values.pop()
+        return values
+
+    def row_values(self, row):
+        self._request('row_values')
+        return list(self.rows[row - 1]) if row <= len(self.rows) else []
+
+    def find(self, query, in_row=None, in_column=None):
+        self._request('find')
+        for row_number, row in enumerate(self.rows, start=1):
+            if in_row is not None and row_number != in_row:
+                continue
+            for col_number, value in enumerate(row, start=1):
+                if in_column is not None and col_number != in_column:
+                    continue
+                if value == query:
+                    return FakeCell(row_number, col_number, value)
+        return None
+
+    # WRITES
+
+    def append_row(self, values, **kwargs):
+        self._request('append_row')
+        self.rows.append([str(value) for value in values])
+        self._changed()
+
+    def append_rows(self, values, **kwargs):
+        self._request('append_rows')
+        self.rows.extend([str(value) for value in row] for row in values)
+        self._changed()
+
+    def update(self, range_name, values=None, **kwargs):
+        self._request('update')
+        self._write(range_name, values)
+        self._changed()
+
+    def update_cell(self, row, col, value):
+        self._request('update_cell')
+        self._write_cell(row, col, value)
+        self._changed()
+
+    def batch_update(self, data, **kwargs):
+        self._request('batch_update')
+        for update in data:
+            self._write(update['range'], update['values'])
+        self._changed()
+
+    def delete_rows(self, start_index, end_index=None):
+        self._request('delete_rows')
+        del self.rows[start_index - 1:(end_index or start_index)]
+        self._changed()
+
+    def clear(self):
+        self._request('clear')
+        self.rows = []
+        self._changed()
+
+    # HELPERS
+
+    def request_count(self):
+        '''
+        Returns the total number of requests made so far.
+        '''
+        return sum(self.requests.values())
+
+    def _request(self, method):
+        self.requests[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _changed(self):
+        self.spreadsheet.version += 1
+
+    def _range(self, range_name):
+        first, _, last = range_name.partition(':')
+        first_row, first_col = parse_cell(first)
+        last_row, last_col = parse_cell(last or first)
+        first_row = first_row or 1
+        first_col = first_col or 1
+        last_row = last_row or len(self.rows)
+        values = []
+        for row in self.rows[first_row - 1:last_row]:
+            cells = row[first_col - 1:last_col]
+            # The worksheet does not return empty cells at the end of a row
+            while cells and cells[-1] == '':
+                cells.pop()
+            values.append(cells)
+        # nor empty rows at the end of the range
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def _write(self, range_name, values):
+        row, col = parse_cell(range_name.partition(':')[0])
+        for row_offset, row_values in enumerate(values):
+            for col_offset, value in enumerate(row_values):
+                self._write_cell(row + row_offset, col + col_offset, value)
+
+    def _write_cell(self, row, col, value):
+        while len(self.rows) < row:
+            self.rows.append([])
+        cells = self.rows[row - 1]
+        cells.extend([''] * (col - len(cells)))
+        cells[col - 1] = str(value)
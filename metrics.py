@@ -0,0 +1,323 @@
+'''
+Per-operation latency metrics.
+
+Every storage backend request, menu action, table render and UI pause is
+timed and counted, so a slow session shows where its time went. Each
+operation keeps its most recent timings, for the p50, p95 and p99
+latencies, and the rows and bytes of cell text it sent and received.
+
+Time spent waiting for the user to type is left out of the menu actions'
+latencies, so they show only the app's own time.
+
+The metrics are shown on the hidden admin screen (type "admin" at the Main
+Menu). If KENNEL_METRICS is set to a file name they are also written as
+JSON each time the user chooses Exit at the Main Menu, and when the app or
+a session server session ends by itself. "{pid}" in the name is replaced
+with the process id, so the session server's sessions each write their own
+file. The web terminal kills the app when the browser disconnects, so a
+session closed that way only leaves the metrics written at its last Exit.
+
+The admin screen can also start and stop a cProfile capture for the rest of
+the session, saved to KENNEL_PROFILE (default kennel_mate.prof), which can
+be read with "python3 -m pstats kennel_mate.prof".
+'''
+import os
+import json
+import time
+import cProfile
+import datetime
+import threading
+import functools
+import contextlib
+from collections import deque
+
+METRICS_FILE = os.environ.get('KENNEL_METRICS', '')
+PROFILE_FILE = os.environ.get('KENNEL_PROFILE', 'kennel_mate.prof')
+
+# The number of recent timings each operation keeps for its percentiles
+RECENT_TIMINGS = 10000
+
+PERCENTILES = [50, 95, 99]
+
+
+def percentile(timings, percent):
+    '''
+    Returns a percentile of some timings, by the nearest rank.
+
+    Args:
+    timings (list): The timings, sorted.
+    percent (int): The percentile, such as 95.
+
+    Returns:
+    float: The timing, or 0 if there are none.
+    '''
+    if not timings:
+        return 0.0
+    rank = max(1, -(-len(timings) * percent // 100))
+    return timings[rank - 1]
+
+
+def rows_and_bytes(rows):
+    '''
+    Measures rows of cells sent to or received from a storage backend.
+
+    Args:
+    rows (list): The rows.
+
+    Returns:
+    tuple: The number of rows and the bytes of cell text in them.
+    '''
+    return len(rows), sum(len(str(cell).encode()) for row in rows
+                          for cell in row)
+
+
+class Operation:
+    '''
+    The metrics recorded for one kind of operation.
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.longest = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.recent = deque(maxlen=RECENT_TIMINGS)
+
+    def summary(self):
+        '''
+        Returns the operation's metrics, with its latencies in milliseconds.
+        '''
+        recent = sorted(self.recent)
+        summary = {
+            'count': self.count,
+            'errors': self.errors,
+            'total_ms': round(self.total * 1000, 3),
+        }
+        for percent in PERCENTILES:
+            summary[f'p{percent}_ms'] = round(
+                percentile(recent, percent) * 1000, 3)
+        summary['max_ms'] = round(self.longest * 1000, 3)
+        summary['rows'] = self.rows
+        summary['bytes'] = self.bytes
+        return summary
+
+
+class Metrics:
+    '''
+    Records how long each operation takes, and how often.
+
+    Args:
+    clock (callable): Returns the time in seconds, for tests.
+    '''
+
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._operations = {}
+        # Seconds each thread has spent waiting for the user to type
+        self._waiting = threading.local()
+        self.started = datetime.datetime.now()
+        self.profiler = None
+
+    def record(self, name, seconds, rows=0, size=0, error=False):
+        '''
+        Records one run of an operation.
+
+        Args:
+        name (str): The operation, such as "backend.load".
+        seconds (float): How long it took.
+        rows (int): The number of rows it sent or received.
+        size (int): The bytes of cell text it sent or received.
+        error (bool): True if it raised an error.
+        '''
+        with self._lock:
+            operation = self._operations.get(name)
+            if operation is None:
+                operation = self._operations[name] = Operation()
+            operation.count += 1
+            operation.errors += error
+            operation.total += seconds
+            operation.longest = max(operation.longest, seconds)
+            operation.rows += rows
+            operation.bytes += size
+            operation.recent.append(seconds)
+
+    @contextlib.contextmanager
+    def timed(self, name):
+        '''
+        Times the code run inside the with statement as an operation,
+        leaving out any time spent waiting for the user to type.
+
+        Args:
+        name (str): The operation.
+        '''
+        started = self._clock()
+        waited = self.waited()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.record(name, self._clock() - started -
+                        (self.waited() - waited), error=error)
+
+    def instrument(self, name):
+        '''
+        Returns a decorator that times every call of a function.
+
+        Args:
+        name (str): The operation.
+        '''
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timed(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @contextlib.contextmanager
+    def waiting_for_user(self):
+        '''
+        Marks the code run inside the with statement as waiting for the
+        user, so it is left out of the operations being timed.
+        '''
+        started = self._clock()
+        try:
+            yield
+        finally:
+            self._waiting.seconds = self.waited() + self._clock() - started
+
+    def waited(self):
+        '''
+        Returns the seconds the current thread has spent waiting for the
+        user to type.
+        '''
+        return getattr(self._waiting, 'seconds', 0.0)
+
+    def report(self):
+        '''
+        Returns the metrics recorded so far.
+
+        Returns:
+        dict: Each operation's summary, by name.
+        '''
+        with self._lock:
+            return {name: operation.summary() for name, operation
+                    in sorted(self._operations.items())}
+
+    def reset(self):
+        '''
+        Forgets the metrics recorded so far.
+        '''
+        with self._lock:
+            self._operations = {}
+            self.started = datetime.datetime.now()
+
+    def dump(self, path=None):
+        '''
+        Writes the metrics to a JSON file.
+
+        Args:
+        path (str): The file, defaults to KENNEL_METRICS. "{pid}" is
+        replaced with the process id.
+
+        Returns:
+        str: The file written.
+        '''
+        path = (path or METRICS_FILE).replace('{pid}', str(os.getpid()))
+        report = {
+            'started': self.started.isoformat(timespec='seconds'),
+            'written': datetime.datetime.now().isoformat(timespec='seconds'),
+            'pid': os.getpid(),
+            'operations': self.report(),
+        }
+        with open(path, 'w', encoding='utf-8') as output:
+            json.dump(report, output, indent=2)
+        return path
+
+    def start_profiling(self):
+        '''
+        Starts a cProfile capture of the current thread.
+        '''
+        if self.profiler is None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stop_profiling(self, path=PROFILE_FILE):
+        '''
+        Stops the cProfile capture and saves it.
+
+        Args:
+        path (str): The file to save the capture to.
+
+        Returns:
+        str: The file written, or None if no capture was running.
+        '''
+        if self.profiler is None:
+            return None
+        self.profiler.disable()
+        self.profiler.dump_stats(path)
+        self.profiler = None
+        return path
+
+
+class InstrumentedBackend:
+    '''
+    Times every request made of a storage backend, and measures the rows it
+    sends and receives.
+
+    Args:
+    backend: The storage backend, such as a SheetsBackend.
+    metrics (Metrics): Where the requests are recorded, as "backend.load"
+    and so on.
+    '''
+
+    # The rows each request sends, from its arguments
+    SENT = {
+        'append': lambda row: [row],
+        'append_many': lambda rows: rows,
+        'update_rows': lambda updates, expected=None: [
+            row for _, row in updates],
+        'replace_all': lambda header, rows: rows,
+    }
+
+    # The rows each request receives, from its result
+    RECEIVED = {
+        'load': lambda result: result[1],
+        'load_page': lambda rows: rows,
+        'changes_since': lambda result: result[0] if result else [],
+    }
+
+    def __init__(self, backend, metrics):
+        self.backend = backend
+        self.metrics = metrics
+
+    def __getattr__(self, method):
+        func = getattr(self.backend, method)
+        if not callable(func) or method.startswith('_'):
+            return func
+
+        @functools.wraps(func)
+        def request(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                self.metrics.record(f'backend.{method}',
+                                    time.perf_counter() - started,
+                                    error=True)
+                raise
+            seconds = time.perf_counter() - started
+            rows = self.SENT[method](*args, **kwargs) \
+                if method in self.SENT else \
+                self.RECEIVED[method](result) if method in self.RECEIVED \
+                else []
+            count, size = rows_and_bytes(rows)
+            self.metrics.record(f'backend.{method}', seconds, count, size)
+            return result
+        return request
@@ -0,0 +1,132 @@
+'''
+Prefix and fuzzy search over dog and family names.
+
+NameIndex holds every distinct dog and family name in the bookings, in a
+sorted list for prefix searches and in a trigram index for fuzzy searches,
+so a partial name such as "Bel" or a misspelling such as "Bele" still finds
+"Belle" without scanning every booking. The BookingStore adds and removes
+names as bookings change, so the index never needs to be rebuilt.
+'''
+import bisect
+
+# Names sharing less than this proportion of their trigrams with the search
+# are not offered as fuzzy matches.
+MIN_SIMILARITY = 0.3
+
+# The most matches returned by a search
+SEARCH_LIMIT = 10
+
+
+def trigrams(name):
+    '''
+    Returns the set of three-letter sequences in a name, padded so that the
+    start and end of the name count for more.
+
+    Args:
+    name (str): A lower-cased name.
+
+    Returns:
+    set: The name's trigrams.
+    '''
+    padded = f'  {name} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+    '''
+    Sorted and trigram indexes over a set of lower-cased names.
+    '''
+
+    def __init__(self):
+        self._names = []
+        # name -> its trigrams
+        self._trigrams = {}
+        # trigram -> names containing it
+        self._by_trigram = {}
+
+    def __contains__(self, name):
+        return name in self._trigrams
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, name):
+        '''
+        Adds a name to the index, if it is not already there.
+        '''
+        if not name or name in self._trigrams:
+            return
+        bisect.insort(self._names, name)
+        grams = self._trigrams[name] = trigrams(name)
+        for gram in grams:
+            self._by_trigram.setdefault(gram, set()).add(name)
+
+    def remove(self, name):
+        '''
+        Removes a name from the index, if it is there.
+        '''
+        grams = self._trigrams.pop(name, None)
+        if grams is None:
+            return
+        del self._names[bisect.bisect_left(self._names, name)]
+        for gram in grams:
+            names = self._by_trigram[gram]
+            names.discard(name)
+            if not names:
+                del self._by_trigram[gram]
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        '''
+        Finds the names that best match a search.
+
+        An exact match is ranked first, then names starting with the search,
+        shortest first, then names sharing enough trigrams with the search,
+        most similar first.
+
+        Args:
+        query (str): The lower-cased search, such as "bel".
+        limit (int): The most names to return.
+
+        Returns:
+        list: The matching names, best match first.
+        '''
+        query = query.strip()
+        if not query:
+            return []
+
+        ranked = []
+        if query in self._trigrams:
+            ranked.append(query)
+
+        start = bisect.bisect_left(self._names, query)
+        prefixed = []
+        for name in self._names[start:]:
+            if not name.startswith(query):
+                break
+            if name != query:
+                prefixed.append(name)
+        prefixed.sort(key=lambda name: (len(name), name))
+        ranked.extend(prefixed[:limit])
+
+        if len(ranked) < limit:
+            ranked.extend(self._similar(query, set(ranked),
+                                        limit - len(ranked)))
+        return ranked[:limit]
+
+    def _similar(self, query, exclude, limit):
+        grams = trigrams(query)
+        shared = {}
+        for gram in grams:
+            for name in self._by_trigram.get(gram, ()):
+                shared[name] = shared.get(name, 0) + 1
+
+        scored = []
+        for name, count in shared.items():
+            if name in exclude:
+                continue
+            # Dice coefficient of the two sets of trigrams
+            similarity = 2 * count / (len(grams) + len(self._trigrams[name]))
+            if similarity >= MIN_SIMILARITY:
+                scored.append((-similarity, name))
+        scored.sort()
+        return [name for _, name in scored[:limit]]
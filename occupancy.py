@@ -0,0 +1,167 @@
+'''
+Kennel occupancy and capacity.
+
+Occupancy keeps the number of occupied kennels for every night in an array
+indexed by the number of days since its first date, so checking whether a
+stay fits, or searching a whole season for the next free dates, reads the
+counters directly rather than looking through the bookings. The BookingStore
+updates it whenever a booking is loaded, created, updated or deleted.
+
+A stay starts on the booking date and occupies a kennel for its number of
+nights, so a 3 night stay from 01-06-2023 occupies the nights of the 1st,
+2nd and 3rd and leaves on the 4th.
+'''
+import os
+import datetime
+from array import array
+
+# The number of kennels, which can be overridden with the KENNEL_CAPACITY
+# environment variable.
+KENNEL_CAPACITY = int(os.environ.get('KENNEL_CAPACITY', '20'))
+
+# How many days ahead next_free_date() searches, a little over a year
+SEARCH_DAYS = 400
+
+# The counter array grows by at least this many days at a time
+GROWTH_DAYS = 366
+
+
+class Occupancy:
+    '''
+    Per-night counts of occupied kennels.
+
+    Args:
+    capacity (int): The number of kennels.
+    '''
+
+    def __init__(self, capacity=KENNEL_CAPACITY):
+        self.capacity = capacity
+        # The date of self._counts[0], set by the first stay added
+        self._first = None
+        self._counts = array('i')
+
+    def add(self, booking):
+        '''
+        Adds a booking's stay to the counters.
+        '''
+        self._apply(booking.date, booking.nights, 1)
+
+    def remove(self, booking):
+        '''
+        Takes a booking's stay away from the counters.
+        '''
+        self._apply(booking.date, booking.nights, -1)
+
+    def occupied(self, date):
+        '''
+        Returns the number of kennels occupied on the night of a date.
+        '''
+        if self._first is None:
+            return 0
+        day = (date - self._first).days
+        if 0 <= day < len(self._counts):
+            return self._counts[day]
+        return 0
+
+    def nights_between(self, first, last):
+        '''
+        Returns the occupied nights between two dates, read straight from
+        the counters, so a stay of several nights is counted on each of
+        its nights rather than only on its booking date.
+
+        Args:
+        first (datetime.date): The first night, inclusive.
+        last (datetime.date): The last night, inclusive.
+
+        Returns:
+        list: (date, kennels occupied) pairs for the nights with at least
+        one kennel occupied, in date order.
+        '''
+        if self._first is None:
+            return []
+        start = max((first - self._first).days, 0)
+        end = min((last - self._first).days + 1, len(self._counts))
+        return [(self._first + datetime.timedelta(days=day),
+                 self._counts[day])
+                for day in range(start, end) if self._counts[day]]
+
+    def free(self, date):
+        '''
+        Returns the number of kennels free on the night of a date.
+        '''
+        return max(self.capacity - self.occupied(date), 0)
+
+    def available(self, date, nights=1, excluding=None):
+        '''
+        Checks whether a kennel is free for every night of a stay.
+
+        Args:
+        date (datetime.date): The first night of the stay.
+        nights (int): The number of nights.
+        excluding (Booking): A booking whose own stay should not count,
+        such as the booking being changed.
+
+        Returns:
+        bool: True if the stay fits.
+        '''
+        for offset in range(nights):
+            night = date + datetime.timedelta(days=offset)
+            occupied = self.occupied(night)
+            if excluding is not None and \
+                    excluding.date <= night < excluding.end_date:
+                occupied -= 1
+            if occupied >= self.capacity:
+                return False
+        return True
+
+    def next_free_date(self, date, nights=1, excluding=None,
+                       within=SEARCH_DAYS):
+        '''
+        Finds the first date, on or after a date, with a kennel free for
+        every night of a stay.
+
+        Args:
+        date (datetime.date): The earliest first night.
+        nights (int): The number of nights.
+        excluding (Booking): A booking whose own stay should not count.
+        within (int): How many days ahead to search.
+
+        Returns:
+        datetime.date: The first night of the earliest stay that fits, or
+        None if there is none within the search.
+        '''
+        run_start = date
+        run_length = 0
+        for offset in range(within + nights):
+            night = date + datetime.timedelta(days=offset)
+            if self.available(night, 1, excluding):
+                run_length += 1
+                if run_length == nights:
+                    return run_start
+            else:
+                run_start = night + datetime.timedelta(days=1)
+                run_length = 0
+                if (run_start - date).days > within:
+                    break
+        return None
+
+    def _apply(self, date, nights, change):
+        self._cover(date, nights)
+        start = (date - self._first).days
+        for day in range(start, start + nights):
+            self._counts[day] += change
+
+    def _cover(self, date, nights):
+        '''
+        Grows the counter array so it covers every night of a stay.
+        '''
+        if self._first is None:
+            self._first = date
+        if date < self._first:
+            extra = max((self._first - date).days, GROWTH_DAYS)
+            self._counts = array('i', [0] * extra) + self._counts
+            self._first -= datetime.timedelta(days=extra)
+        end = (date - self._first).days + nights
+        if end > len(self._counts):
+            extra = max(end - len(self._counts), GROWTH_DAYS)
+            self._counts.extend([0] * extra)
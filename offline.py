@@ -0,0 +1,193 @@
+'''
+Offline working from a local snapshot of the bookings.
+
+Every time the bookings are loaded from the storage backend a copy is saved
+to a local snapshot file. ConnectingBackend connects to the storage backend
+the first time it is needed, and if the backend cannot be reached, such as
+when the network is down or the API is overloaded, it serves the bookings
+from the snapshot instead, with every change recorded in the journal since
+the snapshot was taken applied on top. Changes made while offline wait in
+the journal and are written by the WriteBehindBackend once the backend can
+be reached again.
+
+The snapshot is kept in the KENNEL_SNAPSHOT file (default
+.kennel_mate_snapshot.json).
+'''
+import os
+import json
+import time
+
+from booking import ConflictError
+from sheets_governor import is_transient
+from write_behind import apply_entries
+
+# The snapshot, unless the KENNEL_SNAPSHOT environment variable names another
+# file when the snapshot is opened
+SNAPSHOT_FILE = '.kennel_mate_snapshot.json'
+
+# Seconds after a failed request before the storage backend is tried again
+RECONNECT_DELAY = 30
+
+
+class Snapshot:
+    '''
+    A local copy of the bookings, as last loaded from the storage backend.
+
+    Args:
+    path (str): The snapshot file, defaults to KENNEL_SNAPSHOT.
+    '''
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get('KENNEL_SNAPSHOT', SNAPSHOT_FILE)
+
+    def save(self, header, rows):
+        '''
+        Replaces the snapshot. The new snapshot is written to a temporary
+        file first, so a crash never leaves a half-written snapshot.
+        '''
+        temporary = f'{self.path}.{os.getpid()}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as snapshot:
+            json.dump({'header': header, 'rows': rows}, snapshot)
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(temporary, self.path)
+
+    def load(self):
+        '''
+        Reads the snapshot.
+
+        Returns:
+        tuple: The header row and the booking rows, or None if there is no
+        usable snapshot.
+        '''
+        try:
+            with open(self.path, encoding='utf-8') as snapshot:
+                saved = json.load(snapshot)
+            return saved['header'], saved['rows']
+        except (OSError, ValueError, KeyError):
+            return None
+
+
+class ConnectingBackend:
+    '''
+    Connects to a storage backend on first use, and serves the snapshot while
+    the backend cannot be reached. Once a request has failed, the backend is
+    not tried again for RECONNECT_DELAY seconds, so views are not held up by
+    requests that will fail. Only network errors and the errors the Sheets
+    governor retries count as the backend being unreachable; any other
+    error, such as missing credentials or permission, is raised, as
+    working from the snapshot would not fix it.
+
+    Args:
+    connect (callable): Opens the storage backend, such as a SheetsBackend.
+    snapshot (Snapshot): The local copy of the bookings.
+    journal (WriteJournal): The journal of changes, so changes already
+    written since the snapshot was taken are included when offline.
+    '''
+
+    def __init__(self, connect, snapshot, journal):
+        self._connect = connect
+        self.snapshot = snapshot
+        self.journal = journal
+        self.backend = None
+        self.offline = False
+        self._failed_at = None
+        # Backends map booking numbers to rows when they load, which must be
+        # done before they are written to
+        self._loaded = False
+
+    def load(self):
+        mark = self.journal.mark()
+        try:
+            header, rows = self._call('load')
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            saved = self.snapshot.load()
+            if saved is None:
+                raise
+            header, rows = saved
+            # Changes written since the snapshot was taken; the
+            # WriteBehindBackend adds those still waiting to be written
+            return header, apply_entries(
+                rows, self.journal.entries(acknowledged=True))
+        self._loaded = True
+        self.snapshot.save(header, rows)
+        # The new snapshot holds every change acknowledged before the load
+        self.journal.compact(mark)
+        return header, rows
+
+    def load_page(self, offset, limit):
+        try:
+            return self._call('load_page', offset, limit)
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            return self.load()[1][offset:offset + limit]
+
+    def count(self):
+        try:
+            return self._call('count')
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            return len(self.load()[1])
+
+    def version(self):
+        return self._call('version')
+
+    def changes_since(self, revision):
+        return self._call('changes_since', revision)
+
+    def reset_connections(self):
+        if self.backend is not None:
+            self.backend.reset_connections()
+
+    def append(self, row):
+        self._write('append', row)
+
+    def append_many(self, rows):
+        self._write('append_many', rows)
+
+    def update_rows(self, updates, expected=None):
+        return self._write('update_rows', updates, expected)
+
+    def delete(self, booking_no, expected=None):
+        return self._write('delete', booking_no, expected)
+
+    def _write(self, method, *args):
+        if not self._loaded:
+            self.load()
+            if self.offline:
+                raise ConnectionError('The storage backend cannot be reached')
+        return self._call(method, *args)
+
+    def _call(self, method, *args):
+        '''
+        Makes a request to the storage backend, connecting to it first if
+        necessary, and records whether it could be reached.
+
+        Raises:
+        ConnectionError: If the backend failed too recently to try again.
+        ConflictError: If a booking being changed was changed elsewhere,
+        which does not count as the backend failing.
+        Any error raised by the backend. Only transient errors count as the
+        backend being unreachable.
+        '''
+        if self.offline and \
+                time.monotonic() - self._failed_at < RECONNECT_DELAY:
+            raise ConnectionError('The storage backend cannot be reached')
+        try:
+            if self.backend is None:
+                self.backend = self._connect()
+            result = getattr(self.backend, method)(*args)
+        except ConflictError:
+            self.offline = False
+            raise
+        except Exception as e:
+            if is_transient(e):
+                self.offline = True
+                self._failed_at = time.monotonic()
+            raise
+        self.offline = False
+        return result
@@ -5,15 +5,35 @@ handling date functions, regular expressions, presenting
 data in a table format on screen, and displaying colors for
 onscreen messages
 '''
-import os
-import datetime
 import time
-import re
-import gspread
-from tabulate import tabulate
-from termcolor import colored
-
-from google.oauth2.service_account import Credentials
+IMPORT_STARTED = time.perf_counter()
+
+import os  # noqa: E402
+import sys  # noqa: E402
+import atexit  # noqa: E402
+import argparse  # noqa: E402
+import datetime  # noqa: E402
+import threading  # noqa: E402
+from tabulate import tabulate  # noqa: E402
+from termcolor import colored  # noqa: E402
+
+from booking_store import (  # noqa: E402
+    BookingStore, DISPLAY_HEADERS)
+from booking_numbers import BookingNumberAllocator  # noqa: E402
+from booking import (  # noqa: E402
+    Booking, amount_to_pence, format_pence, parse_date, format_date,
+    parse_nights, validate_booking_date, validate_amount, ConflictError,
+    DATE_PATTERN)
+from backends import (  # noqa: E402
+    SheetsBackend, SQLiteBackend, SQLITE_PATH, migrate)
+from sheets_governor import SheetsGovernor  # noqa: E402
+from write_behind import WriteBehindBackend, WriteJournal  # noqa: E402
+from offline import ConnectingBackend, Snapshot  # noqa: E402
+from metrics import (  # noqa: E402
+    Metrics, InstrumentedBackend, METRICS_FILE, PROFILE_FILE)
+import console  # noqa: E402
+import bulk_bookings  # noqa: E402
+from console import clear_screen  # noqa: E402
 
 SCOPE = [
     "https://www.googleapis.com/auth/spreadsheets",
@@ -21,12 +41,437 @@ SCOPE = [
     "https://www.googleapis.com/auth/drive"
     ]
 
-CREDS = Credentials.from_service_account_file('creds.json')
-SCOPED_CREDS = CREDS.with_scopes(SCOPE)
-GSPREAD_CLIENT = gspread.authorize(SCOPED_CREDS)
-SHEET = GSPREAD_CLIENT.open('p3-kennel-mate-data')
+# Where the bookings are stored: 'sheets' for the Google worksheet, or
+# 'sqlite' for a local database file, which needs no network access or
+# Google credentials.
+BACKENDS = ['sheets', 'sqlite']
+STORAGE_BACKEND = os.environ.get('KENNEL_BACKEND', 'sheets')
+SQLITE_DB = os.environ.get('KENNEL_SQLITE_PATH', SQLITE_PATH)
+
+# Every booking change is kept in a local journal until it has been saved,
+# so changes made while the storage backend cannot be reached are saved once
+# it can. Set KENNEL_WRITE_BEHIND=1 to save changes in the background, so
+# the operator never waits for the storage backend.
+WRITE_BEHIND = os.environ.get('KENNEL_WRITE_BEHIND', '') not in ('', '0')
+
+# The longest a change waits to be saved before the app moves on, when
+# write-behind is off
+WRITE_WAIT = 60
+
+# The longest the app waits for changes to be saved when the user exits
+EXIT_SAVE_WAIT = 30
+
+# How many times opening the worksheet is retried, kept low so the app
+# starts from its local snapshot quickly when the network is down
+OPEN_RETRIES = 1
+
+# How quickly the screens move on: 'normal' keeps the short pauses that let
+# the user read each screen before the next one appears, 'fast' removes them
+# for experienced operators and scripted runs. Can also be set with --fast.
+PACES = ['normal', 'fast']
+PACE = os.environ.get('KENNEL_PACE', 'normal')
+PACING_STATS = {'pauses': 0, 'paused': 0.0, 'skipped': 0.0}
+
+# Set KENNEL_TIMING=1 to print how long the app takes to import, show its
+# first prompt and connect to the storage backend.
+SHOW_TIMINGS = os.environ.get('KENNEL_TIMING', '') not in ('', '0')
+STARTUP_TIMINGS = {}
+
+# Every Google Sheets request goes through this governor, which keeps within
+# the Sheets quota and retries requests that fail for a transient reason.
+sheets_governor = SheetsGovernor()
+
+# Every storage backend request, menu action, table and pause is timed, and
+# shown on the hidden admin screen. Set KENNEL_METRICS to a file name to
+# write the metrics there when the user chooses Exit and when the app ends.
+metrics = Metrics()
+tabulate = metrics.instrument('ui.tabulate')(tabulate)
+
+
+def save_metrics():
+    '''
+    Saves any cProfile capture, and writes the metrics to KENNEL_METRICS if
+    it is set. Called when the user chooses Exit, as the web terminal kills
+    the app rather than letting it exit, and when the app ends.
+    '''
+    metrics.stop_profiling(PROFILE_FILE)
+    if METRICS_FILE:
+        metrics.dump()
+
+
+atexit.register(save_metrics)
+
+# Typed at the Main Menu to reach the hidden admin screen, which shows the
+# metrics and can save them to DEFAULT_METRICS_FILE if KENNEL_METRICS is
+# not set
+ADMIN_CHOICE = 'admin'
+DEFAULT_METRICS_FILE = 'kennel_mate_metrics.json'
+METRICS_HEADERS = ['Operation', 'Count', 'Errors', 'p50 ms', 'p95 ms',
+                   'p99 ms', 'Max ms', 'Rows', 'Bytes']
+
+
+def open_worksheet():
+    '''
+    Authorizes with the Google service account and opens the bookings
+    worksheet.
+
+    gspread and google-auth are imported here rather than at the top of the
+    file, as they are slow to import and are not needed until the worksheet
+    is opened.
+
+    Returns:
+    gspread.Worksheet: The bookings-data worksheet.
+    '''
+    import gspread
+    from google.oauth2.service_account import Credentials
+
+    creds = Credentials.from_service_account_file('creds.json')
+    scoped_creds = creds.with_scopes(SCOPE)
+    gspread_client = gspread.authorize(scoped_creds)
+    sheet = sheets_governor.call(gspread_client.open, 'p3-kennel-mate-data',
+                                 retries=OPEN_RETRIES)
+    return sheets_governor.call(sheet.worksheet, 'bookings-data',
+                                retries=OPEN_RETRIES)
+
+
+def open_backend(name):
+    '''
+    Opens one of the storage backends listed in BACKENDS.
+
+    Args:
+    name (str): Either "sheets" or "sqlite".
+
+    Returns:
+    The storage backend.
+
+    Raises:
+    ValueError: If the name is not a known backend.
+    '''
+    if name == 'sheets':
+        return SheetsBackend(open_worksheet(), sheets_governor)
+    if name == 'sqlite':
+        return SQLiteBackend(SQLITE_DB)
+    raise ValueError(f"Unknown storage backend '{name}', please choose "
+                     f"one of: {', '.join(BACKENDS)}")
+
+
+# CONNECTION
+
+# All reads are served from the booking cache, which is loaded once per
+# session and kept up to date as bookings are created, updated and deleted.
+# It is created on first use by get_store(), so importing this module does
+# not connect to Google.
+_booking_store = None
+_booking_store_lock = threading.Lock()
+# Held while the booking cache is first loaded, and set once it has been, so
+# a screen that does not need every booking need not wait for the load
+_booking_store_loading = threading.Lock()
+_booking_store_loaded = threading.Event()
+_connect_thread = None
+
+# A session replayed on its own thread, such as by the session driver, can
+# have its own booking cache, as each front-desk terminal would
+_session = threading.local()
+
+
+def get_store(load=True):
+    '''
+    Returns the booking cache, connecting to the storage backend and loading
+    the bookings the first time it is called. If a background connection is
+    already in progress this waits for it instead of connecting again.
+
+    If the storage backend cannot be reached the bookings are loaded from
+    the local snapshot, and changes are kept in the journal until they can
+    be saved.
+
+    Args:
+    load (bool): False to return the cache without waiting for the bookings
+    to be loaded, for a screen that only reads a page of bookings, which an
+    unloaded cache reads from the backend.
+
+    Returns:
+    BookingStore: The booking cache.
+    '''
+    global _booking_store
+    store = getattr(_session, 'store', None)
+    if store is not None:
+        return store
+    with _booking_store_lock:
+        if _booking_store is None:
+            _booking_store = make_store(
+                lambda: open_backend(STORAGE_BACKEND))
+        store = _booking_store
+    if load and not _booking_store_loaded.is_set():
+        with _booking_store_loading:
+            if not _booking_store_loaded.is_set():
+                store.ensure_fresh()
+                _booking_store_loaded.set()
+                STARTUP_TIMINGS.setdefault(
+                    'backend ready', time.perf_counter() - IMPORT_STARTED)
+    return store
+
+
+def make_store(connect, journal=None, snapshot=None):
+    '''
+    Builds a booking cache over a storage backend, with the journal of
+    changes and the local snapshot in between.
+
+    Args:
+    connect (callable): Opens the storage backend.
+    journal (WriteJournal): The journal, defaults to KENNEL_JOURNAL.
+    snapshot (Snapshot): The snapshot, defaults to KENNEL_SNAPSHOT.
+
+    Returns:
+    BookingStore: The booking cache, not yet loaded.
+    '''
+    def connect_with_metrics():
+        with metrics.timed('backend.connect'):
+            backend = connect()
+        return InstrumentedBackend(backend, metrics)
+
+    def renumber(booking_no, highest):
+        return renumber_conflicting_booking(store, booking_no, highest)
+
+    journal = journal or WriteJournal()
+    backend = ConnectingBackend(connect_with_metrics, snapshot or Snapshot(),
+                                journal)
+    backend = WriteBehindBackend(
+        backend, journal, write_wait=None if WRITE_BEHIND else WRITE_WAIT,
+        on_conflict=renumber)
+    store = BookingStore(backend)
+    return store
+
+
+def use_store(store, this_thread=False):
+    '''
+    Makes a booking cache the one every screen uses, such as one over a
+    FakeWorksheet for a benchmark.
+
+    Args:
+    store (BookingStore): The booking cache.
+    this_thread (bool): True to use the cache only for the session running
+    on the current thread, such as one replayed by the session driver.
+    '''
+    global _booking_store
+    if this_thread:
+        _session.store = store
+        return
+    with _booking_store_lock:
+        _booking_store = store
+        _booking_store_loaded.clear()
+
+
+def session_store():
+    '''
+    Returns the booking cache of the current thread's session, without
+    loading it, or None if it has not been made yet.
+    '''
+    return getattr(_session, 'store', None) or _booking_store
+
+
+def connect_in_background():
+    '''
+    Starts connecting to the storage backend on a background thread, so the
+    connection is made while the user reads the welcome screen. Any error is
+    left for get_store() to raise when the bookings are first needed.
+    '''
+    global _connect_thread
+    if session_store() is not None or \
+            (_connect_thread is not None and _connect_thread.is_alive()):
+        return
+
+    def connect():
+        try:
+            get_store()
+        except Exception:
+            pass
+
+    _connect_thread = threading.Thread(target=connect, daemon=True)
+    _connect_thread.start()
+
+
+def renumber_conflicting_booking(store, booking_no, highest):
+    '''
+    Gives a booking made while offline a new booking number, when its
+    number has since been used for another booking, such as by another
+    computer. Called by the WriteBehindBackend while saving the booking.
+
+    Args:
+    store (BookingStore): The booking cache holding the booking.
+    booking_no (str): The booking's number, such as "B1005".
+    highest (int): The highest booking number in the storage backend.
+
+    Returns:
+    str: The new booking number, such as "B1012".
+    '''
+    # The allocator's high-water mark already covers every number handed
+    # out on this computer
+    new_booking_no = BookingNumberAllocator(lambda: highest).next_number()
+    store.renumber(booking_no, new_booking_no)
+    return new_booking_no
+
+
+def pending_writes():
+    '''
+    Returns the number of booking changes waiting to be saved, such as in
+    the background or while the storage backend cannot be reached.
+    '''
+    store = session_store()
+    if store is None or not isinstance(store.backend, WriteBehindBackend):
+        return 0
+    return store.backend.pending_count()
+
+
+def working_offline():
+    '''
+    Returns True if the storage backend cannot be reached, so bookings are
+    being shown from the local snapshot and changes saved in the journal.
+    '''
+    store = session_store()
+    if store is None or not isinstance(store.backend, WriteBehindBackend):
+        return False
+    backend = store.backend
+    return backend.offline or backend.last_error is not None
+
 
-bookings = SHEET.worksheet('bookings-data')
+def report_saved_locally():
+    '''
+    Tells the user when a change they have just made could only be saved
+    on this computer.
+    '''
+    if working_offline() and pending_writes():
+        show(colored("\033[1mSaved on this computer only. It will be saved "
+                     "to the bookings sheet\nwhen the connection "
+                     "returns.\033[0m", 'yellow'))
+
+
+def save_pending_writes():
+    '''
+    Waits for the booking changes made in the background to be saved before
+    the session ends. Changes that cannot be saved in time stay in the
+    journal and are saved when the app next starts.
+    '''
+    waiting = pending_writes()
+    if not waiting:
+        return
+    show(colored(f"\033[1mSaving {waiting} booking change(s)...\033[0m",
+                 'magenta'))
+    backend = session_store().backend
+    if working_offline() or not backend.wait(EXIT_SAVE_WAIT):
+        show(colored(f"\033[1m{backend.pending_count()} change(s) could not "
+                     f"be saved yet ({backend.last_error}). They will be "
+                     "saved when Kennel-Mate next starts.\033[0m", 'red'))
+
+
+def report_timings():
+    '''
+    Prints the startup timings recorded so far, how much time has been
+    spent in UI pauses, and the Google Sheets request counters, if
+    KENNEL_TIMING is set.
+    '''
+    if not SHOW_TIMINGS:
+        return
+    report = ', '.join(f'{name}: {seconds * 1000:.0f}ms'
+                       for name, seconds in STARTUP_TIMINGS.items())
+    show(colored(f"Startup timings - {report}", 'magenta'), file=sys.stderr)
+    show(colored(f"Pacing ({PACE}) - {PACING_STATS['pauses']} pauses, "
+                 f"{PACING_STATS['paused']:.1f}s paused, "
+                 f"{PACING_STATS['skipped']:.1f}s skipped", 'magenta'),
+         file=sys.stderr)
+    requests = sheets_governor.report()
+    if requests['requests']:
+        show(colored(f"Sheets requests - {requests['requests']} made, "
+                     f"{requests['last_minute']} in the last minute "
+                     f"(peak {requests['peak_per_minute']}, quota "
+                     f"{requests['quota_per_minute']:.0f}), "
+                     f"{requests['retries']} retried, "
+                     f"{requests['gave_up']} failed, "
+                     f"{requests['coalesced']} coalesced, "
+                     f"{requests['throttled_seconds']:.1f}s throttled, "
+                     f"{requests['backoff_seconds']:.1f}s backing off",
+                     'magenta'), file=sys.stderr)
+    store = session_store()
+    if store is not None and isinstance(store.backend, WriteBehindBackend):
+        backend = store.backend
+        show(colored(f"Write-behind - {backend.written} saved, "
+                     f"{backend.pending_count()} waiting, "
+                     f"{backend.failed_attempts} failed attempts", 'magenta'),
+             file=sys.stderr)
+
+
+# PACING
+
+def set_pace(pace):
+    '''
+    Sets how quickly the screens move on.
+
+    Args:
+    pace (str): "normal" to keep the UI pauses, or "fast" to remove them.
+
+    Raises:
+    ValueError: If the pace is not one of PACES.
+    '''
+    global PACE
+    if pace not in PACES:
+        raise ValueError(f"Unknown pace '{pace}', please choose one of: "
+                         f"{', '.join(PACES)}")
+    PACE = pace
+
+
+def pause(seconds):
+    '''
+    Pauses so the user can read the screen before the next one appears.
+    Every UI delay goes through here, so "fast" pacing removes them all.
+
+    Args:
+    seconds (float): How long to pause at normal pace.
+    '''
+    PACING_STATS['pauses'] += 1
+    if PACE == 'fast':
+        PACING_STATS['skipped'] += seconds
+        return
+    PACING_STATS['paused'] += seconds
+    with metrics.timed('ui.pause'):
+        time.sleep(seconds)
+
+
+# CONSOLE
+
+# Every prompt and message goes through prompt() and show(), rather than the
+# built-in input() and print(), so it reaches the current session's console.
+
+def prompt(text=''):
+    '''
+    Reads a line typed by the user at the current session's console, which
+    is the terminal unless the session is being replayed from a script.
+    Every prompt goes through here, so the time spent waiting for the user
+    is left out of the menu actions' metrics.
+
+    Args:
+    text (str): Printed before reading the line.
+
+    Returns:
+    str: The line, without its newline.
+    '''
+    with metrics.waiting_for_user():
+        return console.current().input(text)
+
+
+def show(*args, **kwargs):
+    '''
+    Prints to the current session's console, which is the terminal unless
+    the session is being replayed from a script. Takes the same arguments
+    as the built-in print().
+    '''
+    console.current().print(*args, **kwargs)
+
+
+# Booking numbers are allocated from a locked local high-water mark, which
+# also takes account of the highest booking number in the booking cache.
+booking_allocator = BookingNumberAllocator(
+    lambda: get_store().max_booking_number())
+
+STARTUP_TIMINGS['imports'] = time.perf_counter() - IMPORT_STARTED
 
 
 # UTILITY FUNCTIONS
@@ -55,34 +500,115 @@ def get_booking_date():
     Raises:
     ValueError: If the input is not a valid date in the format "DD-MM-YYYY".
     '''
-    date_pattern = re.compile(r'^\d{2}-\d{2}-\d{4}$')
-
     while True:
-        print(colored("\033[1m\nPlease enter the booking date as: "
-                      "DD-MM-YYYY\033[0m", 'yellow'))
-        booking_date = input()
-        if not date_pattern.match(booking_date):
-            print(colored("\033[1m\nInvalid date format, please try again as "
-                          "DD-MM-YYY.\n"
-                          "The day must be between 1 and 31,\n"
-                          "The month must be between 1 and 12,\n"
-                          "And the year must be a four-digit number\n\033[0m",
-                          'red'))
+        show(colored("\033[1m\nPlease enter the booking date as: "
+                     "DD-MM-YYYY\033[0m", 'yellow'))
+        booking_date = prompt()
+        if not DATE_PATTERN.match(booking_date):
+            show(colored("\033[1m\nInvalid date format, please try again as "
+                         "DD-MM-YYY.\n"
+                         "The day must be between 1 and 31,\n"
+                         "The month must be between 1 and 12,\n"
+                         "And the year must be a four-digit number\n\033[0m",
+                         'red'))
             continue
         try:
-            day, month, year = map(int, booking_date.split("-"))
-            date = datetime.date(year, month, day)
-            if date.month != month or date.day != day:
-                raise ValueError(colored("\033[1m\nInvalid date format, "
-                                         "please try again as DD-MM-YYY.\n"
-                                         "The day must be between 1 and 31,\n"
-                                         "The month must be between 1 and 12,"
-                                         "\nAnd the year must be a four-digit "
-                                         "number\n\033[0m", 'red'))
-            return booking_date
+            return validate_booking_date(booking_date)
 
         except ValueError as e:
-            print(colored(f"\033[1m\nInvalid date input: {e}\n\033[0m", 'red'))
+            show(colored(f"\033[1m\nInvalid date input: {e}\n\033[0m", 'red'))
+
+
+def get_nights():
+    '''
+    Prompts the user to enter the number of nights of a stay, which defaults
+    to 1 if the user just presses ENTER.
+
+    Returns:
+    int: The number of nights.
+    '''
+    while True:
+        show(colored("\033[1m\nPlease enter the number of nights, or press "
+                     "ENTER for 1:\033[0m", 'yellow'))
+        try:
+            return parse_nights(prompt())
+        except ValueError:
+            show(colored("\033[1mInvalid Input: The number of nights must "
+                         "be a whole number\nof at least 1. Please try "
+                         "again.\033[0m", 'red'))
+
+
+def get_stay(excluding=None):
+    '''
+    Prompts the user for the first night and the number of nights of a stay,
+    until a kennel is free for every night. If the kennels are full, the
+    next date with a kennel free for the whole stay is suggested.
+
+    Args:
+    excluding (Booking): The booking being changed, whose own stay does not
+    count against the kennels available.
+
+    Returns:
+    tuple: The booking date in the format "DD-MM-YYYY", and the number of
+    nights.
+    '''
+    occupancy = get_store().occupancy()
+    while True:
+        booking_date = get_booking_date()
+        nights = get_nights()
+        first_night = parse_date(booking_date)
+        if occupancy.available(first_night, nights, excluding):
+            return booking_date, nights
+
+        next_free = occupancy.next_free_date(first_night, nights, excluding)
+        show(colored(f"\033[1m\nAll {occupancy.capacity} kennels are booked "
+                     "for some of those nights.\033[0m", 'red'))
+        if next_free is None:
+            show(colored("\033[1mThere are no free dates for that stay in "
+                         "the next year.\033[0m", 'red'))
+        else:
+            show(colored(f"\033[1mThe next free date for {nights} night(s) "
+                         f"is {format_date(next_free)}.\033[0m", 'magenta'))
+
+
+def get_date_range():
+    '''
+    Prompts the user to choose this week, this month, or a range between two
+    dates entered as "DD-MM-YYYY".
+
+    Returns:
+    tuple: The first and last dates of the range, as datetime.date objects.
+    '''
+    show('[1] - This Week')
+    show('[2] - This Month')
+    show('[3] - Between Two Dates')
+    while True:
+        show(colored('\033[1m\nPlease choose a date range between [1] and '
+                     '[3]:\033[0m', 'yellow'))
+        range_choice = prompt()
+        if range_choice in ('1', '2', '3'):
+            break
+        show(colored('\033[1m\nInvalid input. Please enter a number '
+                     'between [1] and [3]\n\033[0m', 'red'))
+
+    today = datetime.date.today()
+    if range_choice == '1':
+        first = today - datetime.timedelta(days=today.weekday())
+        return first, first + datetime.timedelta(days=6)
+    if range_choice == '2':
+        first = today.replace(day=1)
+        next_month = (first + datetime.timedelta(days=32)).replace(day=1)
+        return first, next_month - datetime.timedelta(days=1)
+
+    while True:
+        show(colored("\033[1m\nFrom:\033[0m", 'magenta'))
+        first = parse_date(get_booking_date())
+        show(colored("\033[1m\nTo:\033[0m", 'magenta'))
+        last = parse_date(get_booking_date())
+        if last >= first:
+            return first, last
+        show(colored("\033[1m\nThe second date must not be before the "
+                     "first, please try again.\033[0m", 'red'))
 
 
 def increment_booking_number():
@@ -90,28 +616,16 @@ def increment_booking_number():
     Automatically generates and increments a sequential booking
     number starting with B1001.
 
-    Searches through the existing booking numbers in the first column of the
-    bookings sheet and finds the highest number that matches the pattern
-    "B<digits>". The function then increments that number by 1 to generate
-    the next booking number.
+    The next number is taken from the booking number allocator, which keeps a
+    high-water mark of the numbers already handed out, so the booking number
+    column does not need to be searched. The allocator locks its state while
+    a number is allocated, so two sessions never receive the same number.
 
     Returns:
     str: A string representing the next booking number in the format "Bxxxx",
     where "xxxx" is a sequence of four digits.
     '''
-    highest_num = 1000
-
-    booking_num_column = bookings.col_values(1)
-
-    for booking_num in booking_num_column:
-        match = re.match(r'^B(\d+)$', booking_num)
-        if match:
-            num = int(match.group(1))
-            if num > highest_num:
-                highest_num = num
-
-    next_num = highest_num + 1
-    return f'B{next_num}' if highest_num != 1000 else 'B1001'
+    return booking_allocator.next_number()
 
 
 def revenue_total(values):
@@ -120,14 +634,14 @@ def revenue_total(values):
     screen.
 
     The function takes a list of booking data, which should include the amount
-    charged for each booking in the format "£xxx.xx". It then extracts the
-    revenue values, calculates the sum of all revenues, and displays the result
-    on the screen in the format "Total Revenue: £xxx.xx".
+    charged for each booking in the format "xxx.xx". The amounts are added up
+    in whole pence, so the total is exact, and the result is displayed on the
+    screen in the format "Total Revenue: £xxx.xx".
 
     Args:
-    values (list): A list of booking data, from google sheets, where each item
-    is a list containing booking details including amount charged in the
-    format "£xxx.xx".
+    values (list): A list of booking data, where each item is a list
+    containing booking details including amount charged in the format
+    "xxx.xx".
 
     Returns:
     None
@@ -135,18 +649,7 @@ def revenue_total(values):
     Displays:
     Total Revenue on screen.
     '''
-    pattern = re.compile(r"\d+.\d{2}")
-    revenue_list = []
-    total = 0
-
-    for value in values:
-        match = pattern.findall(value[4])
-        if match:
-            revenue = float(match[0])
-            revenue_list.append(revenue)
-            total += revenue
-
-    print(colored(f"\033[1mTotal Revenue: £{total:.2f}\n\033[0m", 'magenta'))
+    display_revenue(sum(amount_to_pence(value[4]) for value in values))
 
 
 def bookings_counter(values):
@@ -163,10 +666,54 @@ def bookings_counter(values):
     Displays:
     The total number of bookings in the given list.
     '''
-    count_bookings = sum(isinstance(elem, list) for elem in values)
-    print("\n")
-    print(colored(f'\033[1mTotal Bookings: {count_bookings}\033[0m',
-                  'magenta'))
+    display_booking_count(len(values))
+
+
+def display_totals(totals):
+    '''
+    Displays a booking count and revenue total taken from the running
+    aggregates, without adding up the bookings again.
+
+    Args:
+    totals (tuple): The number of bookings and their revenue in pence.
+
+    Displays:
+    The Total Bookings and Total Revenue on screen.
+    '''
+    count_bookings, revenue_pence = totals
+    display_booking_count(count_bookings)
+    display_revenue(revenue_pence)
+
+
+def display_booking_count(count_bookings):
+    '''
+    Displays the total number of bookings.
+    '''
+    show("\n")
+    show(colored(f'\033[1mTotal Bookings: {count_bookings}\033[0m',
+                 'magenta'))
+
+
+def display_revenue(revenue_pence):
+    '''
+    Displays the total revenue, given in pence, as pounds.
+    '''
+    show(colored(f"\033[1mTotal Revenue: £{format_pence(revenue_pence)}\n"
+                 "\033[0m", 'magenta'))
+
+
+def display_group_totals(label, totals):
+    '''
+    Displays the booking count and revenue of a wider group of bookings, such
+    as a month or a family, taken from the running aggregates.
+
+    Args:
+    label (str): What the bookings have in common, such as "May 2023".
+    totals (tuple): The number of bookings and their revenue in pence.
+    '''
+    count_bookings, revenue_pence = totals
+    show(colored(f"\033[1m{label}: {count_bookings} booking(s), "
+                 f"£{format_pence(revenue_pence)}\n\033[0m", 'magenta'))
 
 
 def get_dogs_name():
@@ -182,21 +729,62 @@ def get_dogs_name():
     only white spaces.
     '''
     while True:
-        dogs_name = input(
+        dogs_name = prompt(
             colored("\033[1m\nPlease enter the Dog's name or the Family "
                     "name:\n\033[0m", 'yellow')).strip().title()
         if not dogs_name:
-            print(
-                colored(
-                    "\033[1mError: name cannot be empty or contain\n"
-                    "only white spaces. Please try again.\033[0m", 'red'))
+            show(
+               colored(
+                   "\033[1mError: name cannot be empty or contain\n"
+                   "only white spaces. Please try again.\033[0m", 'red'))
         else:
             break
     return dogs_name
 
 
+def choose_name_match(dogs_name):
+    '''
+    Offers the dog and family names that best match a name with no bookings,
+    such as a partial name like "Bel" or a misspelling like "Bele", and lets
+    the user choose one. A single match is chosen automatically.
+
+    Args:
+    dogs_name (str): The name that was searched for.
+
+    Returns:
+    str: The chosen name, or None if there are no matches or the user
+    chooses none of them.
+    '''
+    matches = get_store().search_names(dogs_name)
+    if not matches:
+        return None
+    if len(matches) == 1:
+        name = matches[0][0].title()
+        show(colored(f"\033[1mShowing bookings for {name}\n\033[0m",
+                     'magenta'))
+        return name
+
+    show(colored(f"\033[1mNo exact match for {dogs_name}, did you mean:"
+                 "\n\033[0m", 'magenta'))
+    show(tabulate([[i, name.title(), count]
+                   for i, (name, count) in enumerate(matches, 1)],
+                  headers=['No.', 'Name', 'Bookings']))
+    while True:
+        show(colored(f"\033[1m\nPlease choose a name between [1] and "
+                     f"[{len(matches)}], or press ENTER for none:\033[0m",
+                     'yellow'))
+        name_choice = prompt().strip()
+        if not name_choice:
+            return None
+        if name_choice.isdigit() and 1 <= int(name_choice) <= len(matches):
+            return matches[int(name_choice) - 1][0].title()
+        show(colored("\033[1mInvalid input. Please enter a number from "
+                     "the list\n\033[0m", 'red'))
+
+
 # CRUD FUNCTIONS
 
+@metrics.instrument('action.create_booking')
 def create_booking():
     '''
     Prompts the user to input booking data and adds it to the bookings sheet.
@@ -206,80 +794,80 @@ def create_booking():
     present in the sheet, the function starts the booking number sequence from
     B1001.
 
-    The function then prompts the user to input the booking date, dog's name,
-    family name, and amount charged. It ensures that the user provides valid
-    input for each field before adding the booking data to the sheet.
+    The function then prompts the user to input the booking date, number of
+    nights, dog's name, family name, and amount charged. It ensures that the
+    user provides valid input for each field, and that a kennel is free for
+    every night of the stay, before adding the booking data to the sheet.
 
     Raises:
     ValueError: If the user inputs an invalid amount charged, which must be
     either a whole number or a number with two decimal places.
     '''
-    os.system('cls' if os.name == 'nt' else "printf '\033c'")
+    clear_screen()
 
-    print("\n")
-    print('*' * 22)
-    print("*** CREATE BOOKING ***\n")
+    show("\n")
+    show('*' * 22)
+    show("*** CREATE BOOKING ***\n")
 
-    print(colored("\033[1mBookings Today:\n\033[0m", 'magenta'))
+    show(colored("\033[1mBookings Today:\n\033[0m", 'magenta'))
     view_booking_date(todays_date())
-    print("\n")
+    show("\n")
 
     next_booking_num = increment_booking_number()
-    booking_date = get_booking_date()
+    booking_date, nights = get_stay()
 
     # checks if the Dog's name input is empty or contains only
     # white spaces
     while True:
-        dogs_name = input(colored("\033[1m\nPlease enter the Dog's "
-                                  "name:\n\033[0m", 'yellow')).strip().title()
+        dogs_name = prompt(colored("\033[1m\nPlease enter the Dog's "
+                                   "name:\n\033[0m", 'yellow')).strip().title()
 
         if not dogs_name:
-            print(colored("\033[1mError: Dog's name cannot be empty or "
-                          "contain\nonly white spaces. Please try "
-                          "again.\033[0m",
-                          'red'))
+            show(colored("\033[1mError: Dog's name cannot be empty or "
+                         "contain\nonly white spaces. Please try "
+                         "again.\033[0m",
+                         'red'))
         else:
             break
 
     # checks if the Dog's Family name input is empty or contains
     # only white spaces
     while True:
-        family_name = input(colored("\033[1m\nPlease enter the Dog's Family "
-                                    "name:\n\033[0m",
-                                    'yellow')).strip().title()
+        family_name = prompt(colored("\033[1m\nPlease enter the Dog's Family "
+                                     "name:\n\033[0m",
+                                     'yellow')).strip().title()
         if not family_name:
-            print(colored("\033[1mError: Family name cannot be empty or "
-                          "contain\nonly white spaces. Please try "
-                          "again.\033[0m", 'red'))
+            show(colored("\033[1mError: Family name cannot be empty or "
+                         "contain\nonly white spaces. Please try "
+                         "again.\033[0m", 'red'))
         else:
             break
 
     # checks if the amount charged input is a valid number
     while True:
-        amount_charged = input(colored("\033[1m\nPlease enter amount "
-                                       "charged:\n\033[0m", 'yellow'))
+        amount_charged = prompt(colored("\033[1m\nPlease enter amount "
+                                        "charged:\n\033[0m", 'yellow'))
         try:
-            float_amount = float(amount_charged)
-            if not float_amount.is_integer() and \
-                    round(float_amount, 2) != float_amount:
-                raise ValueError
+            amount = validate_amount(amount_charged)
 
         except ValueError:
-            print(colored("\033[1mInvalid Input: Amount charged must be a "
-                          "whole number\n"
-                          "or a number with 2 decimal places. Please try "
-                          "again.\033[0m", 'red'))
+            show(colored("\033[1mInvalid Input: Amount charged must be a "
+                         "whole number\n"
+                         "or a number with 2 decimal places. Please try "
+                         "again.\033[0m", 'red'))
         else:
             break
 
     data_list = [next_booking_num, booking_date, dogs_name, family_name,
-                 "{:.2f}".format(float_amount)]
-    bookings.append_row(data_list)
-    print("\n")
-    print(colored("\033[1mBooking entered successfully\n\033[0m", 'green'))
-    time.sleep(1.5)
+                 amount, nights]
+    get_store().append(Booking.from_row(data_list))
+    show("\n")
+    show(colored("\033[1mBooking entered successfully\n\033[0m", 'green'))
+    report_saved_locally()
+    pause(1.5)
 
 
+@metrics.instrument('action.update_booking')
 def update_booking():
     '''
     Allows the user to update the booking data in the worksheet with new data.
@@ -290,201 +878,192 @@ def update_booking():
     Returns:
         None
     '''
-    os.system('cls' if os.name == 'nt' else "printf '\033c'")
-
-    all_bookings = bookings.get_all_values()
+    clear_screen()
 
     # Prompts user to enter a booking number to update
-    print('*' * 23)
-    print("*** UPDATE BOOKING ***\n")
-    print(colored("\033[1mEnter Booking Number (4-digit numerical number "
-                  "only):\033[0m", 'yellow'))
+    show('*' * 23)
+    show("*** UPDATE BOOKING ***\n")
+    show(colored("\033[1mEnter Booking Number (4-digit numerical number "
+                 "only):\033[0m", 'yellow'))
 
     # Validates the entry is a 4 digit number only
     while True:
-        booking_num = input()
+        booking_num = prompt()
         if len(booking_num) == 4 and booking_num.isdigit():
             booking_num = int(booking_num)
             break
         else:
-            print(colored("\033[1mInvalid entry. Please enter a 4-digit "
-                          "numerical number:\n\033[0m", 'red'))
+            show(colored("\033[1mInvalid entry. Please enter a 4-digit "
+                         "numerical number:\n\033[0m", 'red'))
 
-    print(colored("\033[1mCollecting booking data...\n\033[0m", 'magenta'))
+    show(colored("\033[1mCollecting booking data...\n\033[0m", 'magenta'))
 
-    rows_containing_booking_num = []
-    no_booking_data = True
-
-    # Searches for the row containing the booking number,
-    # or displays a message if there is no data to display.
-    for row in all_bookings:
-        if 'B' + str(booking_num) in row:
-            rows_containing_booking_num.append(row)
-            no_booking_data = False
+    # Looks up the booking number in the booking number index, or
+    # displays a message if there is no data to display
+    booking = get_store().find(booking_num)
+    rows_containing_booking_num = [] if booking is None else \
+        [booking.display_row()]
+    no_booking_data = booking is None
 
     if no_booking_data:
-        print(tabulate(rows_containing_booking_num,
-                       headers=['Booking No.', 'Date', 'Dogs Name',
-                                'Family Name', 'Amount Paid']))
-        print(colored("\033[1m\nNo booking data to display for this "
-                      "date\n\033[0m", 'red'))
+        show(tabulate(rows_containing_booking_num,
+                      headers=DISPLAY_HEADERS))
+        show(colored("\033[1m\nNo booking data to display for this "
+                     "date\n\033[0m", 'red'))
     else:
-        print(tabulate(rows_containing_booking_num,
-                       headers=['Booking No.', 'Date', 'Dogs Name',
-                                'Family Name', 'Amount Paid']))
+        show(tabulate(rows_containing_booking_num,
+                      headers=DISPLAY_HEADERS))
 
         bookings_counter(rows_containing_booking_num)
         revenue_total(rows_containing_booking_num)
 
-    # The following code locates the index of the row in the worksheet that
-    # contains the booking number entered by the user, and stores the index
-    # in the row_index variable.
-    row_index = None
-    for i, row in enumerate(all_bookings):
-        if row[0] == ('B' + str(booking_num)):
-            row_index = i + 1
-            break
-
     # Prompts the user to update various details of the booking,
     # such as the date, dog's name, family name, and amount paid.
     # If the user chooses to update a particular detail, the new value is
-    # entered by the user and stored in a variable.
-    # The value in the worksheet is then updated using the update_cell()
-    # method from the gspread library.
-    if row_index is not None:
+    # entered by the user and collected in the changes dictionary.
+    # All of the changes are then written to the worksheet and the booking
+    # cache in a single update.
+    if booking is not None:
+        changes = {}
 
-        # Prompts user to update the booking date
-        print("*" * 25)
-        print(colored("\033[1m\nWould you like to update the date? "
-                      "Enter Y/N:\033[0m", 'yellow'))
+        # Prompts user to update the booking date and number of nights
+        show("*" * 25)
+        show(colored("\033[1m\nWould you like to update the date or number "
+                     "of nights? Enter Y/N:\033[0m", 'yellow'))
 
         # Validates Y/N for updating the date
         while True:
-            update_date_choice = input().upper()
+            update_date_choice = prompt().upper()
             if update_date_choice == "Y" or update_date_choice == "N":
                 break
             else:
-                print(colored("\033[1mInvalid input. Please enter "
-                              "Y or N\n\033[0m", 'red'))
+                show(colored("\033[1mInvalid input. Please enter "
+                             "Y or N\n\033[0m", 'red'))
 
         if update_date_choice == "Y":
-            new_date = get_booking_date()
-            print(colored(f"\033[1m\nUpdating B{booking_num} in "
-                          "progress..\033[0m\n", 'magenta'))
-            bookings.update_cell(row_index, 2, new_date)
-            print(colored(f"\033[1m\nBooking B{booking_num} updated "
-                          "successfully.\n\033[0m", 'green'))
+            new_date, new_nights = get_stay(excluding=booking)
+            changes['date'] = parse_date(new_date)
+            changes['nights'] = new_nights
         else:
             pass
 
         # Prompts user to update the dog's name
-        print(colored("\033[1m\nWould you like to update the Dog's name? "
-                      "Enter Y/N:\033[0m", 'yellow'))
+        show(colored("\033[1m\nWould you like to update the Dog's name? "
+                     "Enter Y/N:\033[0m", 'yellow'))
 
         # validates Y/N for updating the dog's name
         while True:
-            update_dog_choice = input().upper()
+            update_dog_choice = prompt().upper()
             if update_dog_choice == "Y" or update_dog_choice == "N":
                 break
             else:
-                print(colored("\033[1mInvalid input. Please enter "
-                              "Y or N\n\033[0m", 'red'))
+                show(colored("\033[1mInvalid input. Please enter "
+                             "Y or N\n\033[0m", 'red'))
 
         if update_dog_choice == "Y":
             while True:
-                new_dogs_name = input(colored("\033[1m\nPlease update the "
-                                              "Dog's name:\n\033[0m",
-                                              'yellow')).strip().title()
+                new_dogs_name = prompt(colored("\033[1m\nPlease update the "
+                                               "Dog's name:\n\033[0m",
+                                               'yellow')).strip().title()
                 if not new_dogs_name:
-                    print(colored("\033[1mError: Dog's name cannot be empty "
-                                  "or contain\n only white spaces. Please try "
-                                  "again.\033[0m", 'red'))
+                    show(colored("\033[1mError: Dog's name cannot be empty "
+                                 "or contain\n only white spaces. Please try "
+                                 "again.\033[0m", 'red'))
                 else:
-                    print(colored(f"\033[1m\nUpdating B{booking_num} in "
-                                  "progress...\n\033[0m", 'magenta'))
-                    bookings.update_cell(row_index, 3, new_dogs_name)
-                    print(colored(f"\033[1m\nBooking B{booking_num} updated "
-                                  "successfully.\n\033[0m", 'green'))
+                    changes['dogs_name'] = new_dogs_name
                     break
         else:
             pass
 
         # Prompts user to update the dog's family name
-        print(colored("\033[1m\nWould you like to update the Dog's Family "
-                      "name? Enter Y/N:\033[0m", 'yellow'))
+        show(colored("\033[1m\nWould you like to update the Dog's Family "
+                     "name? Enter Y/N:\033[0m", 'yellow'))
 
         # Validates Y/N for updating the dog's family name
         while True:
-            update_family_choice = input().upper()
+            update_family_choice = prompt().upper()
             if update_family_choice == "Y" or update_family_choice == "N":
                 break
             else:
-                print(colored("\033[1mInvalid input. Please enter "
-                              "Y or N\n\033[0m", 'red'))
+                show(colored("\033[1mInvalid input. Please enter "
+                             "Y or N\n\033[0m", 'red'))
 
         if update_family_choice == "Y":
             while True:
-                new_family_name = input(colored("\033[1m\nPlease update the "
-                                                "Dog's Family name:\n\033[0m",
-                                                'yellow')).strip().title()
+                new_family_name = prompt(colored("\033[1m\nPlease update the "
+                                                 "Dog's Family name:\n\033[0m",
+                                                 'yellow')).strip().title()
                 if not new_family_name:
-                    print(colored("\033[1mError: Family name cannot be empty "
-                                  "or contain\nonly white spaces. "
-                                  "Please try again.\033[0m", 'red'))
+                    show(colored("\033[1mError: Family name cannot be empty "
+                                 "or contain\nonly white spaces. "
+                                 "Please try again.\033[0m", 'red'))
                 else:
-                    print(colored(f"\033[1m\nUpdating B{booking_num} in "
-                                  "progress...\n\033[0m", 'magenta'))
-                    bookings.update_cell(row_index, 4, new_family_name)
-                    print(colored(f"\033[1m\nBooking B{booking_num} updated "
-                                  "successfully.\n\033[0m", 'green'))
+                    changes['family_name'] = new_family_name
                     break
         else:
             pass
 
         # Prompts user to update the amount paid
-        print(colored("\033[1m\nWould you like to update the amount paid? "
-                      "Enter Y/N:\033[0m", 'yellow'))
+        show(colored("\033[1m\nWould you like to update the amount paid? "
+                     "Enter Y/N:\033[0m", 'yellow'))
 
         # Validates Y/N for updating the amount paid
         while True:
-            update_amount_choice = input().upper()
+            update_amount_choice = prompt().upper()
             if update_amount_choice == "Y" or update_amount_choice == "N":
                 break
             else:
-                print(colored("\033[1mInvalid input. Please enter "
-                              "Y or N\n\033[0m", 'red'))
+                show(colored("\033[1mInvalid input. Please enter "
+                             "Y or N\n\033[0m", 'red'))
 
         if update_amount_choice == "Y":
             while True:
-                update_amount_paid = input(colored("\033[1m\nPlease update "
-                                                   "the amount paid:\n\033[0m",
-                                                   'yellow'))
+                update_amount_paid = prompt(colored(
+                    "\033[1m\nPlease update the amount paid:\n\033[0m",
+                    'yellow'))
                 try:
-                    float_amount = float(update_amount_paid)
-                    if not float_amount.is_integer() and \
-                            round(float_amount, 2) != float_amount:
-                        raise ValueError
+                    new_amount = validate_amount(update_amount_paid)
                 except ValueError:
-                    print(colored("\033[1mInvalid Input: Amount paid must be "
-                                  "a whole number\n"
-                                  "or a number with 2 decimal places. "
-                                  "Please try again.\033[0m", 'red'))
+                    show(colored("\033[1mInvalid Input: Amount paid must be "
+                                 "a whole number\n"
+                                 "or a number with 2 decimal places. "
+                                 "Please try again.\033[0m", 'red'))
                 else:
-                    print(colored(f"\033[1m\nUpdating B{booking_num} in "
-                                  "progress...\n\033[0m", 'magenta'))
-                    bookings.update_cell(row_index, 5,
-                                         "{:.2f}".format(float_amount))
-                    print(colored(f"\033[1m\nBooking B{booking_num} updated "
-                                  "successfully.\n\033[0m", 'green'))
-                    time.sleep(1)
+                    changes['pence'] = amount_to_pence(new_amount)
                     break
         else:
-            print(colored("\033[1m\nBooking updates completed, returning to "
-                          "Update Booking Menu...\033[0m", 'green'))
-            time.sleep(1.5)
-            os.system('cls' if os.name == 'nt' else "printf '\033c'")
+            pass
+
+        # Writes every change to the booking in one request
+        if changes:
+            show(colored(f"\033[1m\nUpdating B{booking_num} in "
+                         "progress...\n\033[0m", 'magenta'))
+            try:
+                get_store().update_fields(booking_num, changes)
+            except ConflictError as e:
+                if e.deleted:
+                    show(colored(f"\033[1mB{booking_num} was deleted on "
+                                 "another terminal while you were "
+                                 "updating it,\nso your changes were not "
+                                 "saved.\n\033[0m", 'red'))
+                else:
+                    show(colored(f"\033[1mB{booking_num} was changed on "
+                                 "another terminal while you were "
+                                 "updating it,\nso your changes were not "
+                                 "saved. Please view the booking and try "
+                                 "again.\n\033[0m", 'red'))
+                pause(1.5)
+            else:
+                show(colored(f"\033[1m\nBooking B{booking_num} updated "
+                             "successfully.\n\033[0m", 'green'))
+                report_saved_locally()
+        show(colored("\033[1m\nBooking updates completed, returning to "
+                     "Update Booking Menu...\033[0m", 'green'))
+        pause(1.5)
+        clear_screen()
 
 
+@metrics.instrument('action.delete_booking')
 def delete_booking():
     '''
     Allows user to delete the booking_data in the worksheet.
@@ -494,97 +1073,110 @@ def delete_booking():
     If yes, data is deleted from the worksheet.
     If no, the user is returned to the Delete Booking menu.
     '''
-    os.system('cls' if os.name == 'nt' else "printf '\033c'")
-
-    all_bookings = bookings.get_all_values()
+    clear_screen()
 
     # Prompts user to enter a booking number to delete
-    print('*' * 23)
-    print("*** DELETE BOOKING ***\n")
-    print(colored("\033[1mEnter Booking Number (4-digit numerical number "
-                  "only):\033[0m", 'yellow'))
+    show('*' * 23)
+    show("*** DELETE BOOKING ***\n")
+    show(colored("\033[1mEnter Booking Number (4-digit numerical number "
+                 "only):\033[0m", 'yellow'))
 
     # Validates the entry is a 4 digit number only
     while True:
-        booking_num = input()
+        booking_num = prompt()
         if len(booking_num) == 4 and booking_num.isdigit():
             booking_num = int(booking_num)
             break
         else:
-            print(colored("\033[1mInvalid entry. Please enter a 4-digit "
-                          "numerical number.\n\033[0m", 'red'))
-
-    print(colored("\033[1mCollecting booking data...\n\033[0m", 'magenta'))
+            show(colored("\033[1mInvalid entry. Please enter a 4-digit "
+                         "numerical number.\n\033[0m", 'red'))
 
-    rows_containing_booking_num = []
-    no_booking_data = True
+    show(colored("\033[1mCollecting booking data...\n\033[0m", 'magenta'))
 
-    # Adds matching booking data to list, or displays a message if there is
-    # no data to display
-    for row in all_bookings:
-        if 'B' + str(booking_num) in row:
-            rows_containing_booking_num.append(row)
-            no_booking_data = False
+    # Looks up the booking number in the booking number index, or
+    # displays a message if there is no data to display
+    booking = get_store().find(booking_num)
+    rows_containing_booking_num = [] if booking is None else \
+        [booking.display_row()]
+    no_booking_data = booking is None
 
     if no_booking_data:
-        print(tabulate(
-            rows_containing_booking_num,
-            headers=['Booking No.', 'Date', 'Dogs Name', 'Family Name',
-                     'Amount Paid']))
-        print(colored("\033[1m\nNo booking data to display for this "
-                      "date\n\033[0m", 'red'))
+        show(tabulate(
+           rows_containing_booking_num,
+           headers=DISPLAY_HEADERS))
+        show(colored("\033[1m\nNo booking data to display for this "
+                     "date\n\033[0m", 'red'))
     else:
-        print(tabulate(
-            rows_containing_booking_num,
-            headers=['Booking No.', 'Date', 'Dogs Name', 'Family Name',
-                     'Amount Paid']))
+        show(tabulate(
+           rows_containing_booking_num,
+           headers=DISPLAY_HEADERS))
 
         bookings_counter(rows_containing_booking_num)
         revenue_total(rows_containing_booking_num)
 
-    # The following code locates the index of the row in the worksheet
-    # that contains the booking number entered by the user, and stores
-    # the index in the row_index variable.
-    row_index = None
-    for i, row in enumerate(all_bookings):
-        if row[0] == ('B' + str(booking_num)):
-            row_index = i + 1
-            break
-
     # If there is data, the system prompts the user to confirm if they wish to
-    # delete the booking before using the delete_rows method from
-    # the gspread library.
+    # delete the booking before removing it from the worksheet and the
+    # booking cache.
     # The while loop validates for a correct Y or N input
-    if row_index is not None:
-        print(colored("\033[1mAre you sure you want to delete this booking? "
-                      "Enter Y/N:\033[0m", 'yellow'))
+    if booking is not None:
+        show(colored("\033[1mAre you sure you want to delete this booking? "
+                     "Enter Y/N:\033[0m", 'yellow'))
         while True:
-            delete_choice = input().upper()
+            delete_choice = prompt().upper()
             if delete_choice == 'Y' or delete_choice == "N":
                 break
             else:
-                print(colored("\033[1mInvalid input.  Please enter "
-                              "Y or N\n\033[0m", 'red'))
+                show(colored("\033[1mInvalid input.  Please enter "
+                             "Y or N\n\033[0m", 'red'))
 
         if delete_choice == "Y":
-            print(colored(f"\033[1mDeleting B{booking_num} in "
-                          "progress...\n\033[0m", 'magenta'))
-            bookings.delete_rows(row_index)
-            print(colored(f"\033[1mBooking B{booking_num} deleted "
-                          "successfully.\033[1m\n", 'green'))
-            time.sleep(1)
-            os.system('cls' if os.name == 'nt' else "printf '\033c'")
+            show(colored(f"\033[1mDeleting B{booking_num} in "
+                         "progress...\n\033[0m", 'magenta'))
+            try:
+                get_store().delete(booking_num)
+            except ConflictError as e:
+                if e.deleted:
+                    show(colored(f"\033[1mB{booking_num} had already been "
+                                 "deleted on another terminal.\n\033[0m",
+                                 'red'))
+                else:
+                    show(colored(f"\033[1mB{booking_num} was changed on "
+                                 "another terminal, so it was not "
+                                 "deleted.\nPlease view the booking and "
+                                 "try again.\n\033[0m", 'red'))
+                pause(3)
+            else:
+                show(colored(f"\033[1mBooking B{booking_num} deleted "
+                             "successfully.\033[1m\n", 'green'))
+                report_saved_locally()
+                pause(1)
+            clear_screen()
         else:
-            print(colored("\033[1m\nBooking deletions completed, returning to "
-                          "Delete Booking Menu...\033[0m", 'green'))
-            time.sleep(1.5)
-            os.system('cls' if os.name == 'nt' else "printf '\033c'")
+            show(colored("\033[1m\nBooking deletions completed, returning to "
+                         "Delete Booking Menu...\033[0m", 'green'))
+            pause(1.5)
+            clear_screen()
+
 
+# The number of bookings shown on each page of View All Bookings, chosen to
+# fit the 80x24 web terminal with the title and navigation prompt.
+PAGE_SIZE = 15
 
+
+@metrics.instrument('action.view_all_bookings')
 def view_all_bookings():
     '''
-    Displays all bookings in the system along with a count of total bookings
-    and the total sum of revenue.
+    Displays all bookings in the system one page at a time, followed by a
+    count of total bookings and the total sum of revenue.
+
+    Only the bookings on the current page are fetched and rendered, so the
+    first page appears just as quickly however many bookings there are.
+    Until the booking cache has been loaded the pages and the count are read
+    from the backend, and the totals, which need every booking, are only
+    worked out once the user leaves the pages.
+
+    The user can move to the next or previous page, jump to a page number,
+    or quit the viewer. Moving on from the last page also quits the viewer.
 
     If there is no booking data available, a message will be displayed to
     inform the user.
@@ -592,34 +1184,59 @@ def view_all_bookings():
     Returns:
         None
     '''
-    os.system('cls' if os.name == 'nt' else "printf '\033c'")
-
-    print('*' * 25)
-    print("*** VIEW ALL BOOKINGS ***\n")
-
-    all_bookings = bookings.get_all_values()
-    bookings_data = all_bookings[1:]
+    store = get_store(load=False)
+    total = store.count()
+    page_count = max(1, -(-total // PAGE_SIZE))
+    page = 1
 
-    if not bookings_data:
-        print(
-            tabulate(
-                bookings_data,
-                headers=['Booking No.', 'Date', 'Dogs Name', 'Family Name',
-                         'Amount Paid']))
-        print(colored("\033[1m\nNo booking data to display for this "
-                      "date\n\033[0m", 'red'))
-    else:
-        print(
-            tabulate(
-                bookings_data,
-                headers=['Booking No.', 'Date', 'Dogs Name', 'Family Name',
-                         'Amount Paid']))
+    while True:
+        clear_screen()
+
+        show('*' * 25)
+        show("*** VIEW ALL BOOKINGS ***\n")
+
+        bookings_data = [booking.display_row() for booking in
+                         store.page((page - 1) * PAGE_SIZE, PAGE_SIZE)]
+        show(
+           tabulate(
+               bookings_data,
+               headers=DISPLAY_HEADERS))
+
+        if not bookings_data:
+            show(colored("\033[1m\nNo booking data to display for this "
+                         "date\n\033[0m", 'red'))
+            return
+
+        show(colored(f"\033[1m\nPage {page} of {page_count}\033[0m",
+                     'magenta'))
+        show(colored("\033[1m[N]ext, [P]revious, a page number, or "
+                     "[Q]uit:\033[0m", 'yellow'))
+        choice = prompt().strip().upper()
+
+        if choice in ('', 'N'):
+            # Moving on from the last page ends the viewer
+            if page == page_count:
+                break
+            page += 1
+        elif choice == 'P':
+            if page > 1:
+                page -= 1
+        elif choice.isdigit() and 1 <= int(choice) <= page_count:
+            page = int(choice)
+        elif choice == 'Q':
+            break
+        else:
+            show(colored(f"\033[1mInvalid input. Please enter N, P, Q or a "
+                         f"page number between 1 and {page_count}\033[0m",
+                         'red'))
+            pause(1.5)
 
-        bookings_counter(bookings_data)
-        revenue_total(bookings_data)
-        time.sleep(1.5)
+    # Waits for the bookings to be loaded, if they are still loading
+    display_totals(get_store().aggregates().total())
+    pause(1.5)
 
 
+@metrics.instrument('action.view_booking_no')
 def view_booking_no(booking_num):
     '''
     Displays all bookings in the system for a given Booking Number, along with
@@ -634,147 +1251,207 @@ def view_booking_no(booking_num):
     Raises:
     ValueError: If an invalid booking number (not a 4-digit number) is entered.
     '''
-    os.system('cls' if os.name == 'nt' else "printf '\033c'")
-
-    all_bookings = bookings.get_all_values()
+    clear_screen()
 
     # Prompts user to enter a booking number to view
-    print('*' * 30)
-    print("*** VIEW BY BOOKING NUMBER ***\n")
-    print(colored("\033[1mEnter Booking Number (4-digit numerical number "
-                  "only):\033[0m", 'yellow'))
+    show('*' * 30)
+    show("*** VIEW BY BOOKING NUMBER ***\n")
+    show(colored("\033[1mEnter Booking Number (4-digit numerical number "
+                 "only):\033[0m", 'yellow'))
 
     # Validates the entry is a 4 digit number only
     while True:
-        booking_num = input()
+        booking_num = prompt()
         if len(booking_num) == 4 and booking_num.isdigit():
             booking_num = int(booking_num)
             break
         else:
-            print(colored("\033[1mInvalid entry. Please enter a 4-digit "
-                          "numerical number.\n\033[0m", 'red'))
-
-    print(colored("\033[1mCollecting booking data...\n\033[0m", 'magenta'))
+            show(colored("\033[1mInvalid entry. Please enter a 4-digit "
+                         "numerical number.\n\033[0m", 'red'))
 
-    rows_containing_booking_num = []
-    no_booking_data = True
+    show(colored("\033[1mCollecting booking data...\n\033[0m", 'magenta'))
 
-    # Adds matching booking data to list, or displays a message if there is
-    # no data to display
-    for row in all_bookings:
-        if 'B' + str(booking_num) in row:
-            rows_containing_booking_num.append(row)
-            no_booking_data = False
+    # Looks up the booking number in the booking number index, or
+    # displays a message if there is no data to display
+    booking = get_store().find(booking_num)
+    rows_containing_booking_num = [] if booking is None else \
+        [booking.display_row()]
+    no_booking_data = booking is None
 
     if no_booking_data:
-        print(tabulate(
-            rows_containing_booking_num,
-            headers=['Booking No.', 'Date', 'Dogs Name', 'Family Name',
-                     'Amount Paid']))
-        print(colored("\033[1m\nNo booking data to display for this "
-                      "date\n\033[0m", 'red'))
+        show(tabulate(
+           rows_containing_booking_num,
+           headers=DISPLAY_HEADERS))
+        show(colored("\033[1m\nNo booking data to display for this "
+                     "date\n\033[0m", 'red'))
 
     else:
-        print(tabulate(
-            rows_containing_booking_num,
-            headers=['Booking No.', 'Date', 'Dogs Name', 'Family Name',
-                     'Amount Paid']))
+        show(tabulate(
+           rows_containing_booking_num,
+           headers=DISPLAY_HEADERS))
 
         bookings_counter(rows_containing_booking_num)
         revenue_total(rows_containing_booking_num)
-        time.sleep(1.5)
+        pause(1.5)
 
 
+@metrics.instrument('action.view_booking_date')
 def view_booking_date(booking_date):
     '''
     Displays all bookings in the system by Date, with a count of total
-    bookings and a sum of total revenue.
+    bookings and a sum of total revenue, followed by the totals for the
+    whole month.
 
     Parameters:
     booking_date (str): The date to search for bookings in the system. Should
     be in the format 'dd/mm/yyyy'.
     '''
-    all_bookings = bookings.get_all_values()
-
-    rows_containing_booking_date = []
-    no_booking_data = True
-
-    # Adds matching booking data to list, or displays a message if there is
-    # no data to display
-    for row in all_bookings:
-        if booking_date in row:
-            rows_containing_booking_date.append(row)
-            no_booking_data = False
+    # Looks up matching booking data in the booking cache index, or displays
+    # a message if there is no data to display
+    rows_containing_booking_date = [
+        booking.display_row() for booking in get_store().by_date(booking_date)]
+    no_booking_data = not rows_containing_booking_date
+
+    # Includes dogs arriving on earlier dates who are still staying
+    occupancy = get_store().occupancy()
+    show(colored(f"\033[1mKennels occupied: "
+                 f"{occupancy.occupied(parse_date(booking_date))} of "
+                 f"{occupancy.capacity}\n\033[0m", 'magenta'))
 
     if no_booking_data:
-        print(tabulate(
-            rows_containing_booking_date,
-            headers=['Booking No.', 'Date', 'Dogs Name', 'Family Name',
-                     'Amount Paid']))
-        print(colored("\033[1m\nNo booking data to display for this "
-                      "date\n\033[0m", 'red'))
+        show(tabulate(
+           rows_containing_booking_date,
+           headers=DISPLAY_HEADERS))
+        show(colored("\033[1m\nNo booking data to display for this "
+                     "date\n\033[0m", 'red'))
     else:
-        print(tabulate(
-            rows_containing_booking_date,
-            headers=['Booking No.', 'Date', 'Dogs Name', 'Family Name',
-                     'Amount Paid']))
+        show(tabulate(
+           rows_containing_booking_date,
+           headers=DISPLAY_HEADERS))
+
+        aggregates = get_store().aggregates()
+        date = parse_date(booking_date)
+        display_totals(aggregates.for_day(date))
+        display_group_totals(f"All of {date.strftime('%B %Y')}",
+                             aggregates.for_month(date.year, date.month))
+        pause(1.5)
+
+
+@metrics.instrument('action.view_date_range')
+def view_date_range(first, last):
+    '''
+    Displays the kennels occupied on each night in a range of dates, with
+    the number of dogs arriving and the revenue booked for that day,
+    followed by the totals for the whole range.
 
-        bookings_counter(rows_containing_booking_date)
-        revenue_total(rows_containing_booking_date)
-        time.sleep(1.5)
+    The nights are read from the occupancy counters, so a stay of several
+    nights shows on each of its nights, including stays that began before
+    the range. The arrivals are found with a binary search of the sorted
+    date index and their totals are read from the running aggregates, so no
+    bookings are scanned or added up.
 
+    Parameters:
+    first (datetime.date): The first date of the range.
+    last (datetime.date): The last date of the range.
+    '''
+    show(colored(f"\033[1mBookings from {format_date(first)} to "
+                 f"{format_date(last)}:\n\033[0m", 'magenta'))
+
+    store = get_store()
+    aggregates = store.aggregates()
+    arrivals = {date: aggregates.for_day(date)
+                for date in store.dates_between(first, last)}
+    nights = store.occupancy().nights_between(first, last)
+    days_data = [[format_date(date), occupied,
+                  arrivals.get(date, (0, 0))[0],
+                  f'£{format_pence(arrivals.get(date, (0, 0))[1])}']
+                 for date, occupied in nights]
+
+    show(tabulate(days_data, headers=['Date', 'Kennels Occupied',
+                                      'Arrivals', 'Revenue']))
+    if not days_data:
+        show(colored("\033[1m\nNo booking data to display for these "
+                     "dates\n\033[0m", 'red'))
+    else:
+        show(colored(f"\033[1m\nKennel nights: "
+                     f"{sum(occupied for _, occupied in nights)}\033[0m",
+                     'magenta'))
+        display_totals((sum(count for count, _ in arrivals.values()),
+                        sum(pence for _, pence in arrivals.values())))
+        pause(1.5)
 
+
+@metrics.instrument('action.view_dog_bookings')
 def view_dog_bookings(dogs_name):
     '''
      Displays all bookings in the system for a given dog's name, with a count
      of total bookings and a sum of total revenue. Searches can be performed
-     by first name or last name.
+     by first name or last name. If nobody has that exact name, the closest
+     matching names are offered instead. When the name is a family name, the
+     family's own booking count and revenue are shown too.
     '''
-    all_bookings = bookings.get_all_values()
-
-    rows_containing_dog = []
-    no_booking_data = True
-
-    # Adds matching booking data to list, or displays a message if there is
-    # no data to display
-    for row in all_bookings:
-        if dogs_name in row:
-            rows_containing_dog.append(row)
-            no_booking_data = False
+    # Looks up matching booking data in the booking cache index, then in the
+    # name search index, or displays a message if there is no data to display
+    bookings = get_store().by_name(dogs_name)
+    if not bookings:
+        matched_name = choose_name_match(dogs_name)
+        if matched_name is not None:
+            dogs_name = matched_name
+            bookings = get_store().by_name(dogs_name)
+    rows_containing_dog = [booking.display_row() for booking in bookings]
+    no_booking_data = not rows_containing_dog
 
     if no_booking_data:
-        print(tabulate(
-            rows_containing_dog,
-            headers=['Booking No.', 'Date', 'Dogs Name', 'Family Name',
-                     'Amount Paid']))
-        print(colored("\033[1m\nNo booking data to display for this "
-                      "date\n\033[0m", 'red'))
+        show(tabulate(
+           rows_containing_dog,
+           headers=DISPLAY_HEADERS))
+        show(colored("\033[1m\nNo booking data to display for this "
+                     "date\n\033[0m", 'red'))
     else:
-        print(tabulate(
-            rows_containing_dog,
-            headers=['Booking No.', 'Date', 'Dogs Name', 'Family Name',
-                     'Amount Paid']))
+        show(tabulate(
+           rows_containing_dog,
+           headers=DISPLAY_HEADERS))
 
-        bookings_counter(rows_containing_dog)
-        revenue_total(rows_containing_dog)
-        time.sleep(1.5)
+        aggregates = get_store().aggregates()
+        display_totals(aggregates.for_name(dogs_name))
+        # The totals above include dogs with the name, so a family's own
+        # bookings are shown as well
+        family_totals = aggregates.for_family(dogs_name)
+        if family_totals[0]:
+            display_group_totals(f"{dogs_name.title()} family",
+                                 family_totals)
+        pause(1.5)
 
 
 def start():
     '''
-    Starts the program - generates a welcome screen to the user.
+    Starts the program - runs the menus from the welcome screen until the
+    session ends.
+    '''
+    run_menus(WELCOME)
+
+
+def welcome_screen():
+    '''
+    Generates a welcome screen to the user.
+    Starts connecting to the bookings data in the background.
     Prompts the user to press ENTER
-    Calls the choose_main_menu function, which guides the user
-    through the options.
+
+    Returns:
+        The Main Menu state, which guides the user through the options.
     '''
-    os.system('cls' if os.name == 'nt' else "printf '\033c'")
-    print('*' * 44)
-    print("*** Welcome to Kennel-Mate Admin System. ***\n")
-    print("** Book, Update, Delete and View bookings **\n")
-    print(colored("\033[1mPress ENTER to start the program...\033[0m",
-                  "yellow"))
-    input()
-    choose_main_menu()
+    clear_screen()
+    show('*' * 44)
+    show("*** Welcome to Kennel-Mate Admin System. ***\n")
+    show("** Book, Update, Delete and View bookings **\n")
+    show(colored("\033[1mPress ENTER to start the program...\033[0m",
+                 "yellow"))
+    connect_in_background()
+    STARTUP_TIMINGS.setdefault('first prompt',
+                               time.perf_counter() - IMPORT_STARTED)
+    report_timings()
+    prompt()
+    return MAIN_MENU
 
 
 # MENU FUNCTIONS
@@ -782,33 +1459,52 @@ def start():
 def display_main_menu():
     '''
     Displays Main Menu of options.
-    Try statement validates user input for a number between 1 and 5 only
+    Try statement validates user input for a number between 1 and 5 only,
+    or the hidden "admin" option.
 
     Returns:
         menu_choice (users menu choice)
     '''
-    os.system('cls' if os.name == 'nt' else "printf '\033c'")
-
-    print('*' * 17)
-    print("*** MAIN MENU ***\n")
-    print("** OPTIONS:\n")
+    clear_screen()
+
+    show('*' * 17)
+    show("*** MAIN MENU ***\n")
+    if working_offline():
+        show(colored("Working offline from the bookings saved on this "
+                     "computer\n", 'yellow'))
+    waiting = pending_writes()
+    if waiting:
+        show(colored(f"{waiting} booking change(s) being saved in the "
+                     "background\n", 'magenta'))
+    if session_store() is not None:
+        conflicts = session_store().backend.take_conflicts()
+        if conflicts:
+            # Bookings changed elsewhere are read again
+            session_store().invalidate()
+        for conflict in conflicts:
+            show(colored(f"{conflict}\n", 'red'))
+    show("** OPTIONS:\n")
     menu_choice = 'x'
     while True:
-        print('[1] - Create A Booking')
-        print('[2] - Update A Booking')
-        print('[3] - Delete A Booking')
-        print('[4] - View Bookings')
-        print('[5] - Exit')
-        print(colored('\033[1m\nPlease choose a menu option between [1] and '
-                      '[5]:\033[0m', 'yellow'))
+        show('[1] - Create A Booking')
+        show('[2] - Update A Booking')
+        show('[3] - Delete A Booking')
+        show('[4] - View Bookings')
+        show('[5] - Exit')
+        show(colored('\033[1m\nPlease choose a menu option between [1] and '
+                     '[5]:\033[0m', 'yellow'))
         try:
-            menu_choice = int(input())
+            menu_choice = prompt().strip()
+            # A hidden option, for the admin screen
+            if menu_choice.lower() == ADMIN_CHOICE:
+                break
+            menu_choice = int(menu_choice)
             if menu_choice not in range(1, 6):
                 raise ValueError
             break
         except ValueError:
-            print(colored('\033[1m\nInvalid input. Please enter a number '
-                          'between [1] and [5]\n\033[0m', 'red'))
+            show(colored('\033[1m\nInvalid input. Please enter a number '
+                         'between [1] and [5]\n\033[0m', 'red'))
     return menu_choice
 
 
@@ -822,25 +1518,25 @@ def update_bkg_menu():
         update_menu_choice (users menu choice)
     '''
 
-    print('*' * 27)
-    print("*** UPDATE BOOKING MENU ***\n")
-    print("** OPTIONS:\n")
-    print("To update a booking, you will need the Booking Number\n")
+    show('*' * 27)
+    show("*** UPDATE BOOKING MENU ***\n")
+    show("** OPTIONS:\n")
+    show("To update a booking, you will need the Booking Number\n")
     while True:
-        print('[1] - Enter Booking No.')
-        print('[2] - Or, Search Bookings By Date')
-        print("[3] - Or, Search Bookings By Dog or Family Name")
-        print('[4] - Return to Main Menu')
-        print(colored('\033[1m\nPlease choose a menu option between [1] and '
-                      '[4]:\033[0m', 'yellow'))
+        show('[1] - Enter Booking No.')
+        show('[2] - Or, Search Bookings By Date')
+        show("[3] - Or, Search Bookings By Dog or Family Name")
+        show('[4] - Return to Main Menu')
+        show(colored('\033[1m\nPlease choose a menu option between [1] and '
+                     '[4]:\033[0m', 'yellow'))
         try:
-            update_menu_choice = int(input())
+            update_menu_choice = int(prompt())
             if update_menu_choice not in range(1, 5):
                 raise ValueError
             break
         except ValueError:
-            print(colored('\033[1m\nInvalid input.  Please enter a number '
-                          'between [1] and [4]\n\033[0m', 'red'))
+            show(colored('\033[1m\nInvalid input.  Please enter a number '
+                         'between [1] and [4]\n\033[0m', 'red'))
     return update_menu_choice
 
 
@@ -852,58 +1548,100 @@ def delete_bkg_menu():
     Returns:
         delete_menu_choice (users menu choice)
     '''
-    print('*' * 27)
-    print("*** DELETE BOOKING MENU ***\n")
-    print("** OPTIONS:\n")
-    print("To delete a booking, you will need the Booking Number\n")
+    show('*' * 27)
+    show("*** DELETE BOOKING MENU ***\n")
+    show("** OPTIONS:\n")
+    show("To delete a booking, you will need the Booking Number\n")
     while True:
-        print('[1] - Enter Booking No.')
-        print('[2] - Or, Search Bookings By Date')
-        print("[3] - Or, Search Bookings By Dog or Family Name")
-        print('[4] - Return to Main Menu')
-        print(colored('\033[1m\nPlease choose a menu option between [1] and '
-                      '[4]:\033[0m', 'yellow'))
+        show('[1] - Enter Booking No.')
+        show('[2] - Or, Search Bookings By Date')
+        show("[3] - Or, Search Bookings By Dog or Family Name")
+        show('[4] - Return to Main Menu')
+        show(colored('\033[1m\nPlease choose a menu option between [1] and '
+                     '[4]:\033[0m', 'yellow'))
         try:
-            delete_menu_choice = int(input())
+            delete_menu_choice = int(prompt())
             if delete_menu_choice not in range(1, 5):
                 raise ValueError
             break
         except ValueError:
-            print(colored('\033[1m\nInvalid input.  Please enter a number '
-                          'between [1] and [4]\n\033[0m', 'red'))
+            show(colored('\033[1m\nInvalid input.  Please enter a number '
+                         'between [1] and [4]\n\033[0m', 'red'))
     return delete_menu_choice
 
 
 def view_bkg_menu():
     '''
     Displays View bookings menu of options.
-    Try statement validates user input for a number between 1 and 5 only.
+    Try statement validates user input for a number between 1 and 6 only.
 
     Returns:
         view_menu_choice (users menu choice)
     '''
-    print('*' * 26)
-    print("*** VIEW BOOKINGS MENU ***\n")
-    print("** OPTIONS:\n")
+    show('*' * 26)
+    show("*** VIEW BOOKINGS MENU ***\n")
+    show("** OPTIONS:\n")
     while True:
-        print('[1] - View All Bookings')
-        print('[2] - View By Booking No.')
-        print('[3] - View By Booking Date')
-        print("[4] - View By Booking Name")
-        print('[5] - Return to Main Menu')
-        print(colored('\033[1m\nPlease choose a menu option between [1] and '
-                      '[5]:\033[0m', 'yellow'))
+        show('[1] - View All Bookings')
+        show('[2] - View By Booking No.')
+        show('[3] - View By Booking Date')
+        show("[4] - View By Booking Name")
+        show('[5] - View By Date Range')
+        show('[6] - Return to Main Menu')
+        show(colored('\033[1m\nPlease choose a menu option between [1] and '
+                     '[6]:\033[0m', 'yellow'))
         try:
-            view_menu_choice = int(input())
-            if view_menu_choice not in range(1, 6):
+            view_menu_choice = int(prompt())
+            if view_menu_choice not in range(1, 7):
                 raise ValueError
             break
         except ValueError:
-            print(colored('\033[1m\nInvalid input.  Please enter a number '
-                          'between [1] and [5]\n\033[0m', 'red'))
+            show(colored('\033[1m\nInvalid input.  Please enter a number '
+                         'between [1] and [6]\n\033[0m', 'red'))
     return view_menu_choice
 
 
+def admin_menu():
+    '''
+    Displays the hidden admin screen: the metrics recorded for every
+    operation this session, and the admin options.
+    Try statement validates user input for a number between 1 and 4 only.
+
+    Returns:
+        admin_menu_choice (users menu choice)
+    '''
+    show('*' * 18)
+    show("*** ADMIN MENU ***\n")
+    rows = [[name, summary['count'], summary['errors']] +
+            [round(summary[latency], 1) for latency in
+             ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms')] +
+            [summary['rows'], summary['bytes']]
+            for name, summary in metrics.report().items()]
+    show(tabulate(rows, headers=METRICS_HEADERS))
+    show(f"\nMetrics recorded since "
+         f"{metrics.started.strftime('%d-%m-%Y %H:%M:%S')}")
+    if metrics.profiler is not None:
+        show(colored("Profiling this session", 'magenta'))
+    show("\n** OPTIONS:\n")
+    while True:
+        show('[1] - Save Metrics To A File')
+        show('[2] - Stop Profiling' if metrics.profiler is not None
+             else '[2] - Start Profiling')
+        show('[3] - Clear Metrics')
+        show('[4] - Return to Main Menu')
+        show(colored('\033[1m\nPlease choose a menu option between [1] and '
+                     '[4]:\033[0m', 'yellow'))
+        try:
+            admin_menu_choice = int(prompt())
+            if admin_menu_choice not in range(1, 5):
+                raise ValueError
+            break
+        except ValueError:
+            show(colored('\033[1m\nInvalid input.  Please enter a number '
+                         'between [1] and [4]\n\033[0m', 'red'))
+    return admin_menu_choice
+
+
 # SUBMENU CHOICE FUNCTIONS
 
 def choose_update_menu():
@@ -915,48 +1653,34 @@ def choose_update_menu():
     or Searching for bookings by date or by dog's name to see the relevant
     number.
 
-    The user is notified of an invalid entry if they do not choose a number
-    between 1 and 4.
-
     Returns:
-        None
+        The next menu state: the Update Booking Menu again, or the Main Menu.
     '''
     update_menu_choice = update_bkg_menu()
-    while True:
-        if update_menu_choice == 1:
-            os.system('cls' if os.name == 'nt' else "printf '\033c'")
-            update_booking()
-            choose_update_menu()
-            break
-        elif update_menu_choice == 2:
-            os.system('cls' if os.name == 'nt' else "printf '\033c'")
-            print('*' * 22)
-            print("*** SEARCH BY DATE ***\n")
-            input_date = get_booking_date()
-            print(colored("\033[1mCollecting booking "
-                          "data...\n\033[0m", 'magenta'))
-            view_booking_date(input_date)
-            choose_update_menu()
-            break
-        elif update_menu_choice == 3:
-            os.system('cls' if os.name == 'nt' else "printf '\033c'")
-            print('*' * 36)
-            print("*** SEARCH BY DOG OR FAMILY NAME ***\n")
-            dogs_name = get_dogs_name()
-            print(colored("\033[1mCollecting booking "
-                          "data...\n\033[0m", 'magenta'))
-            view_dog_bookings(dogs_name)
-            choose_update_menu()
-            break
-        elif update_menu_choice == 4:
-            print(colored("\033[1mReturning to Main Menu\n\033[0m", 'magenta'))
-            time.sleep(1.5)
-            choose_main_menu()
-            break
-        else:
-            print(colored("\033[1mInvalid choice, please choose between "
-                          "1 and 4\n\033[0m",
-                          'red'))
+    if update_menu_choice == 1:
+        clear_screen()
+        update_booking()
+    elif update_menu_choice == 2:
+        clear_screen()
+        show('*' * 22)
+        show("*** SEARCH BY DATE ***\n")
+        input_date = get_booking_date()
+        show(colored("\033[1mCollecting booking "
+                     "data...\n\033[0m", 'magenta'))
+        view_booking_date(input_date)
+    elif update_menu_choice == 3:
+        clear_screen()
+        show('*' * 36)
+        show("*** SEARCH BY DOG OR FAMILY NAME ***\n")
+        dogs_name = get_dogs_name()
+        show(colored("\033[1mCollecting booking "
+                     "data...\n\033[0m", 'magenta'))
+        view_dog_bookings(dogs_name)
+    elif update_menu_choice == 4:
+        show(colored("\033[1mReturning to Main Menu\n\033[0m", 'magenta'))
+        pause(1.5)
+        return MAIN_MENU
+    return UPDATE_MENU
 
 
 def choose_delete_menu():
@@ -968,46 +1692,34 @@ def choose_delete_menu():
     or Searching for bookings by date or by dog's name to see the relevant
     number.
 
-    The user is notified of an invalid entry if they do not choose a number
-    between 1 and 4.
-
     Returns:
-        None
+        The next menu state: the Delete Booking Menu again, or the Main Menu.
     '''
     delete_menu_choice = delete_bkg_menu()
-    while True:
-        if delete_menu_choice == 1:
-            os.system('cls' if os.name == 'nt' else "printf '\033c'")
-            delete_booking()
-            choose_delete_menu()
-            break
-        elif delete_menu_choice == 2:
-            os.system('cls' if os.name == 'nt' else "printf '\033c'")
-            print('*' * 22)
-            print("*** SEARCH BY DATE ***\n")
-            input_date = get_booking_date()
-            print(colored("\033[1mCollecting booking "
-                          "data...\n\033[0m", 'magenta'))
-            view_booking_date(input_date)
-            choose_delete_menu()
-            break
-        elif delete_menu_choice == 3:
-            os.system('cls' if os.name == 'nt' else "printf '\033c'")
-            print('*' * 36)
-            print("*** SEARCH BY DOG OR FAMILY NAME ***\n")
-            dogs_name = get_dogs_name()
-            print(colored("\033[1mCollecting booking "
-                          "data...\n\033[0m", 'magenta'))
-            view_dog_bookings(dogs_name)
-            choose_delete_menu()
-            break
-        elif delete_menu_choice == 4:
-            print(colored("\033[1mReturning to Main Menu\n\033[0m", 'magenta'))
-            time.sleep(1.5)
-            choose_main_menu()
-        else:
-            print(colored("\033[1mInvalid choice, please choose between "
-                          "1 and 4\n\033[0m", 'red'))
+    if delete_menu_choice == 1:
+        clear_screen()
+        delete_booking()
+    elif delete_menu_choice == 2:
+        clear_screen()
+        show('*' * 22)
+        show("*** SEARCH BY DATE ***\n")
+        input_date = get_booking_date()
+        show(colored("\033[1mCollecting booking "
+                     "data...\n\033[0m", 'magenta'))
+        view_booking_date(input_date)
+    elif delete_menu_choice == 3:
+        clear_screen()
+        show('*' * 36)
+        show("*** SEARCH BY DOG OR FAMILY NAME ***\n")
+        dogs_name = get_dogs_name()
+        show(colored("\033[1mCollecting booking "
+                     "data...\n\033[0m", 'magenta'))
+        view_dog_bookings(dogs_name)
+    elif delete_menu_choice == 4:
+        show(colored("\033[1mReturning to Main Menu\n\033[0m", 'magenta'))
+        pause(1.5)
+        return MAIN_MENU
+    return DELETE_MENU
 
 
 def choose_view_menu():
@@ -1016,53 +1728,47 @@ def choose_view_menu():
     one of the relevant functions.
 
     The user can choose between viewing all the bookings.  Viewing by the
-    booking number, or viewing bookings by date or by dog's name.
-
-    The user is notified of an invalid entry if they do not choose a number
-    between 1 and 5.
+    booking number, or viewing bookings by date, by dog's name or by a range
+    of dates.
 
     Returns:
-        None
+        The next menu state: the View Bookings Menu again, or the Main Menu.
     '''
     view_menu_choice = view_bkg_menu()
-    while True:
-        if view_menu_choice == 1:
-            os.system('cls' if os.name == 'nt' else "printf '\033c'")
-            view_all_bookings()
-            choose_view_menu()
-            break
-        elif view_menu_choice == 2:
-            view_booking_no(1000)
-            choose_view_menu()
-            break
-        elif view_menu_choice == 3:
-            os.system('cls' if os.name == 'nt' else "printf '\033c'")
-            print('*' * 20)
-            print("*** VIEW BY DATE ***\n")
-            input_date = get_booking_date()
-            print(colored("\033[1mCollecting booking "
-                          "data...\n\033[0m", 'magenta'))
-            view_booking_date(input_date)
-            choose_view_menu()
-            break
-        elif view_menu_choice == 4:
-            os.system('cls' if os.name == 'nt' else "printf '\033c'")
-            print('*' * 34)
-            print("*** VIEW BY DOG OR FAMILY NAME ***\n")
-            dogs_name = get_dogs_name()
-            print(colored("\033[1mCollecting booking "
-                          "data...\n\033[0m", 'magenta'))
-            view_dog_bookings(dogs_name)
-            choose_view_menu()
-            break
-        elif view_menu_choice == 5:
-            print(colored("\033[1mReturning to Main Menu\n\033[0m", 'magenta'))
-            time.sleep(1.5)
-            choose_main_menu()
-            break
-        else:
-            print(colored("\033[1mInvalid choice, please choose between "
-                          "1 and 5\033[0m", 'red'))
+    if view_menu_choice == 1:
+        clear_screen()
+        view_all_bookings()
+    elif view_menu_choice == 2:
+        view_booking_no(1000)
+    elif view_menu_choice == 3:
+        clear_screen()
+        show('*' * 20)
+        show("*** VIEW BY DATE ***\n")
+        input_date = get_booking_date()
+        show(colored("\033[1mCollecting booking "
+                     "data...\n\033[0m", 'magenta'))
+        view_booking_date(input_date)
+    elif view_menu_choice == 4:
+        clear_screen()
+        show('*' * 34)
+        show("*** VIEW BY DOG OR FAMILY NAME ***\n")
+        dogs_name = get_dogs_name()
+        show(colored("\033[1mCollecting booking "
+                     "data...\n\033[0m", 'magenta'))
+        view_dog_bookings(dogs_name)
+    elif view_menu_choice == 5:
+        clear_screen()
+        show('*' * 26)
+        show("*** VIEW BY DATE RANGE ***\n")
+        first, last = get_date_range()
+        show(colored("\033[1mCollecting booking "
+                     "data...\n\033[0m", 'magenta'))
+        view_date_range(first, last)
+    elif view_menu_choice == 6:
+        show(colored("\033[1mReturning to Main Menu\n\033[0m", 'magenta'))
+        pause(1.5)
+        return MAIN_MENU
+    return VIEW_MENU
 
 
 def choose_main_menu():
@@ -1070,44 +1776,211 @@ def choose_main_menu():
     The main_menu_choice is passed to this if else statement which activates
     one of the relevant functions.
 
-    he user can choose between creating a booking, updating a booking,
+    The user can choose between creating a booking, updating a booking,
     deleting a booking or viewing bookings.
 
-    The user is notified of an invalid entry if they do not choose a number
-    between 1 and 5.
-
     Returns:
-        None
+        The next menu state: the chosen submenu, the Main Menu again after
+        creating a booking, or the welcome screen when the user exits.
     '''
     main_menu_choice = display_main_menu()
-    while True:
-        if main_menu_choice == 1:
-            create_booking()
-            choose_main_menu()
-            break
-        elif main_menu_choice == 2:
-            os.system('cls' if os.name == 'nt' else "printf '\033c'")
-            choose_update_menu()
-            break
-        elif main_menu_choice == 3:
-            os.system('cls' if os.name == 'nt' else "printf '\033c'")
-            choose_delete_menu()
-            break
-        elif main_menu_choice == 4:
-            os.system('cls' if os.name == 'nt' else "printf '\033c'")
-            choose_view_menu()
-            break
-        elif main_menu_choice == 5:
-            print(colored("\033[1mEnding program...\n\033[0m", 'magenta'))
-            time.sleep(1.5)
-            start()
+    if main_menu_choice == 1:
+        create_booking()
+        return MAIN_MENU
+    elif main_menu_choice == 2:
+        clear_screen()
+        return UPDATE_MENU
+    elif main_menu_choice == 3:
+        clear_screen()
+        return DELETE_MENU
+    elif main_menu_choice == 4:
+        clear_screen()
+        return VIEW_MENU
+    elif main_menu_choice == ADMIN_CHOICE:
+        clear_screen()
+        return ADMIN_MENU
+    show(colored("\033[1mEnding program...\n\033[0m", 'magenta'))
+    save_pending_writes()
+    report_timings()
+    save_metrics()
+    pause(1.5)
+    return WELCOME
+
+
+def choose_admin_menu():
+    '''
+    The admin_menu_choice is passed to this if else statement which activates
+    one of the relevant functions.
+
+    The user can save the metrics to a file, start or stop a cProfile
+    capture of the rest of the session, or clear the metrics.
+
+    Returns:
+        The next menu state: the admin screen again, or the Main Menu.
+    '''
+    admin_menu_choice = admin_menu()
+    if admin_menu_choice == 1:
+        path = metrics.dump(METRICS_FILE or DEFAULT_METRICS_FILE)
+        show(colored(f"\033[1mMetrics saved to {path}\n\033[0m", 'green'))
+    elif admin_menu_choice == 2:
+        if metrics.profiler is None:
+            metrics.start_profiling()
+            show(colored("\033[1mProfiling started\n\033[0m", 'green'))
+        else:
+            path = metrics.stop_profiling(PROFILE_FILE)
+            show(colored(f"\033[1mProfile saved to {path}\n\033[0m",
+                         'green'))
+    elif admin_menu_choice == 3:
+        metrics.reset()
+        show(colored("\033[1mMetrics cleared\n\033[0m", 'green'))
+    else:
+        show(colored("\033[1mReturning to Main Menu\n\033[0m", 'magenta'))
+        pause(1.5)
+        return MAIN_MENU
+    pause(1.5)
+    clear_screen()
+    return ADMIN_MENU
+
+
+# MENU NAVIGATION
+
+# The menu states. Each state's function shows its screen, carries out the
+# user's choice and returns the next state.
+WELCOME = 'welcome'
+MAIN_MENU = 'main'
+UPDATE_MENU = 'update'
+DELETE_MENU = 'delete'
+VIEW_MENU = 'view'
+ADMIN_MENU = 'admin'
+
+MENU_STATES = {
+    WELCOME: welcome_screen,
+    MAIN_MENU: choose_main_menu,
+    UPDATE_MENU: choose_update_menu,
+    DELETE_MENU: choose_delete_menu,
+    VIEW_MENU: choose_view_menu,
+    ADMIN_MENU: choose_admin_menu,
+}
+
+
+def run_menus(state):
+    '''
+    Runs the menus as a flat state machine. Rather than each menu calling the
+    next, which grew the call stack for as long as the session ran, every
+    menu returns the next state to this loop, so the stack depth stays the
+    same however long the session lasts.
+
+    Args:
+    state (str): The state to start in, one of the keys of MENU_STATES.
+    '''
+    while state is not None:
+        with metrics.timed(f'menu.{state}'):
+            state = MENU_STATES[state]()
+
+
+# BATCH FUNCTIONS
+
+def booking_date_argument(value):
+    '''
+    Validates a date given on the command line.
+    '''
+    try:
+        return validate_booking_date(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+# COMMAND LINE
+
+def main(argv=None):
+    '''
+    Parses the command line. With no command the interactive admin system is
+    started, otherwise the requested one-shot command is run.
+
+    Args:
+    argv (list): The command line arguments, defaults to sys.argv[1:].
+    '''
+    parser = argparse.ArgumentParser(
+        prog='run.py', description='Kennel-Mate Admin System')
+    parser.add_argument('--fast', action='store_true',
+                        help='remove the pauses between screens')
+    subparsers = parser.add_subparsers(dest='command')
+
+    migrate_parser = subparsers.add_parser(
+        'migrate', help='copy every booking from one storage backend to '
+                        'another, replacing the bookings held there')
+    migrate_parser.add_argument('--from', dest='source', required=True,
+                                choices=BACKENDS)
+    migrate_parser.add_argument('--to', dest='target', required=True,
+                                choices=BACKENDS)
+
+    import_parser = subparsers.add_parser(
+        'import', help='add the bookings in a CSV file with Date, Dogs Name, '
+                       'Family Name and Amount Paid columns')
+    import_parser.add_argument('csv_file', help='the CSV file to import')
+
+    subparsers.add_parser(
+        'compact', help='remove deleted bookings from the storage backend, '
+                        'while no other sessions are open')
+
+    export_parser = subparsers.add_parser(
+        'export', help='write bookings to a CSV file')
+    export_parser.add_argument('--from', dest='date_from',
+                               type=booking_date_argument,
+                               help='first booking date, DD-MM-YYYY')
+    export_parser.add_argument('--to', dest='date_to',
+                               type=booking_date_argument,
+                               help='last booking date, DD-MM-YYYY')
+    export_parser.add_argument('--output', '-o',
+                               help='the CSV file to write, defaults to the '
+                                    'screen')
+
+    args = parser.parse_args(argv)
+    if args.fast:
+        set_pace('fast')
+
+    if args.command == 'migrate':
+        if args.source == args.target:
+            parser.error('--from and --to must be different backends')
+        count = migrate(open_backend(args.source), open_backend(args.target))
+        show(colored(f"\033[1m{count} bookings copied from {args.source} "
+                     f"to {args.target}\033[0m", 'green'))
+    elif args.command == 'import':
+        with open(args.csv_file, newline='',
+                  encoding=bulk_bookings.IMPORT_ENCODING) as csv_file:
+            try:
+                imported, errors = bulk_bookings.import_bookings(
+                    csv_file, get_store(), booking_allocator)
+            except ValueError as e:
+                parser.error(str(e))
+        for line_num, error in errors:
+            show(colored(f"Line {line_num} skipped: {error}", 'red'))
+        show(colored(f"\033[1m{imported} bookings imported, "
+                     f"{len(errors)} skipped\033[0m", 'green'))
+        save_pending_writes()
+    elif args.command == 'compact':
+        removed = open_backend(STORAGE_BACKEND).compact()
+        show(colored(f"\033[1m{removed} deleted bookings removed\033[0m",
+                     'green'))
+    elif args.command == 'export':
+        if args.date_from and args.date_to and \
+                parse_date(args.date_from) > parse_date(args.date_to):
+            parser.error('--from must not be after --to')
+        if args.output:
+            with open(args.output, 'w', newline='',
+                      encoding='utf-8') as csv_file:
+                exported = bulk_bookings.export_bookings(
+                    csv_file, get_store(), args.date_from, args.date_to)
         else:
-            print(colored("\033[1mInvalid choice, please choose between "
-                          "1 and 5\n\033[0m", 'red'))
-        main_menu_choice = display_main_menu()
+            exported = bulk_bookings.export_bookings(
+                sys.stdout, get_store(), args.date_from, args.date_to)
+        show(colored(f"\033[1m{exported} bookings exported\033[0m",
+                     'green'), file=sys.stderr)
+    else:
+        start()
 
 
 # MAIN GUARD
 
 if __name__ == '__main__':
-    start()
+    main(sys.argv[1:])
@@ -0,0 +1,285 @@
+'''
+Replays front-desk sessions concurrently, to load test the admin system.
+
+Each session is a script of the lines a user typed, such as one recorded
+with KENNEL_RECORD, and is replayed with a ScriptedConsole, without a
+terminal. Each simulated terminal runs on its own thread, with its own
+booking cache, journal and snapshot, replaying sessions one after another.
+Every terminal shares one FakeWorksheet filled with generated bookings, so
+no Google credentials or network access are needed, and every request to
+the worksheet can be given a latency.
+
+The sessions are replayed at each concurrency level in turn. For each
+level the driver reports how many sessions and keystrokes were handled a
+second, and how long the app took to respond to each keystroke. A response
+that slows as terminals are added shows the contention between them.
+
+Run it with, for example:
+python3 session_driver.py --sessions 50 --concurrency 1 5 10 --latency 0.05
+python3 session_driver.py recorded.txt --concurrency 10 -o out.json
+
+Without scripts, each session is a typical front-desk visit: creating a
+booking, viewing that date's bookings and the dog's bookings, and paging
+through all the bookings.
+'''
+import os
+import sys
+import json
+import time
+import queue
+import random
+import argparse
+import datetime
+import platform
+import tempfile
+import threading
+import statistics
+
+import console
+from booking import format_date
+from booking_store import HEADERS
+from console import ScriptedConsole, EndOfScript, read_script
+from benchmark import (
+    generate_bookings, use_local_files, DOGS_NAMES, FAMILY_NAMES)
+from fake_worksheet import FakeWorksheet
+from metrics import percentile
+
+SESSIONS = 20
+CONCURRENCY = [1, 5, 10]
+BOOKINGS = 10000
+
+# The longest the driver waits for each terminal's changes to be saved
+SAVE_WAIT = 60
+
+
+def front_desk_script(rng):
+    '''
+    Generates a typical front-desk session. The stay is booked more than a
+    year ahead, after every generated booking, so a kennel is always free
+    and the script never falls out of step with the prompts.
+
+    Args:
+    rng (random.Random): Chooses the booking's details.
+
+    Returns:
+    list: The keystroke lines.
+    '''
+    date = format_date(datetime.date.today() + datetime.timedelta(
+        days=rng.randrange(366, 1096)))
+    nights = rng.randint(1, 3)
+    dogs_name = rng.choice(DOGS_NAMES)
+    return [
+        '',                                             # Welcome screen
+        '1', date, str(nights), dogs_name, rng.choice(FAMILY_NAMES),
+        str(nights * rng.choice((20, 25, 30))),         # Create a booking
+        '4', '3', date, '6',                            # View by date
+        '4', '4', dogs_name, '6',                       # View by name
+        '4', '1', 'N', 'Q', '6',                        # View all
+        '5',                                            # Exit
+    ]
+
+
+def replay_session(run, keystrokes):
+    '''
+    Replays one session on the current thread, from the welcome screen until
+    its script runs out.
+
+    Args:
+    run (module): The admin system.
+    keystrokes (list): The script.
+
+    Returns:
+    tuple: The ScriptedConsole, with the transcript and response times, and
+    the error that ended the session early, or None.
+    '''
+    scripted = ScriptedConsole(keystrokes)
+    with console.use_console(scripted):
+        try:
+            run.start()
+        except EndOfScript:
+            return scripted, None
+        except Exception as e:
+            return scripted, f'{type(e).__name__}: {e}'
+    return scripted, None
+
+
+def replay(run, scripts, concurrency, worksheet, directory):
+    '''
+    Replays sessions on a number of simulated terminals at once.
+
+    Args:
+    run (module): The admin system.
+    scripts (list): The scripts of every session to replay.
+    concurrency (int): The number of terminals.
+    worksheet (FakeWorksheet): The worksheet every terminal shares.
+    directory (str): Where each terminal keeps its journal and snapshot.
+
+    Returns:
+    tuple: The results for this concurrency level, and each session's
+    transcript.
+    '''
+    from backends import SheetsBackend
+    from offline import Snapshot
+    from sheets_governor import SheetsGovernor
+    from write_behind import WriteJournal
+
+    sessions = queue.Queue()
+    for number, script in enumerate(scripts):
+        sessions.put((number, script))
+    stores = []
+    for terminal in range(concurrency):
+        # Each terminal keeps within its own Sheets quota, as it would on
+        # its own computer; requests are not rate limited here, so the
+        # results show the app's own cost
+        governor = SheetsGovernor(requests_per_minute=6e9, burst=10 ** 9)
+        store = run.make_store(
+            lambda governor=governor: SheetsBackend(worksheet, governor),
+            WriteJournal(os.path.join(directory, f'journal{terminal}')),
+            Snapshot(os.path.join(directory, f'snapshot{terminal}')))
+        store.ensure_fresh()
+        stores.append(store)
+
+    transcripts = [None] * len(scripts)
+    errors = []
+    response_times = []
+    durations = []
+    typed = []
+    lock = threading.Lock()
+
+    def terminal(store):
+        run.use_store(store, this_thread=True)
+        while True:
+            try:
+                number, script = sessions.get_nowait()
+            except queue.Empty:
+                return
+            started = time.perf_counter()
+            scripted, error = replay_session(run, script)
+            duration = time.perf_counter() - started
+            with lock:
+                transcripts[number] = scripted.transcript()
+                response_times.extend(scripted.response_times)
+                durations.append(duration)
+                typed.append(scripted.typed)
+                if error is not None:
+                    errors.append({'session': number, 'error': error})
+
+    requests = worksheet.request_count()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=terminal, args=(store,))
+               for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    saved = all(store.backend.wait(SAVE_WAIT) for store in stores)
+
+    response_times.sort()
+    result = {
+        'concurrency': concurrency,
+        'sessions': len(scripts),
+        'errors': errors,
+        'saved': saved,
+        'keystrokes': sum(typed),
+        'elapsed_s': round(elapsed, 3),
+        'sessions_per_s': round(len(scripts) / elapsed, 3),
+        'keystrokes_per_s': round(sum(typed) / elapsed, 3),
+        'session_mean_ms': round(statistics.mean(durations) * 1000, 3),
+        'requests': worksheet.request_count() - requests,
+    }
+    for percent in (50, 95, 99):
+        result[f'response_p{percent}_ms'] = round(
+            percentile(response_times, percent) * 1000, 3)
+    result['response_max_ms'] = round(
+        (response_times[-1] if response_times else 0) * 1000, 3)
+    return result, transcripts
+
+
+def main(argv=None):
+    '''
+    Parses the command line and replays the sessions.
+
+    Args:
+    argv (list): The command line arguments, defaults to sys.argv[1:].
+    '''
+    parser = argparse.ArgumentParser(
+        prog='session_driver.py',
+        description='Replay Kennel-Mate sessions concurrently')
+    parser.add_argument('scripts', nargs='*',
+                        help='recorded sessions to replay, one typed line '
+                             'per line, instead of generated sessions')
+    parser.add_argument('--sessions', type=int, default=SESSIONS,
+                        help='how many sessions to replay at each level; '
+                             'recorded sessions are repeated in turn')
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=CONCURRENCY,
+                        help='numbers of terminals replaying sessions at once')
+    parser.add_argument('--bookings', type=int, default=BOOKINGS,
+                        help='generated bookings in the shared worksheet')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds every worksheet request takes')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seeds the generated bookings and sessions')
+    parser.add_argument('--transcripts',
+                        help='a directory to write each session\'s output to')
+    parser.add_argument('--output', '-o',
+                        help='the JSON file to write, defaults to the screen')
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    if args.scripts:
+        recorded = [read_script(path) for path in args.scripts]
+        scripts = [recorded[number % len(recorded)]
+                   for number in range(args.sessions)]
+    else:
+        scripts = [front_desk_script(rng) for _ in range(args.sessions)]
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        use_local_files(directory)
+        # Imported here, once the environment points the app's local files
+        # at the driver's temporary directory
+        import run
+
+        worksheet = FakeWorksheet(
+            [HEADERS] + generate_bookings(args.bookings, args.seed),
+            args.latency)
+        for concurrency in args.concurrency:
+            print(f'Replaying {len(scripts)} sessions on {concurrency} '
+                  'terminal(s)...', file=sys.stderr)
+            result, transcripts = replay(run, scripts, concurrency,
+                                         worksheet, directory)
+            results.append(result)
+            print(f"  {result['sessions_per_s']:.1f} sessions/s, "
+                  f"{result['keystrokes_per_s']:.1f} keystrokes/s, "
+                  f"response p50 {result['response_p50_ms']:.1f}ms, "
+                  f"p95 {result['response_p95_ms']:.1f}ms, "
+                  f"{len(result['errors'])} error(s)", file=sys.stderr)
+            if args.transcripts:
+                os.makedirs(args.transcripts, exist_ok=True)
+                for number, transcript in enumerate(transcripts):
+                    path = os.path.join(
+                        args.transcripts,
+                        f'session-{concurrency}-{number}.txt')
+                    with open(path, 'w', encoding='utf-8') as output:
+                        output.write(transcript or '')
+
+    report = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'bookings': args.bookings,
+        'latency': args.latency,
+        'scripts': args.scripts or 'generated',
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
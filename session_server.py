@@ -0,0 +1,246 @@
+'''
+Long-lived session server for the web terminal.
+
+Without the session server, controllers/default.js starts a fresh
+"python3 run.py" for every browser connection, so every user waits for the
+interpreter to start, for the libraries to be imported, for Google to
+authorize the service account and for the bookings to download.
+
+The session server does all of that once. It then keeps a pool of
+pre-forked, idle worker processes waiting on a unix socket. Each worker is a
+copy of the warm server, so it already holds the authorized Google client,
+its access token and the loaded booking cache. When a connection arrives a
+worker runs the admin system on a new pseudo-terminal, relays it to the
+connection, and exits when the session ends. The server forks a replacement
+worker as soon as one is taken, so a connection never waits for a start-up.
+The cache's TTL is ended when a worker is taken, so the session's first
+read picks up any changes made since the worker was forked.
+
+Run with:
+python3 session_server.py
+
+The server is configured with environment variables:
+KENNEL_SESSION_SOCKET - the unix socket path (default /tmp/kennel-mate.sock)
+KENNEL_SESSION_POOL   - the number of idle workers to keep (default 4)
+'''
+import os
+import sys
+import pty
+import time
+import errno
+import fcntl
+import select
+import signal
+import socket
+import struct
+import termios
+
+import run
+
+SOCKET_PATH = os.environ.get('KENNEL_SESSION_SOCKET',
+                             '/tmp/kennel-mate.sock')
+POOL_SIZE = int(os.environ.get('KENNEL_SESSION_POOL', '4'))
+
+# The terminal size used by the xterm.js terminal on the landing page
+TERMINAL_ROWS = 24
+TERMINAL_COLS = 80
+
+
+def run_session():
+    '''
+    Runs the admin system on the pseudo-terminal set up by pty.fork(). This
+    runs in the session process and never returns.
+    '''
+    status = 0
+    try:
+        fcntl.ioctl(0, termios.TIOCSWINSZ,
+                    struct.pack('HHHH', TERMINAL_ROWS, TERMINAL_COLS, 0, 0))
+        os.environ['TERM'] = 'xterm-color'
+        # The standard streams were created before the pseudo-terminal
+        # replaced file descriptors 0-2, so they are opened again to pick up
+        # the terminal's line buffering.
+        sys.stdin = open(0, 'r', closefd=False)
+        sys.stdout = open(1, 'w', buffering=1, closefd=False)
+        sys.stderr = open(2, 'w', buffering=1, closefd=False)
+        run.start()
+    except (EOFError, KeyboardInterrupt, SystemExit):
+        pass
+    except Exception as e:
+        print(f"Session ended unexpectedly: {e}", file=sys.stderr)
+        status = 1
+    finally:
+        # os._exit() skips the atexit handlers
+        try:
+            run.save_metrics()
+        finally:
+            os._exit(status)
+
+
+def relay(connection, master_fd, session_pid):
+    '''
+    Copies bytes between the client connection and the session's
+    pseudo-terminal until either side closes.
+
+    Args:
+    connection (socket.socket): The client connection.
+    master_fd (int): The master side of the session's pseudo-terminal.
+    session_pid (int): The process id of the session.
+    '''
+    try:
+        while True:
+            readable, _, _ = select.select([connection, master_fd], [], [])
+            if connection in readable:
+                data = connection.recv(4096)
+                if not data:
+                    break
+                os.write(master_fd, data)
+            if master_fd in readable:
+                try:
+                    data = os.read(master_fd, 4096)
+                except OSError as e:
+                    # EIO means the session has exited
+                    if e.errno != errno.EIO:
+                        raise
+                    data = b''
+                if not data:
+                    break
+                connection.sendall(data)
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    finally:
+        try:
+            os.kill(session_pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        os.waitpid(session_pid, 0)
+        connection.close()
+        os.close(master_fd)
+
+
+def worker(listener, taken_fd):
+    '''
+    Waits for one connection, tells the server it has been taken, and then
+    serves the session. This runs in a worker process and never returns.
+
+    Args:
+    listener (socket.socket): The listening unix socket.
+    taken_fd (int): Write end of the pipe used to tell the server that a
+    worker has been taken, so it can fork a replacement.
+    '''
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    status = 0
+    try:
+        connection, _ = listener.accept()
+        listener.close()
+        os.write(taken_fd, b'.')
+        os.close(taken_fd)
+        # Drop any network connections shared with the server process
+        store = run.get_store()
+        store.reset_connections()
+        # The worker may have waited a long time for this connection, so
+        # the session checks for other sessions' changes on its first read
+        store.expire()
+        session_pid, master_fd = pty.fork()
+        if session_pid == 0:
+            connection.close()
+            run_session()
+        relay(connection, master_fd, session_pid)
+    except Exception as e:
+        print(f"Session worker failed: {e}", file=sys.stderr)
+        status = 1
+    finally:
+        os._exit(status)
+
+
+def spawn_worker(listener, taken_fd):
+    '''
+    Forks a new idle worker process.
+
+    Args:
+    listener (socket.socket): The listening unix socket.
+    taken_fd (int): Write end of the worker-taken pipe.
+
+    Returns:
+    int: The process id of the worker.
+    '''
+    store = run.get_store()
+    store.ensure_fresh()
+    # The server never uses its network connections while workers are
+    # running, so none are inherited by, and shared between, workers.
+    store.reset_connections()
+    pid = os.fork()
+    if pid == 0:
+        worker(listener, taken_fd)
+    return pid
+
+
+def reap(workers):
+    '''
+    Collects the exit status of finished workers.
+
+    Args:
+    workers (set): The process ids of live workers, updated in place.
+    '''
+    while workers:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            workers.clear()
+            return
+        if pid == 0:
+            return
+        workers.discard(pid)
+
+
+def serve(socket_path=SOCKET_PATH, pool_size=POOL_SIZE):
+    '''
+    Warms up the admin system and serves sessions until terminated.
+
+    Args:
+    socket_path (str): The unix socket to listen on.
+    pool_size (int): The number of idle workers to keep waiting.
+    '''
+    started = time.perf_counter()
+    run.get_store()
+    print(f"Kennel-Mate session server warmed up in "
+          f"{(time.perf_counter() - started) * 1000:.0f}ms", flush=True)
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(pool_size * 4)
+
+    taken_read, taken_write = os.pipe()
+    workers = set()
+
+    def stop(signum, frame):
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        listener.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(pool_size):
+        workers.add(spawn_worker(listener, taken_write))
+    print(f"Listening on {socket_path} with {pool_size} idle workers",
+          flush=True)
+
+    while True:
+        readable, _, _ = select.select([taken_read], [], [], 5)
+        if readable:
+            for _ in os.read(taken_read, 64):
+                workers.add(spawn_worker(listener, taken_write))
+        reap(workers)
+
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,331 @@
+'''
+Rate limiting and retries for Google Sheets requests.
+
+Every request the app makes to the Sheets and Drive APIs goes through a
+SheetsGovernor, which:
+
+* waits for a token from a token bucket refilled at the Sheets quota rate,
+  so a busy session slows down instead of being refused with a 429,
+* retries requests refused with a 429 or failed with a 5xx or a dropped
+  connection, after an exponential backoff with random jitter, honouring
+  any Retry-After header,
+* coalesces identical reads made at the same time, such as the background
+  connection and the first menu both loading the bookings, into one request,
+* counts requests, retries, failed attempts, requests given up on,
+  coalesced reads and time spent waiting, so report() can show how close
+  the app runs to its quota.
+
+Requests that are not safe to repeat, such as appending or deleting a row,
+are only retried when the API refused them with a 429, as a request that
+failed with a 5xx or a dropped connection may still have been applied.
+
+The governor is configured with environment variables:
+KENNEL_SHEETS_RATE  - requests allowed per minute (default 60, the Sheets
+                      per-user quota)
+KENNEL_SHEETS_BURST - requests that can be made at once before the rate
+                      applies (default 10)
+'''
+import os
+import time
+import random
+import threading
+from collections import deque
+
+try:
+    from google.auth.exceptions import TransportError
+except ImportError:
+    TransportError = OSError
+
+SHEETS_REQUESTS_PER_MINUTE = float(os.environ.get('KENNEL_SHEETS_RATE', '60'))
+SHEETS_BURST = int(os.environ.get('KENNEL_SHEETS_BURST', '10'))
+
+# HTTP statuses worth retrying: quota exceeded and server errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_RETRIES = 5
+BASE_DELAY = 1.0
+MAX_DELAY = 32.0
+
+# Errors raised when the network cannot be reached: requests' connection
+# errors and timeouts are OSErrors, and google-auth raises TransportError
+# when it cannot refresh the credentials
+NETWORK_ERRORS = (OSError, TransportError)
+
+# OSErrors about local files, such as a missing credentials file, which are
+# not network errors
+LOCAL_FILE_ERRORS = (FileNotFoundError, PermissionError, IsADirectoryError,
+                     NotADirectoryError)
+
+
+def error_status(error):
+    '''
+    Returns the HTTP status of a failed request, such as a gspread APIError.
+
+    Args:
+    error (Exception): The exception raised by the request.
+
+    Returns:
+    int: The status code, or None if the error has no HTTP response.
+    '''
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+def is_transient(error):
+    '''
+    Returns True if a failed request may succeed if it is made again later:
+    it was refused with a 429, failed with a server error, or the network
+    could not be reached. Other errors, such as a 400 for a bad request or a
+    403 for missing permission, will fail again however often they are
+    retried.
+
+    Args:
+    error (Exception): The exception raised by the request.
+
+    Returns:
+    bool: True if the error is transient.
+    '''
+    status = error_status(error)
+    if status is not None:
+        return status in RETRY_STATUSES
+    return isinstance(error, NETWORK_ERRORS) and \
+        not isinstance(error, LOCAL_FILE_ERRORS)
+
+
+def retry_after(error):
+    '''
+    Returns the number of seconds a refused request asked us to wait, from
+    its Retry-After header.
+
+    Returns:
+    float: The number of seconds, or None if there is no usable header.
+    '''
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    try:
+        return float(headers.get('Retry-After'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    '''
+    Allows requests at a steady rate, with short bursts.
+
+    Args:
+    rate (float): Tokens added per second.
+    capacity (int): The most tokens the bucket holds, the largest burst.
+    clock (callable): Returns the current time in seconds.
+    sleep (callable): Waits for a number of seconds.
+    '''
+
+    def __init__(self, rate, capacity, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        Takes a token, waiting for one to be added if the bucket is empty.
+
+        Returns:
+        float: The number of seconds spent waiting.
+        '''
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens +
+                                   (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+            waited += wait
+
+
+class _InFlight:
+    '''
+    A read that other callers can wait on instead of repeating it.
+    '''
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SheetsGovernor:
+    '''
+    Rate limits, retries and coalesces Sheets requests.
+
+    Args:
+    requests_per_minute (float): The request quota.
+    burst (int): How many requests can be made at once.
+    max_retries (int): How many times a failed request is retried.
+    base_delay (float): The backoff before the first retry, in seconds,
+    doubled for every later retry.
+    max_delay (float): The longest backoff, in seconds.
+    sleep (callable): Waits for a number of seconds.
+    clock (callable): Returns the current time in seconds.
+    '''
+
+    def __init__(self, requests_per_minute=SHEETS_REQUESTS_PER_MINUTE,
+                 burst=SHEETS_BURST, max_retries=MAX_RETRIES,
+                 base_delay=BASE_DELAY, max_delay=MAX_DELAY,
+                 sleep=time.sleep, clock=time.monotonic):
+        self.requests_per_minute = requests_per_minute
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._sleep = sleep
+        self._clock = clock
+        self._bucket = TokenBucket(requests_per_minute / 60.0, burst,
+                                   clock=clock, sleep=sleep)
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        # start times of the requests made in the last minute
+        self._recent = deque()
+        self.counters = {
+            'requests': 0,
+            'retries': 0,
+            'failures': 0,
+            'gave_up': 0,
+            'coalesced': 0,
+            'throttled_seconds': 0.0,
+            'backoff_seconds': 0.0,
+            'peak_per_minute': 0,
+            'statuses': {},
+        }
+
+    def call(self, func, *args, key=None, idempotent=True, retries=None,
+             **kwargs):
+        '''
+        Makes a request through the governor.
+
+        Args:
+        func (callable): The gspread method making the request.
+        *args: Positional arguments for func.
+        key (hashable): Identifies a read, so identical reads made at the
+        same time share one request. None means the request is never
+        coalesced.
+        idempotent (bool): False for requests that must not be repeated if
+        they may have been applied, such as appending or deleting rows.
+        retries (int): How many times to retry the request, instead of the
+        governor's max_retries, such as to fail quickly while offline.
+        **kwargs: Keyword arguments for func.
+
+        Returns:
+        Whatever func returns.
+
+        Raises:
+        The last error raised by func, if it still fails after every retry,
+        or straight away if it is not worth retrying.
+        '''
+        if retries is None:
+            retries = self.max_retries
+        if key is None:
+            return self._call_with_retries(func, args, kwargs, idempotent,
+                                           retries)
+
+        with self._lock:
+            in_flight = self._in_flight.get(key)
+            leader = in_flight is None
+            if leader:
+                in_flight = self._in_flight[key] = _InFlight()
+            else:
+                self.counters['coalesced'] += 1
+
+        if not leader:
+            in_flight.done.wait()
+            if in_flight.error is not None:
+                raise in_flight.error
+            return in_flight.result
+
+        try:
+            in_flight.result = self._call_with_retries(func, args, kwargs,
+                                                       idempotent, retries)
+            return in_flight.result
+        except Exception as e:
+            in_flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            in_flight.done.set()
+
+    def report(self):
+        '''
+        Returns the governor's counters, with the number of requests made in
+        the last minute against the quota.
+
+        Returns:
+        dict: The counters.
+        '''
+        with self._lock:
+            self._forget_old_requests(self._clock())
+            report = dict(self.counters)
+            report['statuses'] = dict(self.counters['statuses'])
+            report['last_minute'] = len(self._recent)
+        report['quota_per_minute'] = self.requests_per_minute
+        return report
+
+    def _call_with_retries(self, func, args, kwargs, idempotent, retries):
+        attempt = 0
+        while True:
+            self._record_request(self._bucket.acquire())
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                status = error_status(e)
+                self._record_failure(status)
+                if attempt >= retries or \
+                        not self._should_retry(e, status, idempotent):
+                    with self._lock:
+                        self.counters['gave_up'] += 1
+                    raise
+                delay = retry_after(e) if status == 429 else None
+                if delay is None:
+                    delay = random.uniform(
+                        0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                with self._lock:
+                    self.counters['retries'] += 1
+                    self.counters['backoff_seconds'] += delay
+                self._sleep(delay)
+                attempt += 1
+
+    @staticmethod
+    def _should_retry(error, status, idempotent):
+        if status == 429:
+            # Refused requests were never applied, so are always safe to
+            # make again
+            return True
+        if not idempotent:
+            return False
+        return is_transient(error)
+
+    def _record_request(self, throttled):
+        now = self._clock()
+        with self._lock:
+            self.counters['requests'] += 1
+            self.counters['throttled_seconds'] += throttled
+            self._recent.append(now)
+            self._forget_old_requests(now)
+            self.counters['peak_per_minute'] = max(
+                self.counters['peak_per_minute'], len(self._recent))
+
+    def _record_failure(self, status):
+        with self._lock:
+            self.counters['failures'] += 1
+            statuses = self.counters['statuses']
+            label = str(status) if status is not None else 'network'
+            statuses[label] = statuses.get(label, 0) + 1
+
+    def _forget_old_requests(self, now):
+        while self._recent and now - self._recent[0] > 60:
+            self._recent.popleft()
@@ -0,0 +1,12 @@
+'''
+Keeps the files the tests lock out of the working directory.
+'''
+import pytest
+
+
+@pytest.fixture(autouse=True, scope='session')
+def row_lock_file(tmp_path_factory):
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv('KENNEL_ROW_LOCK_FILE',
+                     str(tmp_path_factory.mktemp('locks') / 'rows.lock'))
+        yield
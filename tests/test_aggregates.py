@@ -0,0 +1,34 @@
+'''
+Tests for the running booking counts and revenue totals.
+'''
+import datetime
+
+from aggregates import BookingAggregates
+from booking import Booking
+
+
+def booking(number, day, dogs_name, family_name, pence):
+    return Booking(number, datetime.date(2030, 5, day), dogs_name,
+                   family_name, pence)
+
+
+def test_month_and_family_totals_follow_changes():
+    aggregates = BookingAggregates()
+    bookings = [booking(1001, 1, 'Rex', 'Smith', 1250),
+                booking(1002, 31, 'Belle', 'smith', 2000),
+                booking(1003, 2, 'Smith', 'Jones', 500)]
+    for added in bookings:
+        aggregates.add(added)
+    assert aggregates.for_month(2030, 5) == (3, 3750)
+    assert aggregates.for_family('SMITH') == (2, 3250)
+    # A dog named Smith counts for the name but not the family
+    assert aggregates.for_name('smith') == (3, 3750)
+
+    aggregates.remove(bookings[1])
+    bookings[1].date = datetime.date(2030, 6, 1)
+    aggregates.add(bookings[1])
+    aggregates.remove(bookings[0])
+    assert aggregates.for_month(2030, 5) == (1, 500)
+    assert aggregates.for_month(2030, 6) == (1, 2000)
+    assert aggregates.for_family('Smith') == (1, 2000)
+    assert aggregates.total() == (2, 2500)
@@ -0,0 +1,61 @@
+'''
+Tests for the storage backends' paging over soft-deleted bookings.
+'''
+import pytest
+
+from backends import SheetsBackend, SQLiteBackend
+from booking_store import HEADERS
+from fake_worksheet import FakeWorksheet
+from sheets_governor import SheetsGovernor
+
+ROWS = [[f'B{number}', '01-05-2030', f'Dog{number}', 'Smith', '12.50', '1',
+         '1'] for number in range(1001, 1032)]
+DELETED = ['B1002', 'B1005', 'B1010', 'B1016', 'B1020']
+
+
+@pytest.fixture(params=['sheets', 'sqlite'])
+def backend(request, tmp_path):
+    if request.param == 'sheets':
+        governor = SheetsGovernor(requests_per_minute=6e9, burst=10 ** 9)
+        backend = SheetsBackend(FakeWorksheet([HEADERS] + ROWS), governor)
+    else:
+        backend = SQLiteBackend(str(tmp_path / 'kennel_mate.db'))
+        backend.replace_all(HEADERS, ROWS)
+    backend.load()
+    for booking_no in DELETED:
+        assert backend.delete(booking_no)
+    return backend
+
+
+def test_count_leaves_out_deleted_bookings(backend):
+    assert backend.count() == len(ROWS) - len(DELETED)
+
+
+def test_pages_cover_every_live_booking_once(backend):
+    page_size = 15
+    pages = -(-backend.count() // page_size)
+    paged = [row[0] for page in range(pages)
+             for row in backend.load_page(page * page_size, page_size)]
+    assert paged == [row[0] for row in ROWS if row[0] not in DELETED]
+    assert paged[-1] == 'B1031'
+
+
+def test_page_past_the_end_is_empty(backend):
+    assert backend.load_page(backend.count(), 15) == []
+
+
+def test_sheets_pages_only_read_their_own_rows_while_unchanged():
+    worksheet = FakeWorksheet([HEADERS] + ROWS)
+    governor = SheetsGovernor(requests_per_minute=6e9, burst=10 ** 9)
+    backend = SheetsBackend(worksheet, governor)
+    assert backend.count() == len(ROWS)
+    scans = worksheet.requests['batch_get']
+    assert [row[0] for row in backend.load_page(15, 15)] == \
+        [row[0] for row in ROWS[15:30]]
+    assert backend.count() == len(ROWS)
+    assert worksheet.requests['batch_get'] == scans
+    # A delete by another session changes the version, so the rows are
+    # read again
+    SheetsBackend(worksheet, governor).delete('B1010')
+    assert backend.load_page(15, 1)[0][0] == 'B1017'
+    assert worksheet.requests['batch_get'] > scans
@@ -0,0 +1,19 @@
+'''
+Tests for booking number allocation.
+'''
+from booking_numbers import BookingNumberAllocator
+
+
+def test_numbers_follow_the_highest_in_use(tmp_path):
+    allocator = BookingNumberAllocator(lambda: 1010, str(tmp_path / 'seq'))
+    assert allocator.next_number() == 'B1011'
+    assert allocator.reserve(2) == ['B1012', 'B1013']
+
+
+def test_sequence_file_is_read_from_the_environment_when_made(
+        tmp_path, monkeypatch):
+    # Set after booking_numbers was imported, as a benchmark does
+    monkeypatch.setenv('KENNEL_SEQUENCE_FILE', str(tmp_path / 'seq'))
+    allocator = BookingNumberAllocator(lambda: 0)
+    assert allocator.next_number() == 'B1001'
+    assert (tmp_path / 'seq').read_text() == '1001'
@@ -0,0 +1,76 @@
+'''
+Tests for the booking store's cache and indexes.
+'''
+from backends import SheetsBackend, SQLiteBackend
+from booking_store import BookingStore, HEADERS
+from fake_worksheet import FakeWorksheet
+from sheets_governor import SheetsGovernor
+
+ROWS = [[f'B{number}', f'{number % 3 + 1:02d}-05-2030', f'Dog{number}',
+         'Smith', '12.50', '1', '1'] for number in range(1001, 1011)]
+
+
+def loaded_store(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'kennel_mate.db'))
+    backend.replace_all(HEADERS, ROWS)
+    store = BookingStore(backend)
+    store.ensure_fresh()
+    return store
+
+
+def test_deletes_keep_the_cache_in_worksheet_order(tmp_path):
+    store = loaded_store(tmp_path)
+    for number in (1004, 1001, 1010, 1006):
+        assert store.delete(number)
+    remaining = [row[0] for row in ROWS
+                 if row[0] not in ('B1001', 'B1004', 'B1006', 'B1010')]
+    assert [booking.booking_no for booking in store.bookings()] == remaining
+    for booking_no in remaining:
+        assert store.find(booking_no).booking_no == booking_no
+    assert store.find(1004) is None
+    assert [booking.booking_no for booking in store.by_name('smith')] \
+        == remaining
+    # A booking can still be changed and deleted after those around it go
+    assert store.update_fields(1007, {'dogs_name': 'Rex'})
+    assert store.find(1007).dogs_name == 'Rex'
+    assert store.delete(1007)
+    assert store.find(1008).booking_no == 'B1008'
+
+
+def test_appended_bookings_follow_the_deleted_ones(tmp_path):
+    store = loaded_store(tmp_path)
+    booking = store.find(1002)
+    assert store.delete(1002)
+    booking.number = 1011
+    store.append(booking)
+    assert store.bookings()[-1].booking_no == 'B1011'
+    assert store.delete(1011)
+    assert store.count() == len(ROWS) - 1
+
+
+def test_other_sessions_changes_are_seen_after_the_ttl():
+    worksheet = FakeWorksheet([HEADERS] + ROWS)
+    governor = SheetsGovernor(requests_per_minute=6e9, burst=10 ** 9)
+    first, second = (BookingStore(SheetsBackend(worksheet, governor), ttl=0)
+                     for _ in range(2))
+    first.ensure_fresh()
+    second.ensure_fresh()
+    loads = worksheet.requests['get_all_values']
+    # Nothing has changed, so the version check keeps the cache
+    assert first.find(1001).dogs_name == 'Dog1001'
+    assert worksheet.requests['get_all_values'] == loads
+    assert second.update_fields(1001, {'dogs_name': 'Rex'})
+    assert first.find(1001).dogs_name == 'Rex'
+
+
+def test_expired_cache_picks_up_changes_within_the_ttl():
+    worksheet = FakeWorksheet([HEADERS] + ROWS)
+    governor = SheetsGovernor(requests_per_minute=6e9, burst=10 ** 9)
+    # Like a session forked from the server's cache, the TTL has not ended
+    first, second = (BookingStore(SheetsBackend(worksheet, governor),
+                                  ttl=3600) for _ in range(2))
+    first.ensure_fresh()
+    assert second.update_fields(1002, {'dogs_name': 'Belle'})
+    assert first.find(1002).dogs_name == 'Dog1002'
+    first.expire()
+    assert first.find(1002).dogs_name == 'Belle'
@@ -0,0 +1,113 @@
+'''
+Tests for importing and exporting bookings as CSV files.
+'''
+import io
+
+import pytest
+
+from backends import SheetsBackend, SQLiteBackend
+from booking_numbers import BookingNumberAllocator
+from booking_store import BookingStore, HEADERS
+from bulk_bookings import IMPORT_ENCODING, import_bookings, export_bookings
+from fake_worksheet import FakeWorksheet
+from sheets_governor import SheetsGovernor
+from write_behind import WriteBehindBackend, WriteJournal
+
+ROWS = [[f'B{number}', f'{number - 1000:02d}-05-2030', f'Dog{number}',
+         'Smith', '12.50', '1', '1'] for number in range(1001, 1006)]
+
+CSV = '''Date,Dogs Name,Family Name,Amount Paid,Nights
+01-06-2030,rex,jones,20,2
+02-06-2030,belle,jones,15.50
+31-02-2030,max,jones,10
+03-06-2030,,jones,10
+04-06-2030,bob,jones,10.555
+05-06-2030,ted,jones,12
+06-06-2030,fido,jones,8
+'''
+
+
+def sqlite_store(tmp_path, rows=()):
+    backend = SQLiteBackend(str(tmp_path / 'kennel_mate.db'))
+    backend.replace_all(HEADERS, list(rows))
+    return BookingStore(backend)
+
+
+def allocator_for(store, tmp_path):
+    return BookingNumberAllocator(store.max_booking_number,
+                                  str(tmp_path / 'seq'))
+
+
+def read_csv(tmp_path, text, encoding):
+    path = tmp_path / 'bookings.csv'
+    path.write_bytes(text.encode(encoding))
+    return open(path, newline='', encoding=IMPORT_ENCODING)
+
+
+def test_invalid_records_are_skipped_with_their_line_numbers(tmp_path):
+    store = sqlite_store(tmp_path)
+    with read_csv(tmp_path, CSV, 'utf-8') as csv_file:
+        imported, errors = import_bookings(
+            csv_file, store, allocator_for(store, tmp_path))
+    assert imported == 4
+    assert [line_num for line_num, error in errors] == [4, 5, 6]
+    assert "Dog's name cannot be empty" in errors[1][1]
+    assert [booking.display_row() for booking in store.bookings()] == [
+        ['B1001', '01-06-2030', 'Rex', 'Jones', '20.00', '2'],
+        ['B1002', '02-06-2030', 'Belle', 'Jones', '15.50', '1'],
+        ['B1003', '05-06-2030', 'Ted', 'Jones', '12.00', '1'],
+        ['B1004', '06-06-2030', 'Fido', 'Jones', '8.00', '1']]
+
+
+def test_header_saved_by_excel_with_a_byte_order_mark(tmp_path):
+    store = sqlite_store(tmp_path)
+    with read_csv(tmp_path, CSV, 'utf-8-sig') as csv_file:
+        imported, errors = import_bookings(
+            csv_file, store, allocator_for(store, tmp_path))
+    assert imported == 4
+
+
+def test_missing_columns_are_reported(tmp_path):
+    store = sqlite_store(tmp_path)
+    with pytest.raises(ValueError, match='Family Name, Amount Paid'):
+        import_bookings(io.StringIO('Date,Dogs Name\n01-06-2030,Rex\n'),
+                        store, allocator_for(store, tmp_path))
+
+
+def test_each_chunk_is_written_with_one_request(tmp_path):
+    worksheet = FakeWorksheet([HEADERS] + ROWS)
+    governor = SheetsGovernor(requests_per_minute=6e9, burst=10 ** 9)
+    journal = WriteJournal(str(tmp_path / 'journal'))
+    backend = WriteBehindBackend(SheetsBackend(worksheet, governor), journal)
+    store = BookingStore(backend)
+    with read_csv(tmp_path, CSV, 'utf-8') as csv_file:
+        imported, errors = import_bookings(
+            csv_file, store, allocator_for(store, tmp_path), chunk_size=2)
+    assert imported == 4
+    # Each chunk is written before the next is read, so none are combined
+    assert worksheet.requests['append_rows'] == 2
+    assert backend.pending_count() == 0
+    assert [row[0] for row in worksheet.rows[len(ROWS) + 1:]] == \
+        ['B1006', 'B1007', 'B1008', 'B1009']
+
+
+def test_export_writes_the_bookings_in_a_date_range(tmp_path):
+    store = sqlite_store(tmp_path, ROWS)
+    output = io.StringIO()
+    assert export_bookings(output, store, '02-05-2030', '04-05-2030') == 3
+    lines = output.getvalue().splitlines()
+    assert lines[0] == 'Booking No.,Date,Dogs Name,Family Name,Amount Paid,' \
+        'Nights'
+    assert [line.split(',')[0] for line in lines[1:]] == \
+        ['B1002', 'B1003', 'B1004']
+    output = io.StringIO()
+    assert export_bookings(output, store, date_from='04-05-2030') == 2
+    assert export_bookings(io.StringIO(), store) == len(ROWS)
+
+
+def test_export_rejects_a_range_ending_before_it_starts(tmp_path):
+    store = sqlite_store(tmp_path, ROWS)
+    output = io.StringIO()
+    with pytest.raises(ValueError, match='after the last'):
+        export_bookings(output, store, '04-05-2030', '02-05-2030')
+    assert output.getvalue() == ''
@@ -0,0 +1,127 @@
+'''
+Tests that two sessions sharing the bookings cannot overwrite each other's
+changes, on the worksheet and on SQLite.
+'''
+import time
+import multiprocessing
+
+import pytest
+
+from backends import RowLocks, SheetsBackend, SQLiteBackend
+from booking import ConflictError
+from booking_store import BookingStore, HEADERS
+from fake_worksheet import FakeWorksheet
+from sheets_governor import SheetsGovernor
+from write_behind import WriteBehindBackend, WriteJournal
+
+ROWS = [[f'B{number}', '01-05-2030', f'Dog{number}', 'Smith', '12.50', '1',
+         '1'] for number in range(1001, 1006)]
+
+
+@pytest.fixture(params=['sheets', 'sqlite'])
+def connect(request, tmp_path):
+    '''
+    Returns a function opening a new connection to the same bookings.
+    '''
+    if request.param == 'sheets':
+        worksheet = FakeWorksheet([HEADERS] + ROWS)
+        governor = SheetsGovernor(requests_per_minute=6e9, burst=10 ** 9)
+        return lambda: SheetsBackend(worksheet, governor)
+    path = str(tmp_path / 'kennel_mate.db')
+    SQLiteBackend(path).replace_all(HEADERS, ROWS)
+    return lambda: SQLiteBackend(path)
+
+
+@pytest.fixture
+def sessions(connect, tmp_path):
+    '''
+    Returns two loaded booking stores, each saving through its own journal.
+    '''
+    stores = []
+    for name in ('a', 'b'):
+        journal = WriteJournal(str(tmp_path / f'journal-{name}'))
+        store = BookingStore(WriteBehindBackend(connect(), journal,
+                                                write_wait=5))
+        store.ensure_fresh()
+        stores.append(store)
+    return stores
+
+
+def test_stale_update_is_refused(sessions):
+    first, second = sessions
+    assert first.update_fields(1001, {'dogs_name': 'First'})
+    with pytest.raises(ConflictError) as conflict:
+        second.update_fields(1001, {'dogs_name': 'Second'})
+    assert conflict.value.booking_nos == ['B1001']
+    assert conflict.value.deleted == []
+    # The second session reads the booking again and can then change it
+    assert second.find(1001).dogs_name == 'First'
+    assert second.update_fields(1001, {'dogs_name': 'Second'})
+    first.refresh()
+    assert first.find(1001).dogs_name == 'Second'
+
+
+def test_stale_delete_is_refused(sessions):
+    first, second = sessions
+    first.update_fields(1002, {'dogs_name': 'First'})
+    with pytest.raises(ConflictError):
+        second.delete(1002)
+    assert second.delete(1002)
+    first.refresh()
+    assert first.find(1002) is None
+
+
+def test_update_of_booking_deleted_elsewhere_is_refused(sessions):
+    first, second = sessions
+    assert first.delete(1003)
+    with pytest.raises(ConflictError) as conflict:
+        second.update_fields(1003, {'dogs_name': 'Second'})
+    assert conflict.value.deleted == ['B1003']
+    assert second.find(1003) is None
+    first.refresh()
+    assert first.find(1003) is None
+
+
+def test_delete_of_booking_deleted_elsewhere_is_reported(sessions):
+    first, second = sessions
+    assert first.delete(1004)
+    with pytest.raises(ConflictError) as conflict:
+        second.delete(1004)
+    assert conflict.value.deleted == ['B1004']
+
+
+def test_batch_writes_the_bookings_not_changed_elsewhere(sessions):
+    first, second = sessions
+    second.update_fields(1005, {'dogs_name': 'Second'})
+    first.queue_update(1001, {'dogs_name': 'Batch'})
+    first.queue_update(1005, {'dogs_name': 'Batch'})
+    with pytest.raises(ConflictError) as conflict:
+        first.flush()
+    assert conflict.value.booking_nos == ['B1005']
+    assert conflict.value.written == 1
+    assert first.find(1001).dogs_name == 'Batch'
+    assert first.find(1005).dogs_name == 'Second'
+
+
+def hold_booking(path, booking_no, held, seconds):
+    with RowLocks(path=path).holding([booking_no]):
+        held.set()
+        time.sleep(seconds)
+
+
+def test_booking_is_locked_against_other_processes(tmp_path):
+    path = str(tmp_path / 'rows.lock')
+    context = multiprocessing.get_context('fork')
+    held = context.Event()
+    other = context.Process(target=hold_booking,
+                            args=(path, 'B1001', held, 0.5))
+    other.start()
+    try:
+        assert held.wait(5)
+        locks = RowLocks(path=path)
+        started = time.monotonic()
+        with locks.holding(['B1001']):
+            waited = time.monotonic() - started
+        assert waited > 0.2
+    finally:
+        other.join(5)
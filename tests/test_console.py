@@ -0,0 +1,67 @@
+'''
+Tests for running the admin system's screens through a scripted console.
+'''
+import builtins
+
+import pytest
+
+import console
+import run
+from backends import SQLiteBackend
+from booking_store import HEADERS
+from console import ScriptedConsole, EndOfScript
+from offline import Snapshot
+from write_behind import WriteJournal
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    '''
+    Gives the current thread a booking cache over an empty SQLite database,
+    with the pauses turned off.
+    '''
+    path = str(tmp_path / 'kennel_mate.db')
+    SQLiteBackend(path).replace_all(HEADERS, [])
+    store = run.make_store(lambda: SQLiteBackend(path),
+                           WriteJournal(str(tmp_path / 'journal')),
+                           Snapshot(str(tmp_path / 'snapshot')))
+    monkeypatch.setattr(run, 'PACE', 'fast')
+    monkeypatch.setattr(run.booking_allocator, 'path',
+                        str(tmp_path / 'seq'))
+    run.use_store(store, this_thread=True)
+    yield path
+    run.use_store(None, this_thread=True)
+
+
+def test_menu_flow_is_answered_and_shown_by_the_scripted_console(
+        session, monkeypatch, capsys):
+    def terminal_input(prompt=''):
+        raise AssertionError(f'the terminal was asked: {prompt}')
+    monkeypatch.setattr(builtins, 'input', terminal_input)
+
+    scripted = ScriptedConsole([
+        '',                                             # Welcome screen
+        '1', '01-06-2031', '2', 'rex', 'smith', '40',   # Create a booking
+        '4', '2', '1001', '6',                          # View by number
+        '5',                                            # Exit
+    ])
+    with console.use_console(scripted), pytest.raises(EndOfScript):
+        run.start()
+
+    # Nothing reached the terminal; every line was typed and captured
+    assert capsys.readouterr().out == ''
+    assert scripted.typed == 12
+    transcript = scripted.transcript()
+    assert transcript.index('*** CREATE BOOKING ***') < \
+        transcript.index('Booking entered successfully') < \
+        transcript.index('*** VIEW BY BOOKING NUMBER ***')
+    assert 'B1001          01-06-2031  Rex          Smith' in transcript
+    assert 'Total Revenue: £40.00' in transcript
+    assert 'Ending program...' in transcript
+    assert len(scripted.response_times) == 12
+    assert console.current() is console.terminal
+
+    run.get_store().backend.wait(5)
+    header, rows = SQLiteBackend(session).load()
+    assert rows[0][:6] == ['B1001', '01-06-2031', 'Rex', 'Smith', '40.00',
+                           '2']
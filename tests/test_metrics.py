@@ -0,0 +1,55 @@
+'''
+Tests for timing and measuring the requests made of a storage backend.
+'''
+import pytest
+
+from backends import SQLiteBackend
+from booking import ConflictError
+from booking_store import HEADERS
+from metrics import Metrics, InstrumentedBackend
+
+ROWS = [[f'B{number}', '01-05-2030', 'Rex', 'Smith', '12.50', '1', '1']
+        for number in range(1001, 1004)]
+
+
+def instrumented(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'kennel_mate.db'))
+    backend.replace_all(HEADERS, ROWS)
+    metrics = Metrics()
+    return backend, InstrumentedBackend(backend, metrics), metrics
+
+
+def test_requests_are_timed_and_their_results_passed_through(tmp_path):
+    backend, wrapped, metrics = instrumented(tmp_path)
+    assert wrapped.load() == backend.load()
+    assert wrapped.load_page(1, 5) == backend.load_page(1, 5)
+    wrapped.append(['B1004', '02-05-2030', 'Belle', 'Jones', '20.00', '2',
+                    '2'])
+    assert wrapped.count() == 4
+    assert wrapped.path == backend.path
+
+    report = metrics.report()
+    assert set(report) == {'backend.load', 'backend.load_page',
+                           'backend.append', 'backend.count'}
+    load = report['backend.load']
+    assert (load['count'], load['errors'], load['rows']) == (1, 0, 3)
+    assert 0 < load['max_ms'] <= load['total_ms']
+    assert load['bytes'] == sum(len(cell) for row in ROWS for cell in row)
+    assert report['backend.load_page']['rows'] == 2
+    assert report['backend.append']['rows'] == 1
+
+
+def test_errors_are_counted_and_raised_unchanged(tmp_path):
+    backend, wrapped, metrics = instrumented(tmp_path)
+    assert wrapped.delete('B1001', expected={'B1001': ['1']})
+    with pytest.raises(ConflictError) as raised:
+        wrapped.delete('B1002', expected={'B1002': ['0']})
+    assert raised.value.booking_nos == ['B1002']
+    assert raised.value.deleted == []
+    with pytest.raises(ConflictError) as raised:
+        wrapped.delete('B1001', expected={'B1001': ['1']})
+    assert raised.value.deleted == ['B1001']
+
+    delete = metrics.report()['backend.delete']
+    assert (delete['count'], delete['errors']) == (3, 2)
+    assert delete['total_ms'] > 0
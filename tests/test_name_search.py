@@ -0,0 +1,80 @@
+'''
+Tests for the prefix and fuzzy name search, and the store's name indexes.
+'''
+from backends import SQLiteBackend
+from booking_store import BookingStore, HEADERS
+from name_search import NameIndex
+
+ROWS = [['B1001', '01-05-2030', 'Belle', 'Smith', '12.50', '1', '1'],
+        ['B1002', '02-05-2030', 'Bella', 'Jones', '12.50', '1', '1'],
+        ['B1003', '03-05-2030', 'Ben', 'Smithson', '12.50', '1', '1'],
+        ['B1004', '04-05-2030', 'Rex', 'Smith', '12.50', '1', '1'],
+        ['B1005', '05-05-2030', 'Smith', 'Brown', '12.50', '1', '1']]
+
+
+def loaded_store(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'kennel_mate.db'))
+    backend.replace_all(HEADERS, ROWS)
+    store = BookingStore(backend)
+    store.ensure_fresh()
+    return store
+
+
+def test_exact_match_then_prefixes_shortest_first_then_similar_names():
+    index = NameIndex()
+    for name in ('belle', 'bella', 'ben', 'bel', 'rex', 'bellamy'):
+        index.add(name)
+    assert index.search('bel') == ['bel', 'bella', 'belle', 'bellamy',
+                                   'ben']
+    assert index.search('be', limit=2) == ['bel', 'ben']
+    # A misspelling still finds the name it is closest to
+    assert index.search('bele')[:2] == ['belle', 'bel']
+    assert index.search('zzz') == []
+    assert index.search('  ') == []
+
+
+def test_removed_names_are_no_longer_found():
+    index = NameIndex()
+    index.add('belle')
+    index.add('belle')
+    index.add('bella')
+    assert len(index) == 2
+    index.remove('belle')
+    index.remove('belle')
+    assert 'belle' not in index
+    assert index.search('bel') == ['bella']
+
+
+def test_store_search_ignores_case_and_counts_bookings(tmp_path):
+    store = loaded_store(tmp_path)
+    assert store.search_names('BEL')[:2] == [('bella', 1), ('belle', 1)]
+    # A dog named Smith counts as well as the Smith family's two bookings
+    assert store.search_names('Smith')[:2] == [('smith', 3),
+                                               ('smithson', 1)]
+
+
+def test_family_name_finds_every_booking_for_the_family(tmp_path):
+    store = loaded_store(tmp_path)
+    assert [booking.booking_no for booking in store.by_name('SMITH')] == \
+        ['B1001', 'B1004', 'B1005']
+    assert [booking.booking_no for booking in store.by_name('smithson')] \
+        == ['B1003']
+    assert store.by_name('Smi') == []
+
+
+def test_name_index_follows_updates_and_deletes(tmp_path):
+    store = loaded_store(tmp_path)
+    assert store.update_fields(1001, {'dogs_name': 'Rosie'})
+    assert [name for name, count in store.search_names('bel')] == \
+        ['bella', 'ben']
+    assert [name for name, count in store.search_names('ros')] == ['rosie']
+    assert store.update_fields(1002, {'family_name': 'Smith'})
+    assert ('smith', 4) in store.search_names('smith')
+    assert ('jones', 1) not in store.search_names('jones')
+    assert store.delete(1002)
+    assert [name for name, count in store.search_names('bel')] == ['ben']
+    assert [booking.booking_no for booking in store.by_name('smith')] == \
+        ['B1001', 'B1004', 'B1005']
+    assert store.delete(1003)
+    assert all(name != 'smithson' for name, count in
+               store.search_names('smithson'))
@@ -0,0 +1,24 @@
+'''
+Tests for the per-night kennel occupancy counters.
+'''
+import datetime
+
+from booking import Booking
+from occupancy import Occupancy
+
+
+def date(day):
+    return datetime.date(2030, 5, day)
+
+
+def test_stays_count_on_every_night_in_the_range():
+    occupancy = Occupancy(capacity=2)
+    occupancy.add(Booking(1001, date(1), 'Rex', 'Smith', 1250, nights=3))
+    occupancy.add(Booking(1002, date(3), 'Belle', 'Jones', 2000, nights=2))
+    # The first stay began before the range and leaves on the 4th
+    assert occupancy.nights_between(date(2), date(10)) == [
+        (date(2), 1), (date(3), 2), (date(4), 1)]
+    assert not occupancy.available(date(3))
+    assert occupancy.next_free_date(date(3), nights=2) == date(4)
+    assert occupancy.nights_between(date(6), date(9)) == []
+    assert Occupancy().nights_between(date(1), date(9)) == []
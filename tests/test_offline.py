@@ -0,0 +1,51 @@
+'''
+Tests for working offline from the local snapshot.
+'''
+import pytest
+
+from booking_store import HEADERS
+from offline import ConnectingBackend, Snapshot
+from write_behind import WriteJournal
+
+ROWS = [['B1001', '01-05-2030', 'Rex', 'Smith', '12.50', '1', '1']]
+
+
+class APIError(Exception):
+    '''
+    A failed request, like a gspread APIError.
+    '''
+
+    def __init__(self, status):
+        super().__init__(f'HTTP {status}')
+        self.response = type('Response', (), {'status_code': status})()
+
+
+def connecting(tmp_path, error):
+    snapshot = Snapshot(str(tmp_path / 'snapshot'))
+    snapshot.save(list(HEADERS), ROWS)
+
+    def connect():
+        raise error
+    return ConnectingBackend(connect, snapshot,
+                             WriteJournal(str(tmp_path / 'journal')))
+
+
+@pytest.mark.parametrize('error', [
+    ConnectionError('no network'), TimeoutError('timed out'),
+    APIError(503), APIError(429)])
+def test_unreachable_backend_serves_the_snapshot(tmp_path, error):
+    backend = connecting(tmp_path, error)
+    assert backend.load() == (list(HEADERS), ROWS)
+    assert backend.offline
+
+
+@pytest.mark.parametrize('error', [
+    APIError(403), APIError(400), FileNotFoundError('creds.json'),
+    ValueError('bug')])
+def test_other_errors_are_raised(tmp_path, error):
+    backend = connecting(tmp_path, error)
+    with pytest.raises(type(error)):
+        backend.load()
+    assert not backend.offline
+    with pytest.raises(type(error)):
+        backend.count()
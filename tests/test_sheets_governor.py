@@ -0,0 +1,211 @@
+'''
+Tests for the Sheets request governor, against a local FakeWorksheet with
+a fake clock and sleep, so no time passes and no network is used.
+'''
+import threading
+
+import pytest
+
+from backends import SheetsBackend
+from booking_store import HEADERS
+from fake_worksheet import FakeWorksheet
+from sheets_governor import SheetsGovernor, TokenBucket
+
+
+class FakeClock:
+    '''
+    A clock that only moves when something sleeps.
+    '''
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class APIError(Exception):
+    '''
+    A failed request, like a gspread APIError.
+    '''
+
+    def __init__(self, status, headers=None):
+        super().__init__(f'HTTP {status}')
+        self.response = Response(status, headers)
+
+
+class FlakyWorksheet(FakeWorksheet):
+    '''
+    A FakeWorksheet whose requests first raise the given errors, in turn.
+    A failure can be raised after the request was applied, as a dropped
+    connection can.
+    '''
+
+    def __init__(self, rows=None, errors=(), applied=False):
+        super().__init__(rows)
+        self.errors = list(errors)
+        self.applied = applied
+
+    def _request(self, method):
+        super()._request(method)
+        if self.errors and not self.applied:
+            raise self.errors.pop(0)
+
+    def append_row(self, values, **kwargs):
+        super().append_row(values, **kwargs)
+        if self.errors and self.applied:
+            raise self.errors.pop(0)
+
+
+ROW = ['B1001', '01-05-2030', 'Rex', 'Smith', '12.50', '1', '1']
+
+
+def make_governor(clock, **kwargs):
+    kwargs.setdefault('requests_per_minute', 6000)
+    kwargs.setdefault('burst', 100)
+    return SheetsGovernor(sleep=clock.sleep, clock=clock, **kwargs)
+
+
+@pytest.mark.parametrize('error', [
+    APIError(429), APIError(500), APIError(503), ConnectionError('reset')])
+def test_reads_are_retried_after_transient_errors(error):
+    clock = FakeClock()
+    worksheet = FlakyWorksheet([HEADERS, ROW], [error, error])
+    governor = make_governor(clock)
+    header, rows = SheetsBackend(worksheet, governor).load()
+    assert rows == [ROW]
+    assert worksheet.requests['get_all_values'] == 3
+    assert governor.counters['retries'] == 2
+    assert len(clock.sleeps) == 2
+
+
+def test_retry_after_header_is_honoured():
+    clock = FakeClock()
+    worksheet = FlakyWorksheet(errors=[APIError(429, {'Retry-After': '7'})])
+    governor = make_governor(clock)
+    SheetsBackend(worksheet, governor).load()
+    assert clock.sleeps == [7.0]
+
+
+def test_backoff_grows_exponentially_up_to_max_delay():
+    clock = FakeClock()
+    worksheet = FlakyWorksheet(errors=[APIError(503)] * 5)
+    governor = make_governor(clock, base_delay=1.0, max_delay=4.0)
+    SheetsBackend(worksheet, governor).load()
+    for attempt, delay in enumerate(clock.sleeps):
+        assert 0 <= delay <= min(4.0, 2 ** attempt)
+
+
+def test_client_errors_are_not_retried():
+    clock = FakeClock()
+    worksheet = FlakyWorksheet(errors=[APIError(400)])
+    governor = make_governor(clock)
+    with pytest.raises(APIError):
+        SheetsBackend(worksheet, governor).load()
+    assert worksheet.requests['get_all_values'] == 1
+    assert governor.counters['gave_up'] == 1
+    assert clock.sleeps == []
+
+
+def test_gives_up_after_max_retries():
+    clock = FakeClock()
+    worksheet = FlakyWorksheet(errors=[APIError(503)] * 10)
+    governor = make_governor(clock, max_retries=3)
+    with pytest.raises(APIError):
+        SheetsBackend(worksheet, governor).load()
+    assert worksheet.requests['get_all_values'] == 4
+    assert governor.counters['gave_up'] == 1
+
+
+@pytest.mark.parametrize('error', [APIError(503), ConnectionError('reset')])
+def test_appends_are_not_repeated_after_errors_that_may_have_applied(error):
+    clock = FakeClock()
+    worksheet = FlakyWorksheet([HEADERS], [error], applied=True)
+    backend = SheetsBackend(worksheet, make_governor(clock))
+    backend.load()
+    with pytest.raises(type(error)):
+        backend.append(ROW)
+    assert worksheet.rows == [HEADERS, ROW]
+
+
+def test_appends_are_retried_after_a_429():
+    clock = FakeClock()
+    worksheet = FlakyWorksheet([HEADERS])
+    backend = SheetsBackend(worksheet, make_governor(clock))
+    backend.load()
+    worksheet.errors = [APIError(429)]
+    backend.append(ROW)
+    assert worksheet.rows == [HEADERS, ROW]
+    assert worksheet.requests['append_row'] == 2
+
+
+def test_identical_reads_at_the_same_time_share_one_request():
+    governor = make_governor(FakeClock())
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_read():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'rows'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(
+        governor.call(slow_read, key='get_all_values')))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(
+        governor.call(slow_read, key='get_all_values')))
+    follower.start()
+    while governor.counters['coalesced'] == 0:
+        follower.join(0.001)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert results == ['rows', 'rows']
+    assert len(calls) == 1
+
+
+def test_token_bucket_allows_a_burst_then_the_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, capacity=3, clock=clock,
+                         sleep=clock.sleep)
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert clock.now == pytest.approx(0.5)
+
+
+def test_token_bucket_refills_only_to_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1.0, capacity=2, clock=clock,
+                         sleep=clock.sleep)
+    bucket.acquire()
+    bucket.acquire()
+    clock.now += 60
+    assert [bucket.acquire() for _ in range(2)] == [0.0, 0.0]
+    assert bucket.acquire() == pytest.approx(1.0)
+
+
+def test_governor_is_throttled_to_the_quota():
+    clock = FakeClock()
+    governor = make_governor(clock, requests_per_minute=60, burst=2)
+    for _ in range(5):
+        governor.call(lambda: None)
+    assert clock.now == pytest.approx(3.0)
+    report = governor.report()
+    assert report['requests'] == 5
+    assert report['throttled_seconds'] == pytest.approx(3.0)
+    assert report['last_minute'] == 5
@@ -0,0 +1,76 @@
+'''
+Tests for bringing a session's cache up to date with the changes other
+sessions have made, on the worksheet and on SQLite.
+'''
+import pytest
+
+from backends import SheetsBackend, SQLiteBackend
+from booking import Booking, parse_date
+from booking_store import BookingStore, HEADERS
+from fake_worksheet import FakeWorksheet
+from sheets_governor import SheetsGovernor
+
+ROWS = [[f'B{number}', '01-05-2030', f'Dog{number}', 'Smith', '12.50', '1',
+         '1'] for number in range(1001, 1006)]
+
+
+@pytest.fixture(params=['sheets', 'sqlite'])
+def connect(request, tmp_path):
+    '''
+    Returns a function opening a new connection to the same bookings.
+    '''
+    if request.param == 'sheets':
+        worksheet = FakeWorksheet([HEADERS] + ROWS)
+        governor = SheetsGovernor(requests_per_minute=6e9, burst=10 ** 9)
+        return lambda: SheetsBackend(worksheet, governor)
+    path = str(tmp_path / 'kennel_mate.db')
+    SQLiteBackend(path).replace_all(HEADERS, ROWS)
+    return lambda: SQLiteBackend(path)
+
+
+@pytest.fixture
+def sessions(connect):
+    '''
+    Returns two loaded booking stores whose caches are checked on every
+    read. The first may not load every booking again, only sync.
+    '''
+    first, second = (BookingStore(connect(), ttl=0) for _ in range(2))
+    first.ensure_fresh()
+    second.ensure_fresh()
+
+    def load():
+        raise AssertionError('every booking was loaded again')
+    first.backend.load = load
+    return first, second
+
+
+def test_sync_pulls_updates_deletes_and_new_bookings(sessions):
+    first, second = sessions
+    assert second.update_fields(1001, {'dogs_name': 'Rex'})
+    assert second.delete(1002)
+    second.append(Booking(1006, parse_date('02-05-2030'), 'Belle', 'Jones',
+                          2000))
+    assert first.find(1001).dogs_name == 'Rex'
+    assert first.find(1002) is None
+    assert first.find(1006).family_name == 'Jones'
+    assert [booking.booking_no for booking in first.bookings()] == \
+        ['B1001', 'B1003', 'B1004', 'B1005', 'B1006']
+    assert first.aggregates().total() == (5, 4 * 1250 + 2000)
+
+
+def test_sync_cursor_follows_the_changes(sessions):
+    first, second = sessions
+    assert second.update_fields(1003, {'dogs_name': 'Max'})
+    first.ensure_fresh()
+    cursor = first._revision
+    assert cursor == second.find(1003).revision
+    # Only the booking changed since the cursor is pulled
+    rows, present, highest = first.backend.changes_since(cursor)
+    assert rows == [] and highest == cursor
+    assert second.delete(1004)
+    rows, present, highest = first.backend.changes_since(cursor)
+    assert [row[0] for row in rows] == ['B1004']
+    assert highest > cursor
+    first.ensure_fresh()
+    assert first._revision == highest
+    assert first.find(1004) is None
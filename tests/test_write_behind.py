@@ -0,0 +1,82 @@
+'''
+Tests for the write-behind journal and writer thread.
+'''
+import json
+
+from write_behind import WriteBehindBackend, WriteJournal
+from booking_store import HEADERS
+
+
+class APIError(Exception):
+    '''
+    A rejected request, like a gspread APIError.
+    '''
+
+    def __init__(self, status):
+        super().__init__(f'HTTP {status}')
+        self.response = type('Response', (), {'status_code': status})()
+
+
+class ListBackend:
+    '''
+    An in-memory storage backend that rejects rows for chosen bookings.
+    '''
+
+    def __init__(self, rejected=()):
+        self.rows = []
+        self.rejected = set(rejected)
+
+    def load(self):
+        return list(HEADERS), [list(row) for row in self.rows]
+
+    def version(self):
+        return len(self.rows)
+
+    def append(self, row):
+        self.append_many([row])
+
+    def append_many(self, rows):
+        if any(row[0] in self.rejected for row in rows):
+            raise APIError(400)
+        self.rows.extend(list(row) for row in rows)
+
+
+def row(number):
+    return [f'B{number}', '01-05-2030', 'Rex', 'Smith', '12.50', '1', '1']
+
+
+def test_rejected_change_is_set_aside_and_later_changes_are_written(
+        tmp_path):
+    journal = WriteJournal(str(tmp_path / 'journal'))
+    backend = ListBackend(rejected={'B1002'})
+    writer = WriteBehindBackend(backend, journal)
+    for number in (1001, 1002, 1003):
+        writer.append(row(number))
+    assert writer.wait(5)
+    assert [saved[0] for saved in backend.rows] == ['B1001', 'B1003']
+    assert journal.pending() == []
+    assert all(entry['args'][0][0] != 'B1002' for entry in journal.entries())
+    with open(journal.failed_path, encoding='utf-8') as failed:
+        set_aside = [json.loads(line) for line in failed]
+    assert [entry['args'][0][0] for entry in set_aside] == ['B1002']
+    assert 'HTTP 400' in set_aside[0]['error']
+    conflicts = writer.take_conflicts()
+    assert len(conflicts) == 1 and 'B1002' in conflicts[0]
+
+
+def test_transient_failure_is_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr('write_behind.RETRY_DELAY', 0.01)
+    journal = WriteJournal(str(tmp_path / 'journal'))
+    backend = ListBackend()
+    failures = [APIError(503)]
+
+    def append_many(rows):
+        if failures:
+            raise failures.pop()
+        backend.rows.extend(rows)
+    backend.append_many = append_many
+    writer = WriteBehindBackend(backend, journal)
+    writer.append(row(1001))
+    assert writer.wait(5)
+    assert [saved[0] for saved in backend.rows] == ['B1001']
+    assert writer.take_conflicts() == []
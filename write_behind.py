@@ -0,0 +1,883 @@
+'''
+Journalled saving of booking changes.
+
+Every booking created, updated or deleted is recorded in a local journal
+file, flushed to disk, before WriteBehindBackend writes it to the storage
+backend on a background thread, in the order the changes were made,
+combining runs of new bookings and runs of updates into single requests.
+A change that fails, such as while the network is down, stays in the journal
+and is retried, with a growing delay, until it succeeds, and changes still
+waiting when the app stops are written when it next starts. A change that
+fails in a way retrying cannot fix, such as one the backend rejects as
+invalid, is set aside in a file next to the journal (.failed after its
+name) and reported to the operator, so it does not hold up the changes
+after it.
+
+Changes that are written late are replayed with conflict detection on
+booking numbers: a new booking already in the backend with the same details
+was written by an earlier attempt and is skipped, and one whose number has
+meanwhile been used for a different booking, such as by another computer
+while this one was offline, is given a new number. Updates and deletes of
+bookings that have since been deleted elsewhere are reported as conflicts.
+
+Updates and deletes are checked against the revision of the booking they
+were made from, so one made from a booking that another session has since
+changed is not written over the other session's change. The operator is
+told, at once if they are waiting for the change to be saved, or otherwise
+at the Main Menu.
+
+By default each change waits for its write, so the operator knows it has
+been saved unless the backend cannot be reached. With write-behind on the
+operator gets the next prompt straight away instead.
+
+Write-behind is turned on with the KENNEL_WRITE_BEHIND environment variable,
+and the journal kept in the KENNEL_JOURNAL file (default
+.kennel_mate_journal).
+'''
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from booking import parse_booking_number, parse_revision, next_revision, \
+    ConflictError, REVISION_CELL
+from sheets_governor import is_transient
+
+try:
+    import fcntl
+except ImportError:
+    # fcntl is not available on Windows, where the journal is only protected
+    # from sessions within the same process.
+    fcntl = None
+
+# The journal, unless the KENNEL_JOURNAL environment variable names another
+# file when the journal is opened
+JOURNAL_FILE = '.kennel_mate_journal'
+
+# The most queued changes written to the backend at once
+BATCH_SIZE = 500
+
+# Seconds before the first retry of a failed write, doubling to MAX_DELAY
+RETRY_DELAY = 1.0
+MAX_DELAY = 60.0
+
+# Seconds load() waits for queued changes to be written before reading the
+# backend and applying the changes still waiting on top of it
+LOAD_WAIT = 5.0
+
+
+def process_running(pid):
+    '''
+    Returns True if a process with the given id is running.
+    '''
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def left_behind(entry):
+    '''
+    Returns True if a journal entry was made by a process that is no longer
+    running, so nothing else will write it to the backend.
+    '''
+    pid = int(entry['id'].split('-', 1)[0])
+    return pid == os.getpid() or not process_running(pid)
+
+
+def apply_entries(rows, entries):
+    '''
+    Applies journalled changes to a list of booking rows, such as rows loaded
+    from a backend that the changes have not reached yet. New bookings that
+    are already in the rows are not added again.
+
+    Args:
+    rows (list): Booking rows, updated in place.
+    entries (list): Journal entries, in the order the changes were made.
+
+    Returns:
+    list: The updated rows.
+    '''
+    present = {row[0] for row in rows if row}
+    for entry in entries:
+        op, args = entry['op'], entry['args']
+        if op in ('append', 'append_many'):
+            new_rows = [args[0]] if op == 'append' else args[0]
+            for row in new_rows:
+                if row[0] not in present:
+                    rows.append(list(row))
+                    present.add(row[0])
+        elif op == 'update_rows':
+            positions = {row[0]: i for i, row in enumerate(rows) if row}
+            for booking_no, row in args[0]:
+                if booking_no in positions:
+                    rows[positions[booking_no]] = list(row)
+        elif op == 'delete':
+            rows[:] = [row for row in rows if not row or row[0] != args[0]]
+            present.discard(args[0])
+    return rows
+
+
+def entry_expected(entry):
+    '''
+    Returns the revisions an update or delete journal entry was made from,
+    by booking number, or None if it does not check revisions, such as an
+    entry journalled by an older version of the app.
+    '''
+    args = entry['args']
+    return args[1] if len(args) > 1 else None
+
+
+def entry_booking_nos(entry):
+    '''
+    Returns the numbers of the bookings a journal entry changes.
+    '''
+    op, args = entry['op'], entry['args']
+    if op == 'delete':
+        return [args[0]]
+    if op == 'update_rows':
+        return [booking_no for booking_no, _ in args[0]]
+    rows = [args[0]] if op == 'append' else args[0]
+    return [row[0] for row in rows if row]
+
+
+def renumber_entry(entry, booking_no, new_booking_no):
+    '''
+    Changes a booking's number wherever it appears in a journal entry.
+
+    Args:
+    entry (dict): The journal entry, changed in place.
+    booking_no (str): The booking's number, such as "B1005".
+    new_booking_no (str): Its new number, such as "B1012".
+    '''
+    op, args = entry['op'], entry['args']
+    expected = entry_expected(entry)
+    if expected and booking_no in expected:
+        expected[new_booking_no] = expected.pop(booking_no)
+    if op == 'delete':
+        if args[0] == booking_no:
+            args[0] = new_booking_no
+        return
+    if op == 'update_rows':
+        for update in args[0]:
+            if update[0] == booking_no:
+                update[0] = new_booking_no
+        rows = [row for _, row in args[0]]
+    else:
+        rows = [args[0]] if op == 'append' else args[0]
+    for row in rows:
+        if row and row[0] == booking_no:
+            row[0] = new_booking_no
+
+
+def same_booking(row, other):
+    '''
+    Returns True if two booking rows hold the same details, ignoring their
+    revision stamps and empty cells at the end, which the worksheet does not
+    return.
+    '''
+    def cells(row):
+        values = [str(value) for value in row[:REVISION_CELL]]
+        while values and values[-1] == '':
+            values.pop()
+        return values
+    return cells(row) == cells(other)
+
+
+def restamp(row):
+    '''
+    Gives a booking row that is being written late, such as after working
+    offline, a new revision stamp, so sessions syncing the changes since
+    their last sync do not miss it.
+    '''
+    row.extend([''] * (REVISION_CELL + 1 - len(row)))
+    row[REVISION_CELL] = str(next_revision())
+
+
+def highest_booking_number(rows):
+    '''
+    Returns the highest booking number in a list of booking rows, as an int,
+    or 0 if there are none.
+    '''
+    highest = 0
+    for row in rows:
+        try:
+            highest = max(highest, parse_booking_number(row[0]))
+        except (IndexError, ValueError):
+            pass
+    return highest
+
+
+class WriteJournal:
+    '''
+    An append-only JSON-lines file of booking changes. Every change is a line
+    with an id, the backend operation and its arguments. Once a change has
+    been written to the backend an acknowledgement line naming its id is
+    added. Acknowledged changes are kept until compact() is called with a
+    mark taken before a snapshot of the bookings was loaded, so they can
+    still be applied to an older snapshot when working offline.
+
+    Changes that can never be written are moved to a file of failed
+    changes, the journal's name followed by ".failed".
+
+    Args:
+    path (str): The journal file, defaults to KENNEL_JOURNAL.
+    '''
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get('KENNEL_JOURNAL', JOURNAL_FILE)
+        self.failed_path = f'{self.path}.failed'
+        self._lock = threading.Lock()
+        self._counter = 0
+
+    def record(self, op, args):
+        '''
+        Adds a change to the journal and flushes it to disk.
+
+        Args:
+        op (str): The backend operation, such as "append".
+        args (list): The operation's arguments.
+
+        Returns:
+        dict: The journal entry.
+        '''
+        with self._lock:
+            self._counter += 1
+            entry = {'id': f'{os.getpid()}-{time.time():.6f}-'
+                           f'{self._counter}',
+                     'op': op, 'args': args}
+            self._append([entry])
+        return entry
+
+    def acknowledge(self, ids):
+        '''
+        Records that changes have been written to the backend.
+
+        Args:
+        ids (list): The ids of the written entries.
+        '''
+        with self._lock:
+            self._append([{'ack': list(ids)}])
+
+    def set_aside(self, entries, error):
+        '''
+        Moves changes that can never be written to the backend to the file
+        of failed changes, with the error, so they are neither retried nor
+        applied to a snapshot.
+
+        Args:
+        entries (list): The journal entries.
+        error (Exception): The error the backend raised.
+        '''
+        failed = [{'id': entry['id'], 'op': entry['op'],
+                   'args': entry['args'],
+                   'error': f'{type(error).__name__}: {error}',
+                   'failed_at': time.strftime('%Y-%m-%d %H:%M:%S')}
+                  for entry in entries]
+        with self._lock:
+            with open(self.failed_path, 'ab') as failed_file:
+                self._write_lines(failed_file, failed)
+            self._append([{'failed': [entry['id'] for entry in entries]}])
+
+    def record_renumber(self, booking_no, new_booking_no):
+        '''
+        Records that a booking waiting to be written has been given a new
+        booking number. The number is changed in every change to the booking
+        already in the journal when it is next read.
+
+        Args:
+        booking_no (str): The booking's number, such as "B1005".
+        new_booking_no (str): Its new number, such as "B1012".
+        '''
+        with self._lock:
+            self._append([{'renumber': [booking_no, new_booking_no]}])
+
+    def pending(self):
+        '''
+        Returns the changes that have not been written to the backend yet.
+
+        Returns:
+        list: The journal entries, in the order the changes were made.
+        '''
+        return self.entries(acknowledged=False)
+
+    def entries(self, acknowledged=True):
+        '''
+        Returns the changes in the journal.
+
+        Args:
+        acknowledged (bool): True to include the changes that have already
+        been written to the backend.
+
+        Returns:
+        list: The journal entries, in the order the changes were made.
+        '''
+        with self._lock, self._locked() as journal:
+            entries, acknowledged_at = self._parse(self._read(journal))
+        if acknowledged:
+            return entries
+        return [entry for entry in entries
+                if entry['id'] not in acknowledged_at]
+
+    def mark(self):
+        '''
+        Marks the end of the journal, such as before loading a snapshot of
+        the bookings, for a later call to compact().
+
+        Returns:
+        tuple: The mark.
+        '''
+        with self._lock, self._locked() as journal:
+            return os.fstat(journal.fileno()).st_ino, \
+                journal.seek(0, os.SEEK_END)
+
+    def compact(self, mark):
+        '''
+        Drops the changes acknowledged before a mark, which are already part
+        of any snapshot loaded after it. The journal is rewritten to a
+        temporary file that then replaces it, so a crash never loses a
+        change.
+
+        Args:
+        mark (tuple): The mark returned by mark().
+        '''
+        inode, size = mark
+        with self._lock, self._locked() as journal:
+            if os.fstat(journal.fileno()).st_ino != inode:
+                # Another session has compacted the journal since the mark
+                return
+            entries, acknowledged_at = self._parse(self._read(journal))
+            kept = [entry for entry in entries
+                    if acknowledged_at.get(entry['id'], size + 1) > size]
+            if len(kept) == len(entries):
+                return
+            acknowledged = [entry['id'] for entry in kept
+                            if entry['id'] in acknowledged_at]
+            lines = kept + ([{'ack': acknowledged}] if acknowledged else [])
+            temporary = f'{self.path}.{os.getpid()}.tmp'
+            with open(temporary, 'wb') as compacted:
+                self._write_lines(compacted, lines)
+            os.replace(temporary, self.path)
+
+    def _append(self, lines):
+        with self._locked() as journal:
+            journal.seek(0, os.SEEK_END)
+            if journal.tell():
+                journal.seek(-1, os.SEEK_END)
+                if journal.read(1) != b'\n':
+                    # Finish a line cut short by a crash, so it does not run
+                    # into the next one
+                    journal.write(b'\n')
+            self._write_lines(journal, lines)
+
+    @contextmanager
+    def _locked(self):
+        '''
+        Opens and locks the journal file, reopening it if it is replaced by
+        compact() while waiting for the lock.
+        '''
+        while True:
+            journal = open(self.path, 'a+b')
+            self._lock_file(journal)
+            try:
+                current = os.fstat(journal.fileno()).st_ino == \
+                    os.stat(self.path).st_ino
+            except FileNotFoundError:
+                current = False
+            if current:
+                break
+            self._unlock_file(journal)
+            journal.close()
+        try:
+            yield journal
+        finally:
+            self._unlock_file(journal)
+            journal.close()
+
+    @staticmethod
+    def _read(journal):
+        journal.seek(0)
+        return journal.read()
+
+    @staticmethod
+    def _write_lines(journal, lines):
+        journal.write(b''.join(json.dumps(line).encode('utf-8') + b'\n'
+                               for line in lines))
+        journal.flush()
+        os.fsync(journal.fileno())
+
+    @staticmethod
+    def _parse(data):
+        '''
+        Reads the journal's changes, in order, with the offset of the end of
+        the acknowledgement line for each change that has been written.
+        '''
+        entries = []
+        acknowledged_at = {}
+        offset = 0
+        for line in data.splitlines(keepends=True):
+            offset += len(line)
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash while it was being written
+                continue
+            if 'ack' in record:
+                for entry_id in record['ack']:
+                    acknowledged_at[entry_id] = offset
+            elif 'failed' in record:
+                failed = set(record['failed'])
+                entries = [entry for entry in entries
+                           if entry['id'] not in failed]
+            elif 'renumber' in record:
+                old, new = record['renumber']
+                for entry in entries:
+                    if entry['id'] not in acknowledged_at:
+                        renumber_entry(entry, old, new)
+            else:
+                entries.append(record)
+        return entries, acknowledged_at
+
+    @staticmethod
+    def _lock_file(journal):
+        if fcntl is not None:
+            fcntl.flock(journal, fcntl.LOCK_EX)
+
+    @staticmethod
+    def _unlock_file(journal):
+        if fcntl is not None:
+            fcntl.flock(journal, fcntl.LOCK_UN)
+
+
+class WriteBehindBackend:
+    '''
+    Wraps a storage backend so that changes are journalled and written to it
+    by a background thread. Reads go straight to the wrapped backend.
+
+    Args:
+    backend: The storage backend to write to, such as a SheetsBackend.
+    journal (WriteJournal): The journal of changes waiting to be written.
+    Changes left in it by an earlier session that has stopped are queued
+    first. Changes made by sessions that are still running, such as other
+    session server workers sharing the journal, are left to them.
+    write_wait (float): The most seconds each change waits for its write
+    before returning, or None to return at once. A change does not wait
+    while writes are failing, so the backend cannot be reached.
+    on_conflict (callable): Called with the number of a new booking being
+    replayed, whose number has been used for a different booking in the
+    backend, and the highest booking number in the backend. Returns a new
+    booking number for it. If None, the booking is written unchanged.
+    '''
+
+    def __init__(self, backend, journal, write_wait=None, on_conflict=None):
+        self.backend = backend
+        self.journal = journal
+        self.write_wait = write_wait
+        self.on_conflict = on_conflict
+        self._queue = deque(entry for entry in journal.pending()
+                            if left_behind(entry))
+        for entry in self._queue:
+            entry['replay'] = True
+        self._changed = threading.Condition()
+        self._thread = None
+        self._last_version = None
+        # Queued changes still to be written one at a time, to find the one
+        # in a failed batch that can never be written
+        self._one_at_a_time = 0
+        self.written = 0
+        self.failed_attempts = 0
+        self.last_error = None
+        self.conflicts = []
+        if self._queue:
+            self._start()
+
+    @property
+    def offline(self):
+        '''
+        True if the wrapped backend is serving a local snapshot because the
+        storage backend cannot be reached.
+        '''
+        return getattr(self.backend, 'offline', False)
+
+    # READS
+
+    def load(self):
+        if self.last_error is None:
+            self.wait(LOAD_WAIT)
+        header, rows = self.backend.load()
+        # Changes that could not be written yet are applied on top
+        return header, apply_entries(rows, self._waiting())
+
+    def load_page(self, offset, limit):
+        if self.pending_count():
+            return self.load()[1][offset:offset + limit]
+        return self.backend.load_page(offset, limit)
+
+    def count(self):
+        if self.pending_count():
+            return len(self.load()[1])
+        return self.backend.count()
+
+    def version(self):
+        # While our own changes are waiting, the local cache is newer than
+        # the backend, so the backend is reported as unchanged
+        if self.pending_count() and self._last_version is not None:
+            return self._last_version
+        self._last_version = self.backend.version()
+        return self._last_version
+
+    def changes_since(self, revision):
+        # While our own changes are waiting, the backend is missing them,
+        # so the cache must be loaded with them applied instead
+        if self.pending_count():
+            return None
+        return self.backend.changes_since(revision)
+
+    def reset_connections(self):
+        self.backend.reset_connections()
+        # A forked process leaves the changes it inherited to the process
+        # that made them
+        with self._changed:
+            self._queue = deque(entry for entry in self._queue
+                                if entry['id'].startswith(f'{os.getpid()}-'))
+
+    # WRITES
+
+    def append(self, row):
+        self._enqueue('append', [list(row)])
+
+    def append_many(self, rows):
+        self._enqueue('append_many', [[list(row) for row in rows]])
+
+    def update_rows(self, updates, expected=None):
+        updates = [[booking_no, list(row)] for booking_no, row in updates]
+        expected = {booking_no: list(revisions) for booking_no, revisions
+                    in (expected or {}).items()}
+        self._enqueue('update_rows', [updates, expected])
+        return len(updates)
+
+    def delete(self, booking_no, expected=None):
+        expected = {booking_no: list(revisions) for booking_no, revisions
+                    in (expected or {}).items()}
+        self._enqueue('delete', [booking_no, expected])
+        return True
+
+    # QUEUE
+
+    def pending_count(self):
+        '''
+        Returns the number of changes waiting to be written.
+        '''
+        with self._changed:
+            return len(self._queue)
+
+    def take_conflicts(self):
+        '''
+        Returns the conflicts found while replaying changes since the last
+        call, as messages for the operator.
+
+        Returns:
+        list: The conflict messages.
+        '''
+        with self._changed:
+            conflicts, self.conflicts = self.conflicts, []
+        return conflicts
+
+    def wait(self, timeout=None):
+        '''
+        Waits for every queued change to be written.
+
+        Args:
+        timeout (float): The most seconds to wait, or None to wait until
+        every change has been written.
+
+        Returns:
+        bool: True if every change has been written.
+        '''
+        with self._changed:
+            return self._changed.wait_for(lambda: not self._queue, timeout)
+
+    def _waiting(self):
+        with self._changed:
+            return list(self._queue)
+
+    def _enqueue(self, op, args):
+        '''
+        Journals a change and queues it to be written, waiting for the write
+        if write_wait is set.
+
+        Raises:
+        ConflictError: If the change was waited for, and not written because
+        another session had changed the booking.
+        '''
+        if self._last_version is None and not self.offline:
+            # Remember the version the cache was loaded at, before our own
+            # changes start to change it
+            try:
+                self._last_version = self.backend.version()
+            except Exception:
+                pass
+        entry = self.journal.record(op, args)
+        if self.offline:
+            # Made without seeing the latest bookings, so checked for
+            # conflicts when it is written
+            entry['replay'] = True
+        with self._changed:
+            failed_attempts = self.failed_attempts
+            self._queue.append(entry)
+            self._changed.notify_all()
+        self._start()
+        if self.write_wait is None or self.last_error is not None:
+            return
+        with self._changed:
+            self._changed.wait_for(
+                lambda: entry.get('written') or
+                self.failed_attempts > failed_attempts, self.write_wait)
+            conflict = entry.get('conflict')
+            if conflict is not None:
+                # The operator is told now, rather than at the Main Menu
+                for message in entry['conflict_messages']:
+                    if message in self.conflicts:
+                        self.conflicts.remove(message)
+        if conflict is not None:
+            raise conflict
+
+    def _start(self):
+        # The thread is started on demand, which also restarts it in a
+        # process forked from one where it was running
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        delay = RETRY_DELAY
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._queue)
+                batch = self._next_batch()
+            try:
+                self._write(batch)
+            except Exception as e:
+                if not is_transient(e):
+                    if len(batch) > 1:
+                        with self._changed:
+                            self._one_at_a_time = len(batch)
+                    else:
+                        self._set_aside(batch, e)
+                    continue
+                with self._changed:
+                    self.failed_attempts += 1
+                    self.last_error = e
+                    for entry in batch:
+                        # A failed write may still have been applied
+                        entry['replay'] = True
+                    self._changed.notify_all()
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_DELAY)
+                continue
+            delay = RETRY_DELAY
+            self.last_error = None
+            self.journal.acknowledge([entry['id'] for entry in batch])
+            self._finish(batch)
+            with self._changed:
+                self.written += len(batch)
+
+    def _finish(self, batch):
+        '''
+        Takes a batch that has been written, or set aside, off the queue and
+        wakes anyone waiting for it.
+        '''
+        with self._changed:
+            for entry in batch:
+                self._queue.popleft()
+                entry['written'] = True
+            self._one_at_a_time = max(0, self._one_at_a_time - len(batch))
+            if not self._queue:
+                self._last_version = None
+            self._changed.notify_all()
+
+    def _set_aside(self, batch, error):
+        '''
+        Sets aside changes the backend has rejected in a way retrying cannot
+        fix, and tells the operator.
+        '''
+        self.journal.set_aside(batch, error)
+        booking_nos = [booking_no for entry in batch
+                       for booking_no in entry_booking_nos(entry)]
+        self._conflict(f"The change to {', '.join(booking_nos)} could not "
+                       f'be saved ({type(error).__name__}: {error}), so it '
+                       f'was set aside in {self.journal.failed_path}')
+        self._finish(batch)
+
+    def _next_batch(self):
+        '''
+        Takes the longest run of queued changes, from the front of the queue,
+        that can be written in one request: new bookings, or updates.
+        '''
+        first = self._queue[0]
+        if first['op'] == 'delete' or self._one_at_a_time:
+            return [first]
+        kind = 'update_rows' if first['op'] == 'update_rows' else 'append'
+        batch = []
+        for entry in self._queue:
+            entry_kind = 'update_rows' if entry['op'] == 'update_rows' else \
+                'append' if entry['op'] in ('append', 'append_many') else None
+            if entry_kind != kind or len(batch) == BATCH_SIZE:
+                break
+            batch.append(entry)
+        return batch
+
+    def _write(self, batch):
+        op = batch[0]['op']
+        replay = any(entry.get('replay') for entry in batch)
+        if op == 'delete':
+            booking_no = batch[0]['args'][0]
+            try:
+                deleted = self.backend.delete(booking_no,
+                                              entry_expected(batch[0]))
+            except ConflictError as e:
+                # A replayed delete may have been made by an earlier attempt
+                if not (replay and e.deleted == [booking_no]):
+                    self._changed_elsewhere(batch, e)
+                return
+            if not deleted and not replay:
+                self._conflict(f'{booking_no} could not be deleted, as it '
+                               'had already been deleted elsewhere')
+        elif op == 'update_rows':
+            # Only the latest change to each booking needs writing, checked
+            # against the revision the first of them was made from
+            latest = {}
+            expected = {}
+            for entry in batch:
+                revisions = entry_expected(entry) or {}
+                for booking_no, row in entry['args'][0]:
+                    if booking_no not in latest and booking_no in revisions:
+                        expected[booking_no] = list(revisions[booking_no])
+                    latest.pop(booking_no, None)
+                    latest[booking_no] = row
+            if replay:
+                for booking_no, row in latest.items():
+                    self._restamp(booking_no, row, expected)
+            try:
+                written = self.backend.update_rows(list(latest.items()),
+                                                   expected)
+            except ConflictError as e:
+                self._changed_elsewhere(batch, e)
+                written = e.written + len(e.booking_nos)
+            if written is not None and written < len(latest):
+                self._conflict(f'{len(latest) - written} update(s) could not '
+                               'be saved, as the bookings had been deleted '
+                               'elsewhere')
+        else:
+            rows = []
+            for entry in batch:
+                if entry['op'] == 'append':
+                    rows.append(entry['args'][0])
+                else:
+                    rows.extend(entry['args'][0])
+            if replay:
+                rows = self._replayed_rows(rows)
+                for row in rows:
+                    restamp(row)
+            if len(rows) == 1:
+                self.backend.append(rows[0])
+            elif rows:
+                self.backend.append_many(rows)
+
+    def _restamp(self, booking_no, row, expected):
+        '''
+        Restamps an updated booking row being written late. An earlier
+        attempt that seemed to fail may have written the row with its old
+        stamp, and later changes made from it, so that stamp is accepted as
+        well as the one each change was made from.
+        '''
+        stamped = parse_revision(row[REVISION_CELL]) \
+            if len(row) > REVISION_CELL else 0
+        restamp(row)
+        if booking_no in expected:
+            expected[booking_no].append(stamped)
+        revision = parse_revision(row[REVISION_CELL])
+        with self._changed:
+            for entry in self._queue:
+                revisions = (entry_expected(entry) or {}).get(booking_no)
+                if revisions is not None and stamped in revisions:
+                    revisions.append(revision)
+
+    def _changed_elsewhere(self, batch, error):
+        '''
+        Reports changes that were not written because another session had
+        changed or deleted the bookings first, marking their journal entries
+        so a session waiting for them can be told.
+        '''
+        deleted = [booking_no for booking_no in error.booking_nos
+                   if booking_no in error.deleted]
+        changed = [booking_no for booking_no in error.booking_nos
+                   if booking_no not in error.deleted]
+        messages = []
+        if changed:
+            messages.append(f"{', '.join(changed)} had been changed on "
+                            'another terminal, so the change to it was not '
+                            'saved')
+        if deleted:
+            messages.append(f"{', '.join(deleted)} had been deleted on "
+                            'another terminal, so the change to it was not '
+                            'saved')
+        conflicts = set(error.booking_nos)
+        with self._changed:
+            self.conflicts.extend(messages)
+            for entry in batch:
+                booking_nos = set(entry_booking_nos(entry))
+                if booking_nos & conflicts:
+                    entry['conflict'] = ConflictError(
+                        sorted(booking_nos & conflicts),
+                        len(booking_nos - conflicts),
+                        sorted(booking_nos & set(deleted)))
+                    entry['conflict_messages'] = messages
+
+    def _replayed_rows(self, rows):
+        '''
+        Checks new bookings being replayed against the bookings in the
+        backend, renumbering any whose number has been used for a different
+        booking.
+
+        Returns:
+        list: The rows still to be written.
+        '''
+        current = self.backend.load()[1]
+        if self.offline:
+            raise ConnectionError('The storage backend cannot be reached')
+        existing = {row[0]: row for row in current if row}
+        highest = highest_booking_number(current)
+        to_write = []
+        for row in rows:
+            written = existing.get(row[0])
+            if written is not None and same_booking(written, row):
+                # Written by an earlier attempt that seemed to fail
+                continue
+            if written is not None:
+                if self.on_conflict is None:
+                    self._conflict(f'{row[0]} has also been used for another '
+                                   'booking')
+                else:
+                    booking_no = row[0]
+                    new_booking_no = self.on_conflict(booking_no, highest)
+                    self.journal.record_renumber(booking_no, new_booking_no)
+                    with self._changed:
+                        for entry in self._queue:
+                            renumber_entry(entry, booking_no, new_booking_no)
+                    self._conflict(f'{booking_no} had been used for another '
+                                   f'booking, so was saved as '
+                                   f'{new_booking_no}')
+            existing[row[0]] = row
+            highest = max(highest, highest_booking_number([row]))
+            to_write.append(row)
+        return to_write
+
+    def _conflict(self, message):
+        with self._changed:
+            self.conflicts.append(message)